@@ -0,0 +1,90 @@
+# Compare merging overlapping exons with a fold over the sorted exons (the previous implementation of
+# merge_overlapping_exons) and with merge_overlapping_regions on synthetic genes with many exons.
+#
+# TTN has several thousand CDS records across its transcripts, and some lncRNA loci have more "exon" records.
+#
+# Requires Hail and Java. Run from the data-pipeline directory with:
+#   PYTHONPATH=src python benchmarks/merge_overlapping_exons.py --n-exons 1000,5000,20000
+
+import argparse
+import sys
+import time
+
+import hail as hl
+
+from data_pipeline.data_types.region import merge_overlapping_regions
+
+
+def merge_overlapping_exons_fold(regions):
+    return hl.if_else(
+        hl.len(regions) > 1,
+        hl.rbind(
+            hl.sorted(regions, lambda region: region.start),
+            lambda sorted_regions: sorted_regions[1:].fold(
+                lambda acc, region: hl.if_else(
+                    region.start <= acc[-1].stop + 1,
+                    acc[:-1].append(
+                        acc[-1].annotate(
+                            stop=hl.max(region.stop, acc[-1].stop), xstop=hl.max(region.xstop, acc[-1].xstop)
+                        )
+                    ),
+                    acc.append(region),
+                ),
+                [sorted_regions[0]],
+            ),
+        ),
+        regions,
+    )
+
+
+STRATEGIES = {"fold": merge_overlapping_exons_fold, "sweep": merge_overlapping_regions}
+
+
+def synthetic_genes(n_genes, n_exons):
+    genes = hl.utils.range_table(n_genes)
+    # Exons from many transcripts, spread over the gene so that some overlap other exons and most
+    # merged regions contain only a few exons. The more merged regions, the larger the array that the
+    # fold rebuilds for each exon.
+    return genes.annotate(
+        exons=hl.range(n_exons).map(
+            lambda _: hl.rbind(
+                hl.rand_int32(1, n_exons * 1000),
+                hl.rand_int32(50, 500),
+                lambda start, length: hl.struct(
+                    feature_type="CDS",
+                    start=start,
+                    stop=start + length,
+                    xstart=hl.int64(2_000_000_000 + start),
+                    xstop=hl.int64(2_000_000_000 + start + length),
+                ),
+            )
+        )
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-exons", default="1000,5000,20000")
+    parser.add_argument("--n-genes", type=int, default=20)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    args = parser.parse_args(argv)
+
+    hl.init(quiet=True)
+
+    for n_exons in [int(n) for n in args.n_exons.split(",")]:
+        genes = synthetic_genes(args.n_genes, n_exons).checkpoint(hl.utils.new_temp_file("genes", "ht"))
+
+        results = {}
+        for strategy in args.strategies.split(","):
+            start = time.perf_counter()
+            results[strategy] = genes.select(merged_exons=STRATEGIES[strategy](genes.exons)).collect()
+            elapsed = time.perf_counter() - start
+            print(f"{n_exons} exons, {strategy}: {elapsed:.2f}s ({elapsed / args.n_genes * 1000:.1f}ms per gene)")
+
+        # All strategies should produce the same merged exons.
+        expected = next(iter(results.values()))
+        assert all(result == expected for result in results.values())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
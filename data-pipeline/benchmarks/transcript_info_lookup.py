@@ -0,0 +1,110 @@
+# Compare ways of annotating transcript consequences with transcript and gene versions on a synthetic
+# variants table:
+#
+# - literal: collect the transcripts table to Python and embed it in the expression as a dict literal
+# - global: compute the dict in Hail and broadcast it as a global field (annotate_transcript_consequences)
+#
+# Requires Hail and Java. Run from the data-pipeline directory with:
+#   PYTHONPATH=src python benchmarks/transcript_info_lookup.py --n-variants 10000000 --n-transcripts 250000
+
+import argparse
+import sys
+import tempfile
+import time
+
+import hail as hl
+
+from data_pipeline.data_types.variant.transcript_consequence.annotate_transcript_consequences import (
+    transcript_info_by_id,
+)
+
+
+def synthetic_transcripts(n_transcripts, n_partitions):
+    transcripts = hl.utils.range_table(n_transcripts, n_partitions=n_partitions)
+    transcripts = transcripts.select(
+        transcript_id=hl.format("ENST%011d", transcripts.idx),
+        transcript_version=hl.str(transcripts.idx % 20 + 1),
+        gene=hl.struct(gene_version=hl.str(transcripts.idx % 10 + 1)),
+    )
+    return transcripts.key_by("transcript_id")
+
+
+def synthetic_variants(n_variants, n_transcripts, consequences_per_variant, n_partitions):
+    variants = hl.utils.range_table(n_variants, n_partitions=n_partitions)
+    return variants.select(
+        transcript_consequences=hl.range(consequences_per_variant).map(
+            lambda _: hl.struct(
+                # Some transcript IDs are not in the transcripts table.
+                transcript_id=hl.format("ENST%011d", hl.rand_int64(0, n_transcripts + n_transcripts // 10)),
+                consequence_terms=["missense_variant"],
+            )
+        )
+    )
+
+
+def annotate_with_literal(variants, transcripts):
+    transcript_info = hl.dict(
+        [
+            (row.transcript_id, row.transcript_info)
+            for row in transcripts.select(
+                transcript_info=hl.struct(
+                    transcript_version=transcripts.transcript_version,
+                    gene_version=transcripts.gene.gene_version,
+                )
+            ).collect()
+        ]
+    )
+    return variants.annotate(
+        transcript_consequences=variants.transcript_consequences.map(
+            lambda csq: csq.annotate(**transcript_info.get(csq.transcript_id))
+        )
+    )
+
+
+def annotate_with_global(variants, transcripts):
+    variants = variants.annotate_globals(transcript_info_by_id=transcript_info_by_id(transcripts))
+    variants = variants.annotate(
+        transcript_consequences=variants.transcript_consequences.map(
+            lambda csq: csq.annotate(**variants.transcript_info_by_id.get(csq.transcript_id))
+        )
+    )
+    return variants.drop("transcript_info_by_id")
+
+
+STRATEGIES = {"literal": annotate_with_literal, "global": annotate_with_global}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-variants", type=int, default=10_000_000)
+    parser.add_argument("--n-transcripts", type=int, default=250_000)
+    parser.add_argument("--consequences-per-variant", type=int, default=8)
+    parser.add_argument("--n-partitions", type=int, default=256)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    args = parser.parse_args(argv)
+
+    hl.init(quiet=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        transcripts_path = f"{tmp_dir}/transcripts.ht"
+        variants_path = f"{tmp_dir}/variants.ht"
+        synthetic_transcripts(args.n_transcripts, max(1, args.n_partitions // 16)).write(transcripts_path)
+        synthetic_variants(args.n_variants, args.n_transcripts, args.consequences_per_variant, args.n_partitions).write(
+            variants_path
+        )
+
+        for strategy in args.strategies.split(","):
+            start = time.perf_counter()
+            variants = STRATEGIES[strategy](hl.read_table(variants_path), hl.read_table(transcripts_path))
+            variants.write(f"{tmp_dir}/{strategy}.ht")
+            elapsed = time.perf_counter() - start
+            print(f"{strategy}: {elapsed:.1f}s ({args.n_variants / elapsed:,.0f} variants/s)")
+
+        # Both strategies should produce the same annotations.
+        tables = [hl.read_table(f"{tmp_dir}/{strategy}.ht") for strategy in args.strategies.split(",")]
+        for table in tables[1:]:
+            assert tables[0]._same(table)  # pylint: disable=protected-access
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
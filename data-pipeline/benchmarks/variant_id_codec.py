@@ -0,0 +1,59 @@
+# Measure throughput of encoding and decoding compressed variant IDs without Hail.
+#
+# Run from the data-pipeline directory with:
+#   PYTHONPATH=src python benchmarks/variant_id_codec.py --n-variants 1000000
+
+import argparse
+import random
+import sys
+import time
+
+from data_pipeline.data_types.variant import decode_compressed_variant_ids, encode_compressed_variant_ids
+
+
+def random_variants(n, seed=0):
+    rng = random.Random(seed)
+    contigs = [f"chr{contig}" for contig in [*range(1, 23), "X", "Y"]]
+    variants = ([], [], [], [])
+    for _ in range(n):
+        ref = rng.choice("ACGT")
+        # Roughly the mix of variant types in gnomAD.
+        variant_type = rng.random()
+        if variant_type < 0.85:
+            alt = rng.choice("ACGT")
+        elif variant_type < 0.93:
+            alt = ref + "".join(rng.choices("ACGT", k=rng.randint(1, 20)))
+        else:
+            alt, ref = ref, ref + "".join(rng.choices("ACGT", k=rng.randint(1, 20)))
+
+        for values, value in zip(variants, (rng.choice(contigs), rng.randint(1, 250_000_000), ref, alt)):
+            values.append(value)
+
+    return variants
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-variants", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    variants = random_variants(args.n_variants)
+
+    def best_time(fn):
+        times = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start_time)
+        return min(times), result
+
+    encode_time, ids = best_time(lambda: encode_compressed_variant_ids(*variants))
+    print(f"encode: {args.n_variants / encode_time:,.0f} variants/s ({encode_time:.2f}s)")
+
+    decode_time, _ = best_time(lambda: decode_compressed_variant_ids(ids))
+    print(f"decode: {args.n_variants / decode_time:,.0f} variants/s ({decode_time:.2f}s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
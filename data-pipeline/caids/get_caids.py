@@ -7,10 +7,15 @@ import gzip
 import json
 import logging
 import socket
+import sqlite3
+import tempfile
+import time
+import zlib
 from concurrent.futures import ThreadPoolExecutor
-from typing import Awaitable, Callable, TypeVar
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
 
 import aiohttp
+from hailtop.aiotools.fs import ReadableStream
 from hailtop.aiotools.router_fs import RouterAsyncFS
 from hailtop.utils import bounded_gather, sleep_before_try
 from hailtop.utils.rich_progress_bar import SimpleCopyToolProgressBar
@@ -101,12 +106,305 @@ async def retry_transient_errors(f: Callable[..., Awaitable[T]], max_attempts: i
         await sleep_before_try(tries)
 
 
+CLINGEN_ALLELE_REGISTRY_ANNOTATE_VCF_URL = "https://reg.clinicalgenome.org/annotateVcf"
+
+# Locus ("contig:pos") and alleles (JSON array), as written to output TSVs.
+VariantKey = Tuple[str, str]
+
+
+def vcf_line_variant_key(line: str) -> VariantKey:
+    [contig, pos, _, ref, alt, *_] = line.split("\t", 5)
+    return (f"{contig}:{pos}", json.dumps([ref, alt]))
+
+
+class CaidCache:
+    """
+    Local store of CAIDs fetched from ClinGen Allele Registry, keyed by assembly, locus, and alleles.
+
+    Variants that the registry did not return a CAID for are not stored, so that they are requested again.
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS caids (
+                assembly TEXT NOT NULL,
+                locus TEXT NOT NULL,
+                alleles TEXT NOT NULL,
+                caid TEXT NOT NULL,
+                PRIMARY KEY (assembly, locus, alleles)
+            ) WITHOUT ROWID
+            """
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get_many(self, assembly: ReferenceGenome, keys: Iterable[VariantKey]) -> Dict[VariantKey, str]:
+        caids = {}
+        for locus, alleles in keys:
+            row = self._connection.execute(
+                "SELECT caid FROM caids WHERE assembly = ? AND locus = ? AND alleles = ?",
+                (assembly.value, locus, alleles),
+            ).fetchone()
+            if row is not None:
+                caids[(locus, alleles)] = row[0]
+
+        return caids
+
+    def put_many(self, assembly: ReferenceGenome, caids: Dict[VariantKey, str]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO caids (assembly, locus, alleles, caid) VALUES (?, ?, ?, ?)",
+                [(assembly.value, locus, alleles, caid) for (locus, alleles), caid in caids.items() if caid != "."],
+            )
+
+
+# Read VCF parts and write output in chunks of this size.
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Look up cached CAIDs and store fetched CAIDs for batches of this many variants.
+VARIANT_BATCH_SIZE = 1000
+
+# Output for a part is buffered in memory up to this size, and in a temporary file beyond it, until the part is done.
+OUTPUT_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+
+async def read_lines(stream: ReadableStream, *, gzipped: bool = False) -> AsyncIterator[str]:
+    """Read lines from a stream, decompressing (possibly multi-member/block) gzipped data."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    remainder = b""
+    while True:
+        chunk = await stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        if decompressor:
+            data = []
+            while chunk:
+                data.append(decompressor.decompress(chunk))
+                chunk = b""
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk = b"".join(data)
+
+        *lines, remainder = (remainder + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+
+    if remainder:
+        yield remainder.decode("utf-8")
+
+
+async def batched_variant_runs(
+    lines: AsyncIterator[str], batch_size: int = VARIANT_BATCH_SIZE
+) -> AsyncIterator[List[Tuple[VariantKey, str, int]]]:
+    """
+    Group VCF data lines into batches of (variant key, line, count) tuples.
+
+    Parts are sorted by locus and alleles, so duplicate variants are consecutive and are collapsed into one tuple.
+    """
+    batch = []
+    run = None
+    async for line in lines:
+        if not line or line.startswith("#"):
+            continue
+
+        key = vcf_line_variant_key(line)
+        if run and run[0] == key:
+            run = (key, run[1], run[2] + 1)
+            continue
+
+        if run:
+            batch.append(run)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        run = (key, line, 1)
+
+    if run:
+        batch.append(run)
+    if batch:
+        yield batch
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit the number of concurrent requests, adjusting the limit based on how the server responds.
+
+    The limit increases by one for each limit's worth of successful requests, as long as latency (per unit
+    of work) stays within `latency_tolerance` times the lowest latency observed. It is multiplied by
+    `backoff` when a request fails with a transient error or times out, or when latency exceeds that.
+    Only one decrease is applied for requests that were in flight at the same time.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.5,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._min_latency: Optional[float] = None
+        self._last_decrease = float("-inf")
+
+    async def run(self, f: Callable[[], Awaitable[int]]) -> int:
+        """Run `f` when below the limit. `f` returns the amount of work done, used to normalize its latency."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+
+        started = time.monotonic()
+        try:
+            work = await f()
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) or is_transient_error(e):
+                self._decrease(started)
+            raise
+        else:
+            if work:
+                self._record_latency(started, (time.monotonic() - started) / work)
+            return work
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _record_latency(self, started: float, latency: float) -> None:
+        if self._min_latency is None or latency < self._min_latency:
+            self._min_latency = latency
+
+        if latency > self.latency_tolerance * self._min_latency:
+            self._decrease(started)
+        else:
+            self._set_limit(self.limit + 1 / self.limit)
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            return
+
+        self._last_decrease = time.monotonic()
+        self._set_limit(self.limit * self.backoff)
+
+    def _set_limit(self, limit: float) -> None:
+        previous_limit = int(self.limit)
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if int(self.limit) != previous_limit:
+            logger.info("Concurrency limit: %d", int(self.limit))
+
+
+async def fetch_part_caids(
+    session: aiohttp.ClientSession,
+    fs: RouterAsyncFS,
+    part_url: str,
+    *,
+    header: str,
+    assembly: ReferenceGenome,
+    registry_url: str,
+    cache: Optional[CaidCache],
+    output_file: BinaryIO,
+) -> int:
+    """
+    Write a row with locus, alleles, and CAID to `output_file` for each variant in a VCF part.
+
+    The part is streamed to ClinGen Allele Registry and the response is streamed back, so that memory use
+    does not depend on the size of the part. If a cache is provided, only variants not already in it are
+    requested. Returns the number of variants requested.
+    """
+    output_file.seek(0)
+    output_file.truncate()
+
+    # Duplicates of requested variants, to write when the CAID is received.
+    duplicate_counts: Dict[VariantKey, int] = {}
+    n_requested_variants = 0
+
+    def write_rows(key: VariantKey, caid: str, count: int = 1) -> None:
+        output_file.write(("\t".join([*key, caid]) + "\n").encode("utf-8") * count)
+
+    async def uncached_variant_chunks() -> AsyncIterator[bytes]:
+        nonlocal n_requested_variants
+        async with await fs.open(part_url) as part_stream:
+            async for batch in batched_variant_runs(read_lines(part_stream, gzipped=part_url.endswith(".gz"))):
+                cached_caids = cache.get_many(assembly, [key for key, _, _ in batch]) if cache else {}
+
+                request_lines = []
+                for key, line, count in batch:
+                    if key in cached_caids:
+                        write_rows(key, cached_caids[key], count)
+                    else:
+                        request_lines.append(line)
+                        if count > 1:
+                            duplicate_counts[key] = count - 1
+
+                if request_lines:
+                    n_requested_variants += len(request_lines)
+                    yield ("\n".join(request_lines) + "\n").encode("utf-8")
+
+    variant_chunks = uncached_variant_chunks()
+
+    # Skip the request if all variants in the part are cached.
+    try:
+        first_variant_chunk = await variant_chunks.__anext__()
+    except StopAsyncIteration:
+        return 0
+
+    async def request_body() -> AsyncIterator[bytes]:
+        yield (header + "\n").encode("utf-8")
+        yield first_variant_chunk
+        async for chunk in variant_chunks:
+            yield chunk
+
+    async with session.post(
+        registry_url,
+        params={"assembly": assembly.value, "ids": "CA"},
+        data=request_body(),
+    ) as response:
+        response.raise_for_status()
+
+        fetched_caids = {}
+        async for line_bytes in response.content:
+            line = line_bytes.decode("utf-8").rstrip("\r\n")
+            if not line or line.startswith("#"):
+                continue
+
+            key = vcf_line_variant_key(line)
+            caid = line.split("\t", 3)[2]
+            write_rows(key, caid, 1 + duplicate_counts.pop(key, 0))
+
+            fetched_caids[key] = caid
+            if cache and len(fetched_caids) >= VARIANT_BATCH_SIZE:
+                cache.put_many(assembly, fetched_caids)
+                fetched_caids = {}
+
+        if cache:
+            cache.put_many(assembly, fetched_caids)
+
+    return n_requested_variants
+
+
 async def get_caids(
     sharded_vcf_url: str,
     output_url: str,
     *,
     parallelism: int = 4,
+    max_parallelism: int = 16,
     request_timeout: int = 10,
+    cache_path: Optional[str] = None,
+    registry_url: str = CLINGEN_ALLELE_REGISTRY_ANNOTATE_VCF_URL,
 ) -> None:
     """
     Download ClinGen Canonical Allele IDs for variants in the specified VCF.
@@ -116,13 +414,35 @@ async def get_caids(
 
     :param sharded_vcf_url: URL to a VCF exported with `hl.export_vcf(table, path, parallel='separate_header')`.
     :param output_url: URL to a directory/prefix where output files will be written.
-    :param parallelism: Parallelism to use for processing parts.
+    :param parallelism: Initial number of concurrent requests to ClinGen Allele Registry. This is adjusted
+        based on request latency and transient errors.
+    :param max_parallelism: Maximum number of concurrent requests to ClinGen Allele Registry.
     :param request_timeout: Timeout (in minutes) for requests to ClinGen Allele Registry.
+    :param cache_path: Path to a local SQLite file used to store fetched CAIDs. If provided, only variants
+        not already in the cache are sent to ClinGen Allele Registry.
+    :param registry_url: URL for ClinGen Allele Registry's annotateVcf endpoint.
     """
     # Remove trailing slashes to avoid issues constructing URLs.
     sharded_vcf_url = sharded_vcf_url.rstrip("/")
     output_url = output_url.rstrip("/")
 
+    limiter = AdaptiveConcurrencyLimiter(parallelism, max_limit=max_parallelism)
+    cache = CaidCache(cache_path) if cache_path else None
+    try:
+        await _get_caids(sharded_vcf_url, output_url, limiter, request_timeout, cache, registry_url)
+    finally:
+        if cache:
+            cache.close()
+
+
+async def _get_caids(
+    sharded_vcf_url: str,
+    output_url: str,
+    limiter: AdaptiveConcurrencyLimiter,
+    request_timeout: int,
+    cache: Optional[CaidCache],
+    registry_url: str,
+) -> None:
     with ThreadPoolExecutor() as thread_pool:
         local_kwargs = {"thread_pool": thread_pool}
         async with (
@@ -174,63 +494,60 @@ async def get_caids(
 
                 def create_task(part_url):
                     async def task():
-                        # Read VCF partition and prepend header.
-                        part_stream = await fs.open(part_url)
-                        part_data = await part_stream.read()
-                        if part_url.endswith(".gz"):
-                            part_data = gzip.decompress(part_data)
-                        part_data = part_data.decode("utf-8")
-                        part_vcf = header + "\n" + part_data
-
-                        # Send request to ClinGen Allele Registry.
-                        try:
-                            response = await retry_transient_errors(
-                                lambda: session.post(
-                                    "https://reg.clinicalgenome.org/annotateVcf",
-                                    params={"assembly": assembly.value, "ids": "CA"},
-                                    data=part_vcf,
+                        with tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_SIZE) as output_file:
+                            try:
+                                await retry_transient_errors(
+                                    lambda: limiter.run(
+                                        lambda: fetch_part_caids(
+                                            session,
+                                            fs,
+                                            part_url,
+                                            header=header,
+                                            assembly=assembly,
+                                            registry_url=registry_url,
+                                            cache=cache,
+                                            output_file=output_file,
+                                        )
+                                    )
                                 )
-                            )
-                        except asyncio.TimeoutError:
-                            logger.error("Request for %s timed out", part_url)
-                        except Exception:
-                            logger.exception("Failed to fetch CAIDS for %s", part_url)
-                        else:
-                            annotated_part_vcf = await response.text()
-
-                            # Convert response from VCF to a TSV with locus, alleles, CAID columns.
-                            part_name = part_url.split("/")[-1].split(".")[0]
-                            async with await fs.create(f"{output_url}/{part_name}.tsv") as output_stream:
-                                header_line = "\t".join(["locus", "alleles", "CAID"]) + "\n"
-                                await output_stream.write(header_line.encode("utf-8"))
-
-                                for line in annotated_part_vcf.splitlines():
-                                    if line.startswith("#"):
-                                        continue
-
-                                    [contig, pos, caid, ref, alt, *_] = line.split("\t")
-                                    locus = f"{contig}:{pos}"
-                                    alleles = [ref, alt]
-
-                                    output_line = "\t".join([locus, json.dumps(alleles), caid]) + "\n"
-                                    await output_stream.write(output_line.encode("utf-8"))
-                        finally:
-                            # Update progress bar.
-                            progress.update(1)
+                            except asyncio.TimeoutError:
+                                logger.error("Request for %s timed out", part_url)
+                            except Exception:
+                                logger.exception("Failed to fetch CAIDS for %s", part_url)
+                            else:
+                                # Write a TSV with locus, alleles, CAID columns.
+                                # Output is only written once all CAIDs for the part have been received, so that
+                                # incomplete parts are fetched again when resuming.
+                                part_name = part_url.split("/")[-1].split(".")[0]
+                                async with await fs.create(f"{output_url}/{part_name}.tsv") as output_stream:
+                                    header_line = "\t".join(["locus", "alleles", "CAID"]) + "\n"
+                                    await output_stream.write(header_line.encode("utf-8"))
+
+                                    output_file.seek(0)
+                                    while chunk := output_file.read(STREAM_CHUNK_SIZE):
+                                        await output_stream.write(chunk)
+                            finally:
+                                # Update progress bar.
+                                progress.update(1)
 
                     return task
 
-                # Process partitions in parallel.
+                # Process partitions in parallel. Requests are further limited by the adaptive concurrency limit.
                 tasks = [create_task(part_url) for part_url in remaining_part_urls]
-                await bounded_gather(*tasks, parallelism=parallelism)
+                await bounded_gather(*tasks, parallelism=limiter.max_limit)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("vcf_url")
     parser.add_argument("output_url")
-    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--parallelism", type=int, default=4, help="Initial number of concurrent requests")
+    parser.add_argument("--max-parallelism", type=int, default=16, help="Maximum number of concurrent requests")
     parser.add_argument("--request-timeout", type=int, default=10)
+    parser.add_argument(
+        "--cache-path",
+        help="Path to a local SQLite file used to cache CAIDs. Variants found in the cache are not requested again.",
+    )
     args = parser.parse_args()
 
     return asyncio.get_event_loop().run_until_complete(
@@ -238,7 +555,9 @@ def main():
             args.vcf_url,
             args.output_url,
             parallelism=args.parallelism,
+            max_parallelism=args.max_parallelism,
             request_timeout=args.request_timeout,
+            cache_path=args.cache_path,
         )
     )
 
@@ -1,28 +1,13 @@
 import hail as hl
 
+from data_pipeline.pipeline import read_table
+
 from .locus import normalized_contig, x_position
+from .region import merge_overlapping_regions
 
 
 def merge_overlapping_exons(regions):
-    return hl.if_else(
-        hl.len(regions) > 1,
-        hl.rbind(
-            hl.sorted(regions, lambda region: region.start),
-            lambda sorted_regions: sorted_regions[1:].fold(
-                lambda acc, region: hl.if_else(
-                    region.start <= acc[-1].stop + 1,
-                    acc[:-1].append(
-                        acc[-1].annotate(
-                            stop=hl.max(region.stop, acc[-1].stop), xstop=hl.max(region.xstop, acc[-1].xstop)
-                        )
-                    ),
-                    acc.append(region),
-                ),
-                [sorted_regions[0]],
-            ),
-        ),
-        regions,
-    )
+    return merge_overlapping_regions(regions)
 
 
 ###############################################
@@ -112,7 +97,7 @@ def collect_gene_exons(gene_exons):
 
 
 def reject_par_y_genes(genes_path=None):
-    genes = hl.read_table(genes_path)
+    genes = read_table(genes_path)
     genes = genes.filter(genes.gene_version.endswith("_PAR_Y") == hl.literal(False))
     return genes
 
@@ -120,7 +105,7 @@ def reject_par_y_genes(genes_path=None):
 def patch_rnu4atac(genes_path=None):
     gene_symbol = "RNU4ATAC"
 
-    genes = hl.read_table(genes_path)
+    genes = read_table(genes_path)
     rnu4atac = genes.filter(genes.symbol == gene_symbol)
     genes = genes.filter(~(genes.symbol == gene_symbol))
 
@@ -229,7 +214,7 @@ def collect_transcript_exons(transcript_exons):
 def annotate_gene_models_with_low_coverage_flag(genes_path, low_coverage_tsv_path):
     low_coverage_flag_name = "v4_low_coverage_trancript"
 
-    genes_ht = hl.read_table(genes_path)
+    genes_ht = read_table(genes_path)
     tsv_ht = hl.import_table(low_coverage_tsv_path)
     tsv_ht = tsv_ht.key_by("transcript_id")
 
@@ -307,14 +292,13 @@ def import_hgnc(path):
 
 
 def prepare_gene_table_for_release(genes_path, keep_mane_version_global_annotation):
-    ds = hl.read_table(genes_path)
+    ds = read_table(genes_path)
     if keep_mane_version_global_annotation:
         globals_dict = ds.index_globals()
         ds = ds.select_globals(mane_select_version=globals_dict["annotations"]["mane_select_transcript"]["version"])
     else:
         ds = ds.select_globals()
 
-    ds = ds.repartition(100)
     return ds
 
 
@@ -1,10 +1,4 @@
-import csv
-import os
-import subprocess
-from collections import namedtuple
-
 import hail as hl
-from tqdm import tqdm
 
 
 TISSUE_NAME_MAP = {
@@ -66,100 +60,63 @@ TISSUE_NAME_MAP = {
 TISSUE_FIELDS = list(TISSUE_NAME_MAP.values())
 
 
-Row = namedtuple("Row", ["gene", "chrom", "pos", "tissues"])
-Region = namedtuple("Region", ["gene", "chrom", "start", "stop", "tissues"])
-
-
-def read_bases_tsv(filename):
-    with open(filename) as bases_file:
-        reader = csv.reader(bases_file, delimiter="\t")
-        header_row = next(reader, None)
-        tissue_names = header_row[3:]
-        for row in reader:
-            tissues = dict(zip(tissue_names, [float(v) for v in row[3:]]))
-            yield Row(gene=row[0], chrom=row[1], pos=int(row[2]), tissues=tissues)
+def collapse_bases_to_regions(bases):
+    """
+    Collapse runs of consecutive bases with the same values into regions.
+
+    `bases` is an array of structs with `chrom`, `pos`, and `values` fields. Returns an array of structs
+    with `chrom`, `start`, `stop`, and the fields of `values`.
+    """
+    return hl.rbind(
+        hl.sorted(bases, key=lambda base: base.pos),
+        lambda bases: hl.rbind(
+            hl.range(hl.len(bases)).filter(
+                lambda i: hl.if_else(
+                    i == 0,
+                    True,
+                    (bases[i].chrom != bases[i - 1].chrom)
+                    | (bases[i].pos > bases[i - 1].pos + 1)
+                    # StructExpression.values is a method, so the field must be accessed by indexing.
+                    | (bases[i]["values"] != bases[i - 1]["values"]),
+                )
+            ),
+            lambda run_starts: hl.range(hl.len(run_starts)).map(
+                lambda run: hl.rbind(
+                    bases[run_starts[run]],
+                    hl.if_else(run + 1 < hl.len(run_starts), run_starts[run + 1], hl.len(bases)) - 1,
+                    lambda first_base, run_end: hl.struct(
+                        chrom=first_base.chrom, start=first_base.pos, stop=bases[run_end].pos, **first_base["values"]
+                    ),
+                )
+            ),
+        ),
+    )
 
 
 def prepare_base_level_pext(base_level_pext_path):
-    tmp_dir = os.path.expanduser("~")
-
-    #
-    # Step 1: rename fields, extract chrom/pos from locus, convert missing values to 0, export to TSV
-    #
     ds = hl.read_table(base_level_pext_path)
 
+    # Replace NaNs and missing values with 0s
+    def value_or_zero(value):
+        return hl.if_else(hl.is_missing(value) | hl.is_nan(value), hl.float(0), value)
+
     ds = ds.select(
         gene_id=ds.ensg,
-        chrom=ds.locus.contig,
-        pos=ds.locus.position,
-        # Replace NaNs and missing values with 0s
-        mean=hl.if_else(
-            hl.is_missing(ds.mean_proportion) | hl.is_nan(ds.mean_proportion), hl.float(0), ds.mean_proportion
+        base=hl.struct(
+            chrom=ds.locus.contig,
+            pos=ds.locus.position,
+            values=hl.struct(
+                mean=value_or_zero(ds.mean_proportion),
+                tissues=hl.struct(
+                    **{renamed: value_or_zero(ds[original]) for original, renamed in TISSUE_NAME_MAP.items()}
+                ),
+            ),
         ),
-        **{
-            renamed: hl.if_else(hl.is_missing(ds[original]) | hl.is_nan(ds[original]), hl.float(0), ds[original])
-            for original, renamed in TISSUE_NAME_MAP.items()
-        },
     )
 
-    ds = ds.order_by(ds.gene_id, hl.asc(ds.pos)).drop("locus")
-    ds.export("file://" + os.path.join(tmp_dir, "bases.tsv"))
-
-    #
-    # Step 2: Collect base-level data into regions
-    #
-    with open(os.path.join(tmp_dir, "regions.tsv"), "w") as output_file:
-        writer = csv.writer(output_file, delimiter="\t")
-        writer.writerow(["gene_id", "chrom", "start", "stop", "mean"] + TISSUE_FIELDS)
-
-        def output_region(region):
-            writer.writerow(
-                [region.gene, region.chrom, region.start, region.stop, region.tissues["mean"]]
-                + [region.tissues[t] for t in TISSUE_FIELDS]
-            )
-
-        rows = read_bases_tsv(os.path.join(tmp_dir, "bases.tsv"))
-        first_row = next(rows)
-        current_region = Region(
-            gene=first_row.gene, chrom=first_row.chrom, start=first_row.pos, stop=None, tissues=first_row.tissues
-        )
-        last_pos = first_row.pos
-
-        for row in tqdm(rows):
-            if (
-                row.gene != current_region.gene
-                or row.chrom != current_region.chrom
-                or row.pos > (last_pos + 1)
-                or any(row.tissues[t] != current_region.tissues[t] for t in row.tissues)
-            ):
-                output_region(current_region._replace(stop=last_pos))
-                current_region = Region(gene=row.gene, chrom=row.chrom, start=row.pos, stop=None, tissues=row.tissues)
-
-            last_pos = row.pos
-
-        output_region(current_region._replace(stop=last_pos))
-
-    # Copy regions file to HDFS
-    subprocess.run(
-        ["hdfs", "dfs", "-cp", "file://" + os.path.join(tmp_dir, "regions.tsv"), os.path.join("/tmp/regions.tsv")],
-        check=True,
-    )
-
-    #
-    # Step 3: Convert regions to a Hail table.
-    #
-    types = {t: hl.tfloat for t in TISSUE_FIELDS}
-    types["gene_id"] = hl.tstr
-    types["chrom"] = hl.tstr
-    types["start"] = hl.tint
-    types["stop"] = hl.tint
-    types["mean"] = hl.tfloat
-
-    ds = hl.import_table("/tmp/regions.tsv", min_partitions=100, missing="", types=types)
-
-    ds = ds.select("gene_id", "chrom", "start", "stop", "mean", tissues=hl.struct(**{t: ds[t] for t in TISSUE_FIELDS}))
-
-    ds = ds.group_by("gene_id").aggregate(regions=hl.agg.collect(ds.row_value.drop("gene_id")))
+    # Collect each gene's bases and collapse runs of consecutive bases with identical values into regions.
+    ds = ds.group_by("gene_id").aggregate(bases=hl.agg.collect(ds.base))
+    ds = ds.select(regions=collapse_bases_to_regions(ds.bases))
 
     return ds
 
@@ -0,0 +1,45 @@
+import hail as hl
+
+
+def _running_max(values):
+    # hl.max ignores missing values, so the first element of the scan is the first value.
+    return hl.array_scan(lambda acc, value: hl.max(acc, value), hl.missing(values.dtype.element_type), values)[1:]
+
+
+def merge_overlapping_regions(regions, start_field="start", stop_field="stop", max_fields=("xstop",)):
+    """
+    Merge overlapping and adjacent regions.
+
+    Each merged region has the fields of the first region (by start position) it contains, with
+    `stop_field` and each of `max_fields` set to the maximum over all regions that it contains.
+    Regions are merged in one pass after sorting.
+    """
+    max_fields = [field for field in max_fields if field in regions.dtype.element_type]
+
+    def merge_sorted_regions(sorted_regions):
+        # Arrays used in the lambdas below are bound with rbind. Otherwise, they would be computed
+        # again for each element that the lambdas are applied to.
+        return hl.rbind(
+            _running_max(sorted_regions.map(lambda region: region[stop_field])),
+            hl.struct(
+                **{field: _running_max(sorted_regions.map(lambda region: region[field])) for field in max_fields}
+            ),
+            lambda stops, max_values: hl.rbind(
+                # A region starts a new merged region if it does not overlap or abut any preceding region.
+                hl.range(hl.len(sorted_regions)).filter(
+                    lambda i: hl.if_else(i == 0, True, sorted_regions[i][start_field] > stops[i - 1] + 1)
+                ),
+                lambda group_starts: hl.range(hl.len(group_starts)).map(
+                    lambda group: hl.rbind(
+                        hl.if_else(group + 1 < hl.len(group_starts), group_starts[group + 1], hl.len(sorted_regions))
+                        - 1,
+                        lambda group_end: sorted_regions[group_starts[group]].annotate(
+                            **{stop_field: stops[group_end]},
+                            **{field: max_values[field][group_end] for field in max_fields},
+                        ),
+                    )
+                ),
+            ),
+        )
+
+    return hl.rbind(hl.sorted(regions, lambda region: region[start_field]), merge_sorted_regions)
@@ -1,5 +1,7 @@
 import hail as hl
 
+from data_pipeline.pipeline import read_table
+
 
 def annotate_gene_transcripts_with_tissue_expression(table_path, gtex_tissue_expression_path):
     genes = hl.read_table(table_path)
@@ -22,7 +24,7 @@ def annotate_gene_transcripts_with_tissue_expression(table_path, gtex_tissue_exp
 
 
 def annotate_gene_transcripts_with_refseq_id(table_path, mane_select_transcripts_path):
-    mane_select_transcripts = hl.read_table(mane_select_transcripts_path)
+    mane_select_transcripts = read_table(mane_select_transcripts_path, persist=True)
 
     ensembl_to_refseq_map = {}
     for transcript in mane_select_transcripts.collect():
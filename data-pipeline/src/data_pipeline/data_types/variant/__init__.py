@@ -1,6 +1,7 @@
 from .annotate_variants import annotate_variants, annotate_caids, annotate_vrs_ids
 from .transcript_consequence.annotate_transcript_consequences import annotate_transcript_consequences
 from .variant_id import variant_id, variant_ids, compressed_variant_id
+from .variant_id_codec import encode_compressed_variant_ids, decode_compressed_variant_ids
 
 __all__ = [
     "annotate_variants",
@@ -9,5 +10,7 @@ __all__ = [
     "variant_id",
     "variant_ids",
     "compressed_variant_id",
+    "encode_compressed_variant_ids",
+    "decode_compressed_variant_ids",
     "annotate_vrs_ids",
 ]
@@ -1,34 +1,36 @@
 import hail as hl
 
+from data_pipeline.pipeline import read_table
+
 
 def annotate_variants(variants_path, exome_coverage_path=None, genome_coverage_path=None):
-    ds = hl.read_table(variants_path)
+    ds = read_table(variants_path)
 
     ds = ds.annotate(coverage=hl.struct())
     if exome_coverage_path:
-        exome_coverage = hl.read_table(exome_coverage_path)
+        exome_coverage = read_table(exome_coverage_path)
         ds = ds.annotate(coverage=ds.coverage.annotate(exome=exome_coverage[ds.locus]))
     if genome_coverage_path:
-        genome_coverage = hl.read_table(genome_coverage_path)
+        genome_coverage = read_table(genome_coverage_path)
         ds = ds.annotate(coverage=ds.coverage.annotate(genome=genome_coverage[ds.locus]))
 
     return ds
 
 
 def annotate_caids(variants_path, caids_path=None):
-    ds = hl.read_table(variants_path)
+    ds = read_table(variants_path)
 
     if caids_path:
-        caids = hl.read_table(caids_path)
+        caids = read_table(caids_path)
         ds = ds.annotate(caid=caids[ds.key].caid)
 
     return ds
 
 
 def annotate_vrs_ids(variants_path, exome_variants_path, genome_variants_path):
-    ds = hl.read_table(variants_path)
-    exomes = hl.read_table(exome_variants_path)
-    genomes = hl.read_table(genome_variants_path)
+    ds = read_table(variants_path)
+    exomes = read_table(exome_variants_path)
+    genomes = read_table(genome_variants_path)
     exome_vrs = exomes.select(vrs=exomes.info.vrs)
     genome_vrs = genomes.select(vrs=genomes.info.vrs)
     vrs = exome_vrs.union(genome_vrs)
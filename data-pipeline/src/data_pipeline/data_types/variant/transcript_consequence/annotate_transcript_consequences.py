@@ -1,5 +1,7 @@
 import hail as hl
 
+from data_pipeline.pipeline import read_table
+
 from .hgvs import hgvsp_from_consequence_amino_acids
 from .vep import consequence_term_rank
 
@@ -7,8 +9,50 @@ from .vep import consequence_term_rank
 OMIT_CONSEQUENCE_TERMS = hl.set(["upstream_gene_variant", "downstream_gene_variant"])
 
 
+def transcript_info_by_id(transcripts):
+    """
+    Expression for a dict of transcript ID to transcript and gene versions.
+
+    The dict is computed by Hail when it is used instead of being collected to Python, so it is
+    not included as a literal in the expressions that use it.
+    """
+    return transcripts.aggregate(
+        hl.dict(
+            hl.agg.collect(
+                (
+                    transcripts.transcript_id,
+                    hl.struct(
+                        transcript_version=transcripts.transcript_version,
+                        gene_version=transcripts.gene.gene_version,
+                    ),
+                )
+            )
+        ),
+        _localize=False,
+    )
+
+
+def mane_transcript_by_gene_id(mane_transcripts):
+    """Expression for a dict of gene ID to MANE Select transcript."""
+    return mane_transcripts.aggregate(
+        hl.dict(hl.agg.collect((mane_transcripts.gene_id, mane_transcripts.row.drop("gene_id")))),
+        _localize=False,
+    )
+
+
 def annotate_transcript_consequences(variants_path, transcripts_path, mane_transcripts_path=None):
-    ds = hl.read_table(variants_path)
+    ds = read_table(variants_path)
+
+    # Transcript annotations are added to the variants table as globals, which are computed once and
+    # broadcast to all partitions. Joining with the transcripts table would require exploding and
+    # shuffling every variant's consequences.
+    transcripts = read_table(transcripts_path)
+    ds = ds.annotate_globals(transcript_info_by_id=transcript_info_by_id(transcripts))
+
+    if mane_transcripts_path:
+        mane_transcripts = read_table(mane_transcripts_path, persist=True)
+        mane_select_transcripts_version = hl.eval(mane_transcripts.globals.version)
+        ds = ds.annotate_globals(mane_transcript_by_gene_id=mane_transcript_by_gene_id(mane_transcripts))
 
     most_severe_consequence = ds.vep.most_severe_consequence
 
@@ -62,37 +106,15 @@ def annotate_transcript_consequences(variants_path, transcripts_path, mane_trans
 
     transcript_consequences = transcript_consequences.map(lambda c: c.select(*consequences))
 
-    transcripts = hl.read_table(transcripts_path)
-
-    # TODO: This can potentially be improved by removing Table.collect
-    # See https://hail.zulipchat.com/#narrow/stream/123010-Hail-0.2E2.20support/topic/Optimize.20annotation.20with.20small.20dataset
-    # and https://github.com/Nealelab/ukb_common/blob/ad94d20f8c9f3b711e40a473425925775f0b1f30/utils/generic.py#L18
-    transcript_info = hl.dict(
-        [
-            (row.transcript_id, row.transcript_info)
-            for row in transcripts.select(
-                transcript_info=hl.struct(
-                    transcript_version=transcripts.transcript_version,
-                    gene_version=transcripts.gene.gene_version,
-                )
-            ).collect()
-        ]
-    )
-
     transcript_consequences = transcript_consequences.map(
-        lambda csq: csq.annotate(**transcript_info.get(csq.transcript_id))
+        lambda csq: csq.annotate(**ds.transcript_info_by_id.get(csq.transcript_id))
     )
 
     if mane_transcripts_path:
-        mane_transcripts = hl.read_table(mane_transcripts_path)
-        mane_select_transcripts_version = hl.eval(mane_transcripts.globals.version)
-
-        mane_transcripts = hl.dict([(row.gene_id, row.drop("gene_id")) for row in mane_transcripts.collect()])
-
         transcript_consequences = transcript_consequences.map(
             lambda csq: csq.annotate(
                 **hl.rbind(
-                    mane_transcripts.get(csq.gene_id),
+                    ds.mane_transcript_by_gene_id.get(csq.gene_id),
                     lambda mane_transcript: (
                         hl.case()
                         .when(
@@ -139,6 +161,7 @@ def annotate_transcript_consequences(variants_path, transcripts_path, mane_trans
 
         ds = ds.annotate(transcript_consequences=transcript_consequences).drop("vep")
         ds = ds.annotate_globals(mane_select_version=mane_select_transcripts_version)
+        ds = ds.drop("transcript_info_by_id", "mane_transcript_by_gene_id")
 
     else:
         transcript_consequences = hl.sorted(
@@ -151,5 +174,6 @@ def annotate_transcript_consequences(variants_path, transcripts_path, mane_trans
         )
 
         ds = ds.annotate(transcript_consequences=transcript_consequences).drop("vep")
+        ds = ds.drop("transcript_info_by_id")
 
     return ds
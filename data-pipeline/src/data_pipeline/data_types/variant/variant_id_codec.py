@@ -0,0 +1,201 @@
+"""
+Batched encoding and decoding of compressed variant IDs without Hail.
+
+`encode_compressed_variant_ids` produces the same IDs as the `compressed_variant_id` Hail expression:
+
+- Substitutions: "<chrom>-<pos>-<ref>-<alt>"
+- Deletions: "<chrom>-<pos>d<number of deleted bases>-<alt>"
+- Insertions: "<chrom>-<pos>i<number of inserted bases>-<encoded alt>", where the alt allele is packed
+  into 2 bits per base, three bases per character.
+
+Compressed IDs do not contain the reference allele for deletions and insertions, so decoding them
+requires either the reference sequence (for deletions) or the assumption that the variant is
+minimally represented (for insertions).
+"""
+
+import re
+import string
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+ENCODED_ALLELE_CHARACTERS = string.ascii_uppercase + string.ascii_lowercase + string.digits + "-_"
+
+_INVALID_CODE = 255
+
+_BASE_CODES = np.full(256, _INVALID_CODE, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    _BASE_CODES[_base] = _code
+
+_ENCODED_CHARACTER_BYTES = np.frombuffer(ENCODED_ALLELE_CHARACTERS.encode("ascii"), dtype=np.uint8)
+
+_ENCODED_CHARACTER_VALUES = np.full(256, _INVALID_CODE, dtype=np.uint8)
+_ENCODED_CHARACTER_VALUES[_ENCODED_CHARACTER_BYTES] = np.arange(len(ENCODED_ALLELE_CHARACTERS), dtype=np.uint8)
+
+# Hail converts missing values to "null" when joining strings. Groups of bases containing anything
+# other than A, C, G, or T are missing in the Hail expression.
+_INVALID_GROUP = "null"
+
+_POSITION_PATTERN = re.compile(r"^(\d+)([di])(\d+)$")
+
+
+def _normalized_contig(contig: str) -> str:
+    contig = contig[3:] if contig.startswith("chr") else contig
+    return "M" if contig == "MT" else contig
+
+
+def _lengths(strings: Sequence[str]) -> np.ndarray:
+    return np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+
+
+def _encode_alleles(alleles: Sequence[str]) -> List[str]:
+    if not alleles:
+        return []
+
+    lengths = _lengths(alleles)
+    # Non-ASCII characters are replaced with "?" so that there is one byte per character.
+    codes = _BASE_CODES[np.frombuffer("".join(alleles).encode("ascii", errors="replace"), dtype=np.uint8)]
+
+    # Place each allele's bases at the start of its groups of 3 and pad the remainder with A (0).
+    group_counts = (lengths + 2) // 3
+    group_offsets = np.zeros(len(alleles) + 1, dtype=np.int64)
+    np.cumsum(group_counts, out=group_offsets[1:])
+    base_offsets = np.repeat(3 * group_offsets[:-1] - (np.cumsum(lengths) - lengths), lengths)
+    padded = np.zeros(3 * int(group_offsets[-1]), dtype=np.uint8)
+    padded[np.arange(len(codes)) + base_offsets] = codes
+
+    groups = padded.reshape(-1, 3)
+    invalid_groups = (groups == _INVALID_CODE).any(axis=1)
+    values = (groups[:, 0] << 4) | (groups[:, 1] << 2) | groups[:, 2]
+    values[invalid_groups] = 0
+    encoded = _ENCODED_CHARACTER_BYTES[values].tobytes().decode("ascii")
+
+    offsets = group_offsets.tolist()
+    encoded_alleles = [encoded[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    for group_index in np.flatnonzero(invalid_groups).tolist():
+        allele_index = int(np.searchsorted(group_offsets, group_index, side="right")) - 1
+        encoded_alleles[allele_index] = "".join(
+            _INVALID_GROUP if invalid_groups[i] else encoded[i]
+            for i in range(offsets[allele_index], offsets[allele_index + 1])
+        )
+
+    return encoded_alleles
+
+
+def encode_compressed_variant_ids(
+    contigs: Sequence[str], positions: Sequence[int], refs: Sequence[str], alts: Sequence[str]
+) -> List[str]:
+    """
+    Compute compressed variant IDs for biallelic variants.
+
+    Returns the same IDs as the `compressed_variant_id` Hail expression.
+    """
+    if not len(contigs) == len(positions) == len(refs) == len(alts):
+        raise ValueError("contigs, positions, refs, and alts must have the same length")
+
+    ref_lengths = _lengths(refs)
+    alt_lengths = _lengths(alts)
+    is_insertion = ref_lengths < alt_lengths
+
+    encoded_insertions = iter(
+        _encode_alleles([alt for alt, insertion in zip(alts, is_insertion.tolist()) if insertion])
+    )
+
+    normalized_contigs = {contig: _normalized_contig(contig) for contig in set(contigs)}
+    positions = np.asarray(positions).tolist()
+
+    ids = []
+    for contig, position, ref, alt, ref_length, alt_length in zip(
+        contigs, positions, refs, alts, ref_lengths.tolist(), alt_lengths.tolist()
+    ):
+        contig = normalized_contigs[contig]
+        if ref_length > alt_length:
+            ids.append(f"{contig}-{position}d{ref_length - alt_length}-{alt}")
+        elif ref_length < alt_length:
+            ids.append(f"{contig}-{position}i{alt_length - ref_length}-{next(encoded_insertions)}")
+        else:
+            ids.append(f"{contig}-{position}-{ref}-{alt}")
+
+    return ids
+
+
+def _decode_alleles(encoded_alleles: Sequence[str]) -> List[Optional[str]]:
+    """Decode packed alleles, including padding. Returns None for alleles that cannot be decoded."""
+    if not encoded_alleles:
+        return []
+
+    values = _ENCODED_CHARACTER_VALUES[
+        np.frombuffer("".join(encoded_alleles).encode("ascii", errors="replace"), dtype=np.uint8)
+    ]
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)[
+        np.stack([values >> 4, (values >> 2) & 3, values & 3], axis=1).reshape(-1) & 3
+    ]
+    decoded = bases.tobytes().decode("ascii")
+
+    invalid = np.zeros(len(encoded_alleles), dtype=bool)
+    lengths = _lengths(encoded_alleles)
+    invalid_characters = np.flatnonzero(values == _INVALID_CODE)
+    if len(invalid_characters):
+        invalid[np.searchsorted(np.cumsum(lengths), invalid_characters, side="right")] = True
+
+    offsets = np.concatenate([[0], np.cumsum(3 * lengths)]).tolist()
+    return [
+        None if is_invalid else decoded[start:end]
+        for start, end, is_invalid in zip(offsets[:-1], offsets[1:], invalid.tolist())
+    ]
+
+
+def decode_compressed_variant_ids(
+    ids: Sequence[str], reference_sequence: Optional[Callable[[str, int, int], str]] = None
+) -> List[Optional[str]]:
+    """
+    Convert compressed variant IDs back to "<chrom>-<pos>-<ref>-<alt>" variant IDs.
+
+    Insertions are decoded assuming that they are minimally represented, with a reference allele
+    of one base. Deletions can only be decoded if `reference_sequence` is given. It is called with
+    a contig and 1-based start and end positions (inclusive) and returns the reference sequence
+    for that interval.
+
+    Returns None for IDs that cannot be decoded.
+    """
+    variant_ids: List[Optional[str]] = []
+    insertions = []
+    for variant_id in ids:
+        # Packed alleles may contain "-", so only split on the first two.
+        contig, _, rest = variant_id.partition("-")
+        position, _, alleles = rest.partition("-")
+
+        if position.isdigit():
+            variant_ids.append(f"{contig}-{position}-{alleles}" if alleles.count("-") == 1 else None)
+            continue
+
+        match = _POSITION_PATTERN.match(position)
+        if not match:
+            variant_ids.append(None)
+            continue
+
+        position, variant_type, length = match.groups()
+        if variant_type == "i":
+            # Insertions are decoded together after all IDs have been split.
+            insertions.append((len(variant_ids), contig, position, int(length), alleles))
+            variant_ids.append(None)
+
+        elif reference_sequence is not None:
+            ref_length = len(alleles) + int(length)
+            ref = reference_sequence(contig, int(position), int(position) + ref_length - 1)
+            variant_ids.append(f"{contig}-{position}-{ref}-{alleles}")
+
+        else:
+            variant_ids.append(None)
+
+    decoded_alts = _decode_alleles([encoded_alt for *_, encoded_alt in insertions])
+    for (index, contig, position, length, _), alt in zip(insertions, decoded_alts):
+        alt_length = length + 1
+        # Packed alleles are padded to a multiple of 3 bases. If the number of groups does not
+        # match the assumed alt allele length, the variant is not minimally represented.
+        if alt is not None and len(alt) == 3 * ((alt_length + 2) // 3):
+            variant_ids[index] = f"{contig}-{position}-{alt[0]}-{alt[:alt_length]}"
+
+    return variant_ids
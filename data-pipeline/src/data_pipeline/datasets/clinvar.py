@@ -1,11 +1,17 @@
+import concurrent.futures
 import csv
 import gzip
+import hashlib
+import io
 import json
+import multiprocessing
 import os
+import re
+import shutil
 import subprocess
 import sys
+import threading
 from xml.etree import ElementTree
-from xml.sax.saxutils import quoteattr
 
 import hail as hl
 from tqdm import tqdm
@@ -15,6 +21,7 @@ from data_pipeline.datasets.gnomad_v3.gnomad_v3_mitochondrial_variants import (
 )
 from data_pipeline.data_types.locus import normalized_contig
 from data_pipeline.data_types.variant import variant_id
+from data_pipeline.pipeline import OutputPolicy, _file_system, get_output_root
 
 
 CLINVAR_XML_URL = (
@@ -38,31 +45,51 @@ CLINVAR_GOLD_STARS = {
 }
 
 
-def find_mapping_elements_by_xref(trait_element, submission_element, trait_mapping_list_element):
+def index_trait_mappings(trait_mapping_list_element):
+    """
+    Index TraitMapping elements by (ClinicalAssertionID, TraitType, MappingType, MappingValue).
+
+    If multiple elements have the same attributes, the first one is used.
+    """
+    trait_mappings = {}
     if trait_mapping_list_element is None:
-        return None
+        return trait_mappings
+
+    for mapping_element in trait_mapping_list_element.iterfind("./TraitMapping"):
+        key = (
+            mapping_element.attrib.get("ClinicalAssertionID"),
+            mapping_element.attrib.get("TraitType"),
+            mapping_element.attrib.get("MappingType"),
+            mapping_element.attrib.get("MappingValue"),
+        )
+        trait_mappings.setdefault(key, mapping_element)
+
+    return trait_mappings
+
 
-    xref_elements = trait_element.findall("XRef")
-    for xref_element in xref_elements:
-        selector = f"./TraitMapping[@ClinicalAssertionID='{submission_element.attrib['ID']}'][@TraitType='{trait_element.attrib['Type']}'][@MappingType='XRef'][@MappingValue={quoteattr(xref_element.attrib['ID'])}]"  # noqa
-        mapping_element = trait_mapping_list_element.find(selector)
+def find_mapping_elements_by_xref(trait_element, submission_element, trait_mappings):
+    for xref_element in trait_element.findall("XRef"):
+        mapping_element = trait_mappings.get(
+            (submission_element.attrib["ID"], trait_element.attrib["Type"], "XRef", xref_element.attrib["ID"])
+        )
         if mapping_element is not None:
             return mapping_element
     return None
 
 
-def find_mapping_elements_by_preferred_name(trait_element, submission_element, trait_mapping_list_element):
+def find_mapping_elements_by_preferred_name(trait_element, submission_element, trait_mappings):
     preferred_name_element = trait_element.find("./Name/ElementValue[@Type='Preferred']")
 
-    if preferred_name_element is not None and trait_mapping_list_element is not None:
-        selector = f"./TraitMapping[@ClinicalAssertionID='{submission_element.attrib['ID']}'][@TraitType='{trait_element.attrib['Type']}'][@MappingType='Name'][@MappingValue={quoteattr(preferred_name_element.text)}]"  # noqa
-        mapping_element = trait_mapping_list_element.find(selector)
+    if preferred_name_element is not None:
+        mapping_element = trait_mappings.get(
+            (submission_element.attrib["ID"], trait_element.attrib["Type"], "Name", preferred_name_element.text)
+        )
         return mapping_element, preferred_name_element
 
     return None, preferred_name_element
 
 
-def find_mapping_elements_by_name(trait_element, submission_element, trait_mapping_list_element):
+def find_mapping_elements_by_name(trait_element, submission_element, trait_mappings):
     name_elements = trait_element.findall("./Name/ElementValue")
     preferred_name_element = None
 
@@ -70,35 +97,36 @@ def find_mapping_elements_by_name(trait_element, submission_element, trait_mappi
         if preferred_name_element is None:
             preferred_name_element = name_element
 
-        if trait_mapping_list_element is not None:
-            selector = f"./TraitMapping[@ClinicalAssertionID='{submission_element.attrib['ID']}'][@TraitType='{trait_element.attrib['Type']}'][@MappingType='Name'][@MappingValue={quoteattr(name_element.text)}]"  # noqa
-            mapping_element = trait_mapping_list_element.find(selector)
-            if mapping_element:
-                return mapping_element, preferred_name_element
+        mapping_element = trait_mappings.get(
+            (submission_element.attrib["ID"], trait_element.attrib["Type"], "Name", name_element.text)
+        )
+        # Mapping elements without a MedGen child element are skipped.
+        if mapping_element is not None and len(mapping_element):
+            return mapping_element, preferred_name_element
 
     return None, preferred_name_element
 
 
-def _determine_mapping_and_preferred_name_element(trait_element, submission_element, trait_mapping_list_element):
+def _determine_mapping_and_preferred_name_element(trait_element, submission_element, trait_mappings):
     preferred_name_element = None
-    mapping_element = find_mapping_elements_by_xref(trait_element, submission_element, trait_mapping_list_element)
+    mapping_element = find_mapping_elements_by_xref(trait_element, submission_element, trait_mappings)
 
     if mapping_element is None:
         mapping_element, preferred_name_element = find_mapping_elements_by_preferred_name(
-            trait_element, submission_element, trait_mapping_list_element
+            trait_element, submission_element, trait_mappings
         )
 
     if mapping_element is None:
         mapping_element, preferred_name_element = find_mapping_elements_by_name(
-            trait_element, submission_element, trait_mapping_list_element
+            trait_element, submission_element, trait_mappings
         )
 
     return (mapping_element, preferred_name_element)
 
 
-def _associate_condition_with_medgen_id(submission_element, trait_mapping_list_element, trait_element):
+def _associate_condition_with_medgen_id(submission_element, trait_mappings, trait_element):
     (mapping_element, preferred_name_element) = _determine_mapping_and_preferred_name_element(
-        trait_element, submission_element, trait_mapping_list_element
+        trait_element, submission_element, trait_mappings
     )
 
     if mapping_element is not None:
@@ -109,7 +137,7 @@ def _associate_condition_with_medgen_id(submission_element, trait_mapping_list_e
         return {"name": preferred_name_element.text, "medgen_id": None}
 
 
-def _parse_submission(submission_element, trait_mapping_list_element):
+def _parse_submission(submission_element, trait_mappings):
     submission = {}
 
     submission["id"] = submission_element.find("./ClinVarAccession").attrib["Accession"]
@@ -127,7 +155,7 @@ def _parse_submission(submission_element, trait_mapping_list_element):
     trait_elements = submission_element.findall("./TraitSet/Trait")
     for trait_element in trait_elements:
         condition_medgen_mapping = _associate_condition_with_medgen_id(
-            submission_element, trait_mapping_list_element, trait_element
+            submission_element, trait_mappings, trait_element
         )
         if condition_medgen_mapping is not None:
             submission["conditions"].append(condition_medgen_mapping)
@@ -183,76 +211,356 @@ def _parse_variant(variant_element, tqdm_pbar=None):
     variant["last_evaluated"] = germline_classification_element.attrib.get("DateLastEvaluated")
 
     submission_elements = variant_element.findall("./ClassifiedRecord/ClinicalAssertionList/ClinicalAssertion")
-    trait_mapping_list_element = variant_element.find("./ClassifiedRecord/TraitMappingList")
-    variant["submissions"] = [_parse_submission(el, trait_mapping_list_element) for el in submission_elements]
+    trait_mappings = index_trait_mappings(variant_element.find("./ClassifiedRecord/TraitMappingList"))
+    variant["submissions"] = [_parse_submission(el, trait_mappings) for el in submission_elements]
 
     return variant
 
 
-def parse_clinvar_xml_to_tsv(
+CLINVAR_TSV_HEADER = ["locus_GRCh37", "alleles_GRCh37", "locus_GRCh38", "alleles_GRCh38", "variant"]
+
+DEFAULT_RECORDS_PER_SHARD = 10_000
+
+# Incremental imports store the records parsed from each release in this directory under the output root.
+CLINVAR_INCREMENTAL_STATE_DIRECTORY = "/clinvar/incremental"
+
+RECORDS_FILE_NAME = "records.tsv.gz"
+
+_VARIATION_ARCHIVE_START = b"<VariationArchive"
+_VARIATION_ARCHIVE_END = b"</VariationArchive>"
+
+# Attribute values cannot contain quotes, but they can contain ">" (for example, in HGVS variant names).
+_VARIATION_ARCHIVE_START_TAG = re.compile(rb'<VariationArchive((?:\s+[\w:.-]+\s*=\s*"[^"]*")*)\s*>')
+_XML_ATTRIBUTE = re.compile(rb'([\w:.-]+)\s*=\s*"([^"]*)"')
+
+_XML_READ_SIZE = 16 * 1024 * 1024
+
+
+def _variant_tsv_row(variant):
+    locations = variant.pop("locations")
+    return [
+        locations["GRCh37"]["locus"] if "GRCh37" in locations else "NA",
+        json.dumps(locations["GRCh37"]["alleles"]) if "GRCh37" in locations else "NA",
+        ("chr" + locations["GRCh38"]["locus"].replace("MT", "M") if "GRCh38" in locations else "NA"),
+        json.dumps(locations["GRCh38"]["alleles"]) if "GRCh38" in locations else "NA",
+        json.dumps(variant),
+    ]
+
+
+def split_variation_archive_records(xml_file, read_size=_XML_READ_SIZE):
+    """
+    Split a ClinVar XML file into VariationArchive elements without parsing it.
+
+    Returns the text before the first VariationArchive element (the XML declaration and the start tag
+    of the root element) and an iterator of the text of each VariationArchive element.
+    """
+    buffer = b""
+    while True:
+        record_start = buffer.find(_VARIATION_ARCHIVE_START)
+        if record_start != -1:
+            break
+        block = xml_file.read(read_size)
+        if not block:
+            return buffer, iter([])
+        buffer += block
+
+    header, buffer = buffer[:record_start], buffer[record_start:]
+
+    def records():
+        nonlocal buffer
+        previous_record_end = 0
+        search_start = 0
+        while True:
+            record_end = buffer.find(_VARIATION_ARCHIVE_END, search_start)
+            if record_end == -1:
+                block = xml_file.read(read_size)
+                if not block:
+                    return
+
+                # Drop records that have already been returned and continue searching where the last
+                # search stopped. The end tag may be split across blocks.
+                search_start = max(0, len(buffer) - previous_record_end - len(_VARIATION_ARCHIVE_END) + 1)
+                buffer = buffer[previous_record_end:] + block
+                previous_record_end = 0
+                continue
+
+            record_end += len(_VARIATION_ARCHIVE_END)
+            yield buffer[buffer.find(_VARIATION_ARCHIVE_START, previous_record_end) : record_end]
+            previous_record_end = search_start = record_end
+
+    return header, records()
+
+
+def variation_archive_record_version(record):
+    """
+    Get the VariationID, version, and a fingerprint of the content of a VariationArchive element.
+
+    The fingerprint covers the whole element, including the version in its start tag.
+    """
+    start_tag = _VARIATION_ARCHIVE_START_TAG.match(record)
+    attributes = dict(_XML_ATTRIBUTE.findall(start_tag.group(1))) if start_tag else {}
+    return (
+        attributes.get(b"VariationID", b"").decode("utf8"),
+        attributes.get(b"Version", b"").decode("utf8"),
+        hashlib.blake2b(record, digest_size=16).hexdigest(),
+    )
+
+
+def _parse_release_header(header):
+    """Get the release date and the end tag for the root element from the text before the first record."""
+    # The first tag that is not the XML declaration, a comment, or a DTD is the root element.
+    root_tag = re.search(rb"<([^?!\s/>]+)", header)
+    if root_tag is None:
+        raise ValueError("ClinVar XML does not contain a root element")
+
+    footer = b"</" + root_tag.group(1) + b">"
+    root_element = ElementTree.fromstring(header + footer)
+    return root_element.attrib.get("ReleaseDate", ""), footer
+
+
+def _parse_variation_archive_chunk(parse_variant_function, header, footer, chunk, output_tsv_path):
+    root_element = ElementTree.fromstring(header + chunk + footer)
+
+    n_variants = 0
+    with open(output_tsv_path, "w", newline="") as output_file:
+        writer = csv.writer(output_file, delimiter="\t", quotechar=None, quoting=csv.QUOTE_NONE)
+        writer.writerow(CLINVAR_TSV_HEADER)
+
+        for element in root_element.iterfind("VariationArchive"):
+            try:
+                variant = parse_variant_function(element)
+            except Exception:
+                print(f"Failed to parse variant {element.attrib['VariationID']}", file=sys.stderr)
+                raise
+
+            if variant is not None:
+                writer.writerow(_variant_tsv_row(variant))
+                n_variants += 1
+
+    return n_variants
+
+
+def read_record_fingerprints(records_path):
+    """Read the fingerprint of each VariationArchive element from a records file written by an earlier parse."""
+    fingerprints = {}
+    with _file_system(records_path).open(records_path, "rb") as f:
+        # Depending on the file system, compressed files may or may not be decompressed when opened.
+        records_file = gzip.open(f, "rt") if f.peek(2)[:2] == b"\x1f\x8b" else io.TextIOWrapper(f)
+        with records_file:
+            reader = csv.reader(records_file, delimiter="\t")
+            next(reader)
+            for variation_id, _, fingerprint, _ in reader:
+                fingerprints[variation_id] = fingerprint
+
+    return fingerprints
+
+
+def parse_clinvar_xml_to_tsv_shards(
     input_xml_path,
-    output_tsv_path,
+    output_directory,
     parse_variant_function,
+    records_per_shard=DEFAULT_RECORDS_PER_SHARD,
+    processes=None,
+    previous_record_fingerprints=None,
 ):
-    release_date = ""
-    file_size = os.path.getsize(input_xml_path)
+    """
+    Parse a ClinVar XML release into TSV files in `output_directory`.
 
-    with open(output_tsv_path, "w", newline="") as output_file:
-        writer = csv.writer(output_file, delimiter="\t", quotechar="", quoting=csv.QUOTE_NONE)
-        writer.writerow(["locus_GRCh37", "alleles_GRCh37", "locus_GRCh38", "alleles_GRCh38", "variant"])
-
-        open_function = gzip.open if str(input_xml_path).endswith(".gz") else open
-        with open_function(input_xml_path, "r") as xml_file:
-            with open(input_xml_path, "rb") as raw_xml_file:
-                # make tqdm bar progress based of bytes processed
-                with tqdm.wrapattr(
-                    raw_xml_file, "read", total=file_size, mininterval=5, unit="B", unit_scale=True
-                ) as pbar_file:
-                    if str(input_xml_path).endswith(".gz"):
-                        xml_file = gzip.open(pbar_file)
-                    else:
-                        xml_file = pbar_file
-
-                    xml = ElementTree.iterparse(xml_file, events=["end"])
-                    for _, element in xml:
-                        if element.tag == "ClinVarVariationRelease":
-                            release_date = element.attrib["ReleaseDate"]
-
-                        if element.tag == "VariationArchive":
-                            try:
-                                variant = parse_variant_function(element)
-                                if variant is None:
-                                    element.clear()
-                                    continue
-                                locations = variant.pop("locations")
-                                writer.writerow(
-                                    [
-                                        locations["GRCh37"]["locus"] if "GRCh37" in locations else "NA",
-                                        json.dumps(locations["GRCh37"]["alleles"]) if "GRCh37" in locations else "NA",
-                                        (
-                                            "chr" + locations["GRCh38"]["locus"].replace("MT", "M")
-                                            if "GRCh38" in locations
-                                            else "NA"
-                                        ),
-                                        json.dumps(locations["GRCh38"]["alleles"]) if "GRCh38" in locations else "NA",
-                                        json.dumps(variant),
-                                    ]
-                                )
-
-                            except Exception:
-                                print(
-                                    f"Failed to parse variant {element.attrib['VariationID']}",
-                                    file=sys.stderr,
-                                )
-                                raise
-
-                            # https://stackoverflow.com/questions/7697710/python-running-out-of-memory-parsing-xml-using-celementtree-iterparse
-                            element.clear()
+    The XML is split into chunks of `records_per_shard` VariationArchive elements, which are parsed in
+    a process pool. Each chunk is written to its own part-NNNNN.tsv file, so that Hail can import them in
+    parallel. `parse_variant_function` must be a module level function so that it can be sent to worker
+    processes.
+
+    The VariationID, version, and fingerprint of every VariationArchive element are written to
+    records.tsv.gz. If `previous_record_fingerprints` (from `read_record_fingerprints`) is given, only
+    elements that are new or whose fingerprint has changed are parsed. Those are marked as changed in
+    the records file.
+
+    At least one TSV file is written, so that the shards can be imported even if no records changed.
 
+    Returns the release date.
+    """
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(output_directory, exist_ok=True)
+    for file_name in os.listdir(output_directory):
+        if file_name.endswith(".tsv") or file_name == RECORDS_FILE_NAME:
+            os.remove(os.path.join(output_directory, file_name))
+
+    file_size = os.path.getsize(input_xml_path)
+    n_records = 0
+    n_changed_records = 0
+    n_variants = 0
+
+    # Hail starts a JVM in this process, so worker processes are spawned instead of forked.
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+    )
+    records_file = gzip.open(os.path.join(output_directory, RECORDS_FILE_NAME), "wt", newline="")
+    with executor, records_file, open(input_xml_path, "rb") as raw_xml_file:
+        records_writer = csv.writer(records_file, delimiter="\t", quotechar=None, quoting=csv.QUOTE_NONE)
+        records_writer.writerow(["variation_id", "version", "fingerprint", "changed"])
+
+        # make tqdm bar progress based of bytes processed
+        with tqdm.wrapattr(
+            raw_xml_file, "read", total=file_size, mininterval=5, unit="B", unit_scale=True
+        ) as pbar_file:
+            xml_file = gzip.open(pbar_file) if str(input_xml_path).endswith(".gz") else pbar_file
+
+            header, records = split_variation_archive_records(xml_file)
+            release_date, footer = _parse_release_header(header)
+
+            pending = set()
+            n_shards = 0
+
+            def submit_chunk(chunk_records):
+                nonlocal n_variants, n_shards, pending
+                # Limit the number of chunks held in memory while waiting for workers.
+                if len(pending) >= 2 * processes:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    n_variants += sum(future.result() for future in done)
+
+                shard_path = os.path.join(output_directory, f"part-{n_shards:05d}.tsv")
+                n_shards += 1
+                pending.add(
+                    executor.submit(
+                        _parse_variation_archive_chunk,
+                        parse_variant_function,
+                        header,
+                        footer,
+                        b"\n".join(chunk_records),
+                        shard_path,
+                    )
+                )
+
+            chunk_records = []
+            for record in records:
+                n_records += 1
+                variation_id, version, fingerprint = variation_archive_record_version(record)
+                changed = (
+                    previous_record_fingerprints is None
+                    or previous_record_fingerprints.get(variation_id) != fingerprint
+                )
+                records_writer.writerow([variation_id, version, fingerprint, "true" if changed else "false"])
+
+                if changed:
+                    n_changed_records += 1
+                    chunk_records.append(record)
+                    if len(chunk_records) == records_per_shard:
+                        submit_chunk(chunk_records)
+                        chunk_records = []
+
+            if chunk_records or n_shards == 0:
+                submit_chunk(chunk_records)
+
+            n_variants += sum(future.result() for future in concurrent.futures.as_completed(pending))
+
+    print(f"Parsed {n_variants} variants from {n_changed_records} of {n_records} records")
+    return release_date
+
+
+def read_clinvar_release_date(input_xml_path):
+    open_function = gzip.open if str(input_xml_path).endswith(".gz") else open
+    with open_function(input_xml_path, "rb") as xml_file:
+        header, _ = split_variation_archive_records(xml_file, read_size=64 * 1024)
+        release_date, _ = _parse_release_header(header)
         return release_date
 
 
-def import_clinvar_xml(clinvar_xml_path):
+def _remove_directory(path):
+    if path.startswith("gs://"):
+        subprocess.check_call(["gsutil", "-m", "-q", "rm", "-r", path])
+    else:
+        shutil.rmtree(path)
+
+
+def _read_incremental_state(state_root):
+    latest_path = f"{state_root}/latest.json"
+    file_system = _file_system(latest_path)
+    if not file_system.exists(latest_path):
+        return None
+
+    return json.loads(file_system.read_text(latest_path))
+
+
+def _write_incremental_state(state_root, state):
+    latest_path = f"{state_root}/latest.json"
+    if not latest_path.startswith("gs://"):
+        os.makedirs(state_root, exist_ok=True)
+
+    with _file_system(latest_path).open(latest_path, "w") as f:
+        json.dump(state, f)
+
+    _file_system(latest_path).invalidate(latest_path)
+
+
+_indexed_release_lock = threading.Lock()
+
+
+def read_latest_clinvar_release_date():
+    """Read the release date of the latest incremental ClinVar import."""
+    state_root = get_output_root() + CLINVAR_INCREMENTAL_STATE_DIRECTORY
+    state = _read_incremental_state(state_root)
+    if state is None:
+        raise RuntimeError(f"No incremental ClinVar import found in {state_root}")
+
+    return state["release_date"]
+
+
+def record_indexed_clinvar_release(index, release_date):
+    """
+    Record that the index that the alias `index` points to contains ClinVar release `release_date`.
+
+    Changes from an incremental import are only read for an index that contains the release that the
+    import was compared with.
+    """
+    state_root = get_output_root() + CLINVAR_INCREMENTAL_STATE_DIRECTORY
+    with _indexed_release_lock:
+        state = _read_incremental_state(state_root)
+        if state is None:
+            raise RuntimeError(f"No incremental ClinVar import found in {state_root}")
+
+        state["indexed_release_dates"] = {**state.get("indexed_release_dates", {}), index: release_date}
+        _write_incremental_state(state_root, state)
+
+
+def read_clinvar_changes(index):
+    """
+    Read the VariationIDs of records that changed in the latest incremental ClinVar import.
+
+    Changes are between the latest release and the release imported before it. So that no changes are
+    missed, they are only read for an index that contains that earlier release, as recorded by
+    `record_indexed_clinvar_release`. Otherwise, the whole dataset must be exported.
+
+    Returns a table of changed or added records keyed by `clinvar_variation_id` and a list of the
+    VariationIDs of removed records.
+    """
+    state_root = get_output_root() + CLINVAR_INCREMENTAL_STATE_DIRECTORY
+    state = _read_incremental_state(state_root)
+    if state is None:
+        raise RuntimeError(f"No incremental ClinVar import found in {state_root}")
+
+    indexed_release_date = state.get("indexed_release_dates", {}).get(index)
+    if state["previous_release_date"] is None or indexed_release_date != state["previous_release_date"]:
+        raise RuntimeError(
+            f"ClinVar release {state['release_date']} was compared with release {state['previous_release_date']}, "
+            f"but {index} contains release {indexed_release_date or 'unknown'}. Export the whole dataset instead."
+        )
+
+    records = hl.import_table(state["records_path"], force=True)
+    changed = records.filter(records.changed == "true").select(clinvar_variation_id=records.variation_id)
+    changed = changed.key_by("clinvar_variation_id")
+
+    return changed, state["removed_variation_ids"]
+
+
+def import_clinvar_xml(clinvar_xml_path, incremental=False):
+    """
+    Import variants from a ClinVar XML release.
+
+    In incremental mode, the records parsed from each release and the resulting table are stored under
+    the output root. Only records that have changed since the previous incremental import are parsed,
+    and the previous table is patched with them.
+    """
     release_date = None
 
     clinvar_xml_local_path = os.path.join("/tmp", os.path.basename(clinvar_xml_path))
@@ -260,16 +568,34 @@ def import_clinvar_xml(clinvar_xml_path):
     if not os.path.exists(clinvar_xml_local_path):
         subprocess.check_call(["gsutil", "cp", clinvar_xml_path, clinvar_xml_local_path])
 
+    state_root = get_output_root() + CLINVAR_INCREMENTAL_STATE_DIRECTORY if incremental else None
+    previous_state = _read_incremental_state(state_root) if state_root else None
+    if previous_state and previous_state["release_date"] == read_clinvar_release_date(clinvar_xml_local_path):
+        print(f"ClinVar release {previous_state['release_date']} has already been imported")
+        return hl.read_table(previous_state["variants_path"])
+
+    previous_record_fingerprints = None
+    if previous_state:
+        print(f"Comparing with ClinVar release {previous_state['release_date']}")
+        previous_record_fingerprints = read_record_fingerprints(previous_state["records_path"])
+
     print("Parsing XML file")
-    output_file = "/tmp/clinvar_variants.tsv"
-    release_date = parse_clinvar_xml_to_tsv(
-        input_xml_path=clinvar_xml_local_path, output_tsv_path=output_file, parse_variant_function=_parse_variant
+    output_directory = "/tmp/clinvar_variants"
+    release_date = parse_clinvar_xml_to_tsv_shards(
+        input_xml_path=clinvar_xml_local_path,
+        output_directory=output_directory,
+        parse_variant_function=_parse_variant,
+        previous_record_fingerprints=previous_record_fingerprints,
     )
 
-    subprocess.check_call(["hdfs", "dfs", "-cp", "-f", "file:///tmp/clinvar_variants.tsv", "/tmp/clinvar_variants.tsv"])
+    subprocess.check_call(["hdfs", "dfs", "-rm", "-r", "-f", output_directory])
+    subprocess.check_call(["hdfs", "dfs", "-cp", f"file://{output_directory}", output_directory])
+
+    # Incremental imports after the first only parse records that have changed, which fit in a few partitions.
+    min_partitions = 2000 if previous_record_fingerprints is None else None
 
     ds = hl.import_table(
-        "/tmp/clinvar_variants.tsv",
+        f"{output_directory}/part-*.tsv",
         types={
             "locus_GRCh37": hl.tlocus("GRCh37"),
             "alleles_GRCh37": hl.tarray(hl.tstr),
@@ -294,12 +620,67 @@ def import_clinvar_xml(clinvar_xml_path):
                 ),
             ),
         },
-        min_partitions=2000,
+        min_partitions=min_partitions,
     )
 
+    if not state_root:
+        return ds.annotate_globals(clinvar_release_date=release_date)
+
+    release_state_root = f"{state_root}/{release_date}"
+    records_path = f"{release_state_root}/{RECORDS_FILE_NAME}"
+    hl.hadoop_copy(f"file://{output_directory}/{RECORDS_FILE_NAME}", records_path)
+
+    removed_variation_ids = []
+    if previous_state and previous_record_fingerprints is not None:
+        current_variation_ids = set()
+        with gzip.open(os.path.join(output_directory, RECORDS_FILE_NAME), "rt") as records_file:
+            reader = csv.reader(records_file, delimiter="\t")
+            next(reader)
+            current_variation_ids.update(row[0] for row in reader)
+        removed_variation_ids = sorted(set(previous_record_fingerprints) - current_variation_ids)
+
+        # Replace variants from changed and removed records with the newly parsed variants.
+        records = hl.import_table(records_path, force=True)
+        replaced = records.filter(records.changed == "true").select(variation_id=records.variation_id)
+        replaced = replaced.union(
+            hl.Table.parallelize(
+                [{"variation_id": variation_id} for variation_id in removed_variation_ids],
+                hl.tstruct(variation_id=hl.tstr),
+            )
+        )
+        replaced = replaced.key_by("variation_id")
+
+        previous_ds = hl.read_table(previous_state["variants_path"])
+        previous_ds = previous_ds.filter(hl.is_missing(replaced[previous_ds.variant.clinvar_variation_id]))
+        ds = previous_ds.select_globals().union(ds)
+
+        # Union appends the new table's partitions to the previous table's partitions. Combine them into
+        # a count based on the previous table's size, so that the state table does not gain partitions
+        # with every release.
+        previous_size = _file_system(previous_state["variants_path"]).disk_usage(previous_state["variants_path"])
+        ds = ds.naive_coalesce(OutputPolicy().target_partitions(previous_size))
+
     ds = ds.annotate_globals(clinvar_release_date=release_date)
 
-    return ds
+    variants_path = f"{release_state_root}/variants.ht"
+    ds.write(variants_path, overwrite=True)
+
+    _write_incremental_state(
+        state_root,
+        {
+            "release_date": release_date,
+            "previous_release_date": previous_state["release_date"] if previous_state else None,
+            "records_path": records_path,
+            "variants_path": variants_path,
+            "removed_variation_ids": removed_variation_ids,
+            "indexed_release_dates": previous_state.get("indexed_release_dates", {}) if previous_state else {},
+        },
+    )
+
+    if previous_state:
+        _remove_directory(previous_state["variants_path"].rsplit("/", 1)[0])
+
+    return hl.read_table(variants_path)
 
 
 def prepare_clinvar_variants(clinvar_path, reference_genome):
@@ -2,6 +2,7 @@ import hail as hl
 
 from data_pipeline.data_types.locus import normalized_contig, x_position
 from data_pipeline.data_types.variant import variant_id
+from data_pipeline.pipeline import checkpoint
 
 
 POPULATIONS = ["afr", "amr", "asj", "eas", "fin", "nfe", "oth", "sas"]
@@ -363,7 +364,7 @@ def prepare_gnomad_v2_variants(exome_variants_path, genome_variants_path):
     )
 
     # Colocated variants
-    variants = variants.cache()
+    variants = checkpoint(variants, "variants")
     variants_by_locus = variants.select(
         variants.variant_id,
         exome_ac_raw=hl.struct(**{f: variants.exome.freq[f].ac_raw for f in variants.exome.freq.dtype.fields}),
@@ -387,6 +388,7 @@ def prepare_gnomad_v2_variants(exome_variants_path, genome_variants_path):
             }
         )
     )
+    variants_by_locus = checkpoint(variants_by_locus.select("variant_ids"), "variant_ids_by_locus")
 
     variants = variants.annotate(colocated_variants=variants_by_locus[variants.locus].variant_ids)
     variants = variants.annotate(
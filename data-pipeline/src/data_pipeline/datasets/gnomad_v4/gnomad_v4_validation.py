@@ -1,10 +1,9 @@
-from cattrs import (
-    ClassValidationError,
-    IterableValidationError,
-    structure,
-    Converter,
-    transform_error,
-)
+import operator
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple, Union, get_args, get_origin
+
+import attr
+from cattrs import structure
 import hail as hl
 import json
 
@@ -19,26 +18,234 @@ from data_pipeline.datasets.gnomad_v4.types.prepare_variants_step2 import Varian
 from data_pipeline.datasets.gnomad_v4.types.prepare_variants_step3 import Variant as Step3Variant
 from data_pipeline.datasets.gnomad_v4.types.prepare_variants_step4 import Variant as Step4Variant
 
-c = Converter(forbid_extra_keys=True)
+# Hail types accepted for primitive attrs field types.
+PRIMITIVE_DTYPES = {
+    bool: (hl.tbool,),
+    int: (hl.tint32, hl.tint64),
+    float: (hl.tfloat32, hl.tfloat64, hl.tint32, hl.tint64),
+    str: (hl.tstr,),
+}
+
+SAMPLE_SEED = 1337
+SAMPLE_FRACTION = 0.001
+# Small contigs are sampled at a higher rate so that validation sees enough of their rows.
+CONTIG_SAMPLE_FRACTIONS = {"chrY": 0.01, "chrM": 0.1}
+
+
+class ValidationError(Exception):
+    pass
+
+
+@attr.define
+class TypeCheckScope:
+    """
+    Checks on values in a row, or in an element of an array or set.
+
+    `required_values` maps field paths to (parent accessor, value accessor) for values that must not be missing
+    when their parent is defined. `element_scopes` maps the paths of arrays and sets to (collection accessor,
+    checks for each element).
+    """
+
+    required_values: Dict[str, Tuple[Optional[Callable], Callable]] = attr.Factory(dict)
+    element_scopes: Dict[str, Tuple[Callable, "TypeCheckScope"]] = attr.Factory(dict)
+
+    def update(self, other: "TypeCheckScope") -> None:
+        self.required_values.update(other.required_values)
+        self.element_scopes.update(other.element_scopes)
+
+
+def _field_path(path, field):
+    return f"{path}.{field}" if path else field
+
+
+def _type_name(expected_type):
+    return getattr(expected_type, "__name__", str(expected_type))
+
+
+def _plan_type_checks(expected_type, dtype, path, parent, accessor, scope, schema_errors):
+    if expected_type is Any:
+        return
+
+    members = get_args(expected_type) if get_origin(expected_type) is Union else (expected_type,)
+    if type(None) not in members:
+        scope.required_values[path] = (parent, accessor)
+
+    members = [member for member in members if member is not type(None)]
+    if len(members) == 1:
+        _plan_value_type_checks(members[0], dtype, path, accessor, scope, schema_errors)
+        return
+
+    # Use the first member of the union that matches the Hail type.
+    for member in members:
+        member_scope = TypeCheckScope()
+        member_schema_errors = {}
+        _plan_value_type_checks(member, dtype, path, accessor, member_scope, member_schema_errors)
+        if not member_schema_errors:
+            scope.update(member_scope)
+            return
+
+    schema_errors[path] = f"{dtype} does not match any of {', '.join(_type_name(member) for member in members)}"
+
+
+def _plan_value_type_checks(expected_type, dtype, path, accessor, scope, schema_errors):
+    if expected_type is Any:
+        return
+
+    if attr.has(expected_type):
+        if isinstance(dtype, hl.tlocus):
+            # Loci are converted to objects with contig and position by hl.json.
+            field_dtypes = {"contig": hl.tstr, "position": hl.tint32}
+            get_field = getattr
+        elif isinstance(dtype, hl.tstruct):
+            field_dtypes = dict(dtype.items())
+            get_field = operator.getitem
+        else:
+            schema_errors[path] = f"expected {_type_name(expected_type)}, found {dtype}"
+            return
+
+        fields = attr.fields(expected_type)
+        for field in fields:
+            field_path = _field_path(path, field.name)
+            if field.name not in field_dtypes:
+                if field.default is attr.NOTHING:
+                    schema_errors[field_path] = "missing field"
+                continue
+
+            _plan_type_checks(
+                field.type,
+                field_dtypes[field.name],
+                field_path,
+                accessor,
+                lambda expr, field=field.name: get_field(accessor(expr), field),
+                scope,
+                schema_errors,
+            )
+
+        field_names = {field.name for field in fields}
+        for field in field_dtypes:
+            if field not in field_names:
+                schema_errors[_field_path(path, field)] = "unexpected field"
+
+    elif expected_type in (list, set) or get_origin(expected_type) in (list, set):
+        if not isinstance(dtype, (hl.tarray, hl.tset)):
+            schema_errors[path] = f"expected {_type_name(expected_type)}, found {dtype}"
+            return
+
+        (element_type,) = get_args(expected_type) or (Any,)
+        element_scope = TypeCheckScope()
+        _plan_type_checks(
+            element_type, dtype.element_type, f"{path}[]", None, lambda expr: expr, element_scope, schema_errors
+        )
+        if element_scope.required_values or element_scope.element_scopes:
+            scope.element_scopes[path] = (accessor, element_scope)
+
+    elif expected_type in PRIMITIVE_DTYPES:
+        if dtype not in PRIMITIVE_DTYPES[expected_type]:
+            schema_errors[path] = f"expected {_type_name(expected_type)}, found {dtype}"
+
+    else:
+        schema_errors[path] = f"unsupported type {_type_name(expected_type)}"
 
 
-def validate_rows(ht: hl.Table, cls: object):
-    result = ht_to_json(ht)
-    for variant in result:
-        if variant:
-            try:
-                c.structure_attrs_fromdict(variant, cls)
-            except ClassValidationError as e:
-                logger.error(e)
-                logger.error(transform_error(e))
-            except IterableValidationError as e:
-                logger.error(e)
-                logger.error(transform_error(e))
-                raise Exception(e)
-            except Exception as e:
-                logger.error(e)
-                logger.error(transform_error(e))
-                raise Exception(e)
+def plan_type_checks(cls: type, dtype: hl.HailType) -> Tuple[TypeCheckScope, Dict[str, str]]:
+    """
+    Compare an attrs class with the Hail type of a table's rows.
+
+    Type mismatches, missing fields, and unexpected fields can be found from the Hail type alone and are
+    returned as a dict of field path -> error. Values that must not be missing can only be checked against
+    the data and are returned as a TypeCheckScope.
+    """
+    scope = TypeCheckScope()
+    schema_errors: Dict[str, str] = {}
+    _plan_value_type_checks(cls, dtype, "", lambda expr: expr, scope, schema_errors)
+    return scope, schema_errors
+
+
+def _type_check_aggregation(scope: TypeCheckScope, expr):
+    def is_missing_value(parent, accessor):
+        if parent is None:
+            return hl.is_missing(accessor(expr))
+
+        return hl.is_defined(parent(expr)) & hl.is_missing(accessor(expr))
+
+    return hl.struct(
+        n_missing=hl.struct(
+            **{
+                path: hl.agg.count_where(is_missing_value(parent, accessor))
+                for path, (parent, accessor) in scope.required_values.items()
+            }
+        ),
+        elements=hl.struct(
+            **{
+                path: hl.agg.explode(
+                    lambda element, scope=element_scope: _type_check_aggregation(scope, element), accessor(expr)
+                )
+                for path, (accessor, element_scope) in scope.element_scopes.items()
+            }
+        ),
+    )
+
+
+def _collect_missing_value_counts(result, error_counts):
+    for path, n_missing in result.n_missing.items():
+        if n_missing:
+            error_counts[path]["missing value"] = n_missing
+
+    for element_result in result.elements.values():
+        _collect_missing_value_counts(element_result, error_counts)
+
+
+def sample_rows_by_contig(
+    ht: hl.Table, fraction: float, contig_fractions: Optional[Dict[str, float]] = None, seed: Optional[int] = None
+) -> hl.Table:
+    """
+    Sample rows from each contig of a locus keyed table.
+
+    :param fraction: Fraction of rows to sample from contigs not in `contig_fractions`.
+    :param contig_fractions: Fraction of rows to sample from specific contigs, for example to sample more
+        rows from small contigs.
+    """
+    fractions: hl.DictExpression = hl.literal(contig_fractions or {}, hl.tdict(hl.tstr, hl.tfloat64))
+    return ht.filter(hl.rand_bool(fractions.get(ht.locus.contig, fraction), seed=seed))
+
+
+def validate_rows(ht: hl.Table, cls: type) -> Dict[str, Dict[str, int]]:
+    """
+    Check that all rows in a table can be structured as `cls`.
+
+    Schema errors are found from the table's type. Missing values in fields that are not optional are
+    counted in one distributed aggregation over the table.
+
+    :return: Dict of field path -> error -> number of rows with that error.
+    """
+    scope, schema_errors = plan_type_checks(cls, ht.row.dtype)
+
+    result: hl.Struct = ht.aggregate(hl.struct(n_rows=hl.agg.count(), checks=_type_check_aggregation(scope, ht.row)))
+
+    error_counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for path, error in schema_errors.items():
+        error_counts[path][error] = result.n_rows
+    _collect_missing_value_counts(result.checks, error_counts)
+
+    for path, errors in sorted(error_counts.items()):
+        for error, count in errors.items():
+            logger.error(f"{cls.__name__} {path}: {error} ({count} of {result.n_rows} rows)")
+
+    return dict(error_counts)
+
+
+def validate_sampled_rows(ht: hl.Table, cls: type, description: str) -> None:
+    """
+    Validate a sample of rows from each contig of a table.
+
+    Raises a ValidationError if any sampled rows cannot be structured as `cls`.
+    """
+    ht = sample_rows_by_contig(ht, SAMPLE_FRACTION, CONTIG_SAMPLE_FRACTIONS, seed=SAMPLE_SEED)
+    error_counts = validate_rows(ht, cls)
+    if error_counts:
+        raise ValidationError(f"Rows of {description} do not match {cls.__name__} in {len(error_counts)} fields")
+
+    logger.info(f"Validated {description}")
 
 
 def ht_to_json(ht: hl.Table, field: str = "row"):
@@ -80,46 +287,34 @@ def validate_genome_globals_input(pipeline: Pipeline):
 def validate_exome_variant_input(pipeline: Pipeline):
     input_path = pipeline.get_task("prepare_gnomad_v4_variants").get_inputs()["exome_variants_path"]
     ht = hl.read_table(input_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, InitialVariant)
-    logger.info("Validated prepare_gnomad_v4_variants input exome variants")
+    validate_sampled_rows(ht, InitialVariant, "prepare_gnomad_v4_variants input exome variants")
 
 
 def validate_genome_variant_input(pipeline: Pipeline):
     input_path = pipeline.get_task("prepare_gnomad_v4_variants").get_inputs()["genome_variants_path"]
     ht = hl.read_table(input_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, InitialVariant)
-    logger.info("Validated prepare_gnomad_v4_variants input genome variants")
+    validate_sampled_rows(ht, InitialVariant, "prepare_gnomad_v4_variants input genome variants")
 
 
 def validate_step1_output(pipeline: Pipeline):
     output_path = pipeline.get_task("prepare_gnomad_v4_variants").get_output_path()
     ht = hl.read_table(output_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, Step1Variant)
-    logger.info("Validated prepare_gnomad_v4_variants (step 1) output")
+    validate_sampled_rows(ht, Step1Variant, "prepare_gnomad_v4_variants (step 1) output")
 
 
 def validate_step2_output(pipeline: Pipeline):
     output_path = pipeline.get_task("annotate_gnomad_v4_variants").get_output_path()
     ht = hl.read_table(output_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, Step2Variant)
-    logger.info("Validated annotate_gnomad_v4_variants (step 2) output")
+    validate_sampled_rows(ht, Step2Variant, "annotate_gnomad_v4_variants (step 2) output")
 
 
 def validate_step3_output(pipeline: Pipeline):
     output_path = pipeline.get_task("annotate_gnomad_v4_transcript_consequences").get_output_path()
     ht = hl.read_table(output_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, Step3Variant)
-    logger.info("Validated annotate_gnomad_v4_transcript_consequences (step 3) output")
+    validate_sampled_rows(ht, Step3Variant, "annotate_gnomad_v4_transcript_consequences (step 3) output")
 
 
 def validate_step4_output(pipeline: Pipeline):
     output_path = pipeline.get_task("annotate_gnomad_v4_caids").get_output_path()
     ht = hl.read_table(output_path)
-    ht = ht.sample(0.001, 1337)
-    validate_rows(ht, Step4Variant)
-    logger.info("Validated annotate_gnomad_v4_caids (step 4) output")
+    validate_sampled_rows(ht, Step4Variant, "annotate_gnomad_v4_caids (step 4) output")
@@ -3,6 +3,7 @@ import itertools
 import hail as hl
 
 from data_pipeline.data_types.variant import variant_id
+from data_pipeline.pipeline import checkpoint, read_table
 
 
 def nullify_nan(value):
@@ -16,7 +17,7 @@ def freq_index_key(subset=None, pop=None, sex=None, raw=False):
 
 
 def prepare_gnomad_v4_variants_helper(input_path: str, exomes_or_genomes: str):
-    ds = hl.read_table(input_path)
+    ds = read_table(input_path)
     g = hl.eval(ds.globals)
 
     ds = ds.select_globals()
@@ -465,7 +466,7 @@ def prepare_gnomad_v4_variants(exome_variants_path: str, genome_variants_path: s
     variants = variants.annotate(exome=variants.exome.drop(*shared_fields), genome=variants.genome.drop(*shared_fields))
 
     # Colocated variants
-    variants = variants.cache()
+    variants = checkpoint(variants, "variants")
     variants_by_locus = variants.select(
         variants.variant_id,
         exome_ac_raw=hl.struct(**{f: variants.exome.freq[f].ac_raw for f in variants.exome.freq.dtype.fields}),
@@ -495,6 +496,7 @@ def prepare_gnomad_v4_variants(exome_variants_path: str, genome_variants_path: s
             }
         )
     )
+    variants_by_locus = checkpoint(variants_by_locus.select("variant_ids"), "variant_ids_by_locus")
 
     variants = variants.annotate(colocated_variants=variants_by_locus[variants.locus].variant_ids)
     variants = variants.annotate(
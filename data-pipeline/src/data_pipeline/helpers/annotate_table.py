@@ -1,11 +1,13 @@
 import hail as hl
 
+from data_pipeline.pipeline import read_table
+
 
 def annotate_table(table_path, join_on=None, **annotation_table_paths):
-    ds = hl.read_table(table_path)
+    ds = read_table(table_path)
 
     for annotation_key, annotation_table_path in annotation_table_paths.items():
-        annotation_table = hl.read_table(annotation_table_path)
+        annotation_table = read_table(annotation_table_path)
 
         ds = ds.annotate_globals(
             annotations=getattr(ds.globals, "annotations", hl.struct()).annotate(
@@ -30,6 +30,12 @@ from data_pipeline.pipelines.gnomad_v4_coverage import pipeline as gnomad_v4_cov
 from data_pipeline.pipelines.gnomad_v4_cnvs import pipeline as gnomad_v4_cnvs_pipeline
 from data_pipeline.pipelines.gnomad_v4_lof_curation_results import pipeline as gnomad_v4_lof_curation_results_pipeline
 from data_pipeline.data_types.variant import compressed_variant_id
+from data_pipeline.datasets.clinvar import (
+    read_clinvar_changes,
+    read_latest_clinvar_release_date,
+    record_indexed_clinvar_release,
+)
+from data_pipeline.pipeline import read_table
 
 
 # Implement this for development/testing purposes
@@ -47,6 +53,17 @@ def truncate_clinvar_variant_ids(ds):
     )
 
 
+def get_clinvar_changes(ds, index):
+    changed_variation_ids, removed_variation_ids = read_clinvar_changes(index)
+    changed_rows = ds.filter(hl.is_defined(changed_variation_ids[ds.clinvar_variation_id]))
+
+    # Changed records may no longer produce a variant in this table, for example if they lost their location.
+    dropped_variation_ids = changed_variation_ids.anti_join(ds.key_by("clinvar_variation_id"))
+    dropped_variation_ids = dropped_variation_ids.clinvar_variation_id.collect()
+
+    return changed_rows, removed_variation_ids + dropped_variation_ids
+
+
 def add_liftover_document_id(ds):
     return ds.annotate(
         document_id=ds.source.reference_genome[4:] + "-" + compressed_variant_id(ds.source.locus, ds.source.alleles)
@@ -58,7 +75,7 @@ DATASETS_CONFIG = {
     # Genes
     ##############################################################################################################
     "genes_grch37": {
-        "get_table": lambda: hl.read_table(genes_pipeline.get_output("genes_grch37").get_output_path()),
+        "get_table": lambda: read_table(genes_pipeline.get_output("genes_grch37").get_output_path()),
         "args": {
             "index": "genes_grch37",
             "index_fields": ["gene_id", "symbol_upper_case", "search_terms", "xstart", "xstop"],
@@ -67,7 +84,7 @@ DATASETS_CONFIG = {
         },
     },
     "genes_grch38": {
-        "get_table": lambda: hl.read_table(genes_pipeline.get_output("genes_grch38").get_output_path()),
+        "get_table": lambda: read_table(genes_pipeline.get_output("genes_grch38").get_output_path()),
         "args": {
             "index": "genes_grch38",
             "index_fields": ["gene_id", "symbol_upper_case", "search_terms", "xstart", "xstop"],
@@ -79,7 +96,7 @@ DATASETS_CONFIG = {
     # Transcripts
     ##############################################################################################################
     "transcripts_grch37": {
-        "get_table": lambda: hl.read_table(genes_pipeline.get_output("transcripts_grch37").get_output_path()),
+        "get_table": lambda: read_table(genes_pipeline.get_output("transcripts_grch37").get_output_path()),
         "args": {
             "index": "transcripts_grch37",
             "index_fields": ["transcript_id"],
@@ -88,7 +105,7 @@ DATASETS_CONFIG = {
         },
     },
     "transcripts_grch38": {
-        "get_table": lambda: hl.read_table(genes_pipeline.get_output("transcripts_grch38").get_output_path()),
+        "get_table": lambda: read_table(genes_pipeline.get_output("transcripts_grch38").get_output_path()),
         "args": {
             "index": "transcripts_grch38",
             "index_fields": ["transcript_id"],
@@ -101,7 +118,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "gnomad_v4_variants": {
         "get_table": lambda: subset_table(
-            add_variant_document_id(hl.read_table(gnomad_v4_variants_pipeline.get_output("variants").get_output_path()))
+            add_variant_document_id(read_table(gnomad_v4_variants_pipeline.get_output("variants").get_output_path()))
         ),
         "args": {
             "index": "gnomad_v4_variants",
@@ -118,23 +135,24 @@ DATASETS_CONFIG = {
             "id_field": "document_id",
             "num_shards": 48,
             "block_size": 1_000,
+            "ingest_profile": "large",
         },
     },
     "gnomad_v4_exome_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(gnomad_v4_coverage_pipeline.get_output("exome_coverage").get_output_path())
+            read_table(gnomad_v4_coverage_pipeline.get_output("exome_coverage").get_output_path())
         ),
         "args": {"index": "gnomad_v4_exome_coverage", "id_field": "xpos", "num_shards": 48, "block_size": 10_000},
     },
     # "gnomad_v4_genome_coverage": {
     #     "get_table": lambda: subset_table(
-    #         hl.read_table(gnomad_v4_coverage_pipeline.get_output("genome_coverage").get_output_path())
+    #         read_table(gnomad_v4_coverage_pipeline.get_output("genome_coverage").get_output_path())
     #     ),
     #     "args": {"index": "gnomad_v4_genome_coverage", "id_field": "xpos", "num_shards": 2, "block_size": 10_000},
     # },
     "gnomad_v4_lof_curation_results": {
         "get_table": lambda: add_variant_document_id(
-            hl.read_table(gnomad_v4_lof_curation_results_pipeline.get_output("lof_curation_results").get_output_path())
+            read_table(gnomad_v4_lof_curation_results_pipeline.get_output("lof_curation_results").get_output_path())
         ),
         "args": {
             "index": "gnomad_v4_lof_curation_results",
@@ -148,7 +166,7 @@ DATASETS_CONFIG = {
     # gnomAD v4 CNVs
     ##############################################################################################################
     "gnomad_v4_cnvs": {
-        "get_table": lambda: hl.read_table(gnomad_v4_cnvs_pipeline.get_output("cnvs").get_output_path()),
+        "get_table": lambda: read_table(gnomad_v4_cnvs_pipeline.get_output("cnvs").get_output_path()),
         "args": {
             "index": "gnomad_v4_cnvs",
             "index_fields": ["variant_id", "xpos", "xend", "genes"],
@@ -162,7 +180,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "gnomad_v3_variants": {
         "get_table": lambda: subset_table(
-            add_variant_document_id(hl.read_table(gnomad_v3_variants_pipeline.get_output("variants").get_output_path()))
+            add_variant_document_id(read_table(gnomad_v3_variants_pipeline.get_output("variants").get_output_path()))
         ),
         "args": {
             "index": "gnomad_v3_variants",
@@ -178,18 +196,19 @@ DATASETS_CONFIG = {
             "id_field": "document_id",
             "num_shards": 48,
             "block_size": 1_000,
+            "ingest_profile": "large",
         },
     },
     "gnomad_v3_genome_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(gnomad_v3_coverage_pipeline.get_output("genome_coverage").get_output_path())
+            read_table(gnomad_v3_coverage_pipeline.get_output("genome_coverage").get_output_path())
         ),
         "args": {"index": "gnomad_v3_genome_coverage", "id_field": "xpos", "num_shards": 48, "block_size": 10_000},
     },
     "gnomad_v3_local_ancestry": {
         "get_table": lambda: subset_table(
             add_variant_document_id(
-                hl.read_table(gnomad_v3_local_ancestry_pipeline.get_output("local_ancestry").get_output_path())
+                read_table(gnomad_v3_local_ancestry_pipeline.get_output("local_ancestry").get_output_path())
             )
         ),
         "args": {
@@ -206,7 +225,7 @@ DATASETS_CONFIG = {
     "gnomad_v3_mitochondrial_variants": {
         "get_table": lambda: subset_table(
             add_variant_document_id(
-                hl.read_table(gnomad_v3_mitochondrial_variants_pipeline.get_output("variants").get_output_path())
+                read_table(gnomad_v3_mitochondrial_variants_pipeline.get_output("variants").get_output_path())
             )
         ),
         "args": {
@@ -226,7 +245,7 @@ DATASETS_CONFIG = {
     },
     "gnomad_v3_mitochondrial_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(gnomad_v3_mitochondrial_coverage_pipeline.get_output("coverage").get_output_path())
+            read_table(gnomad_v3_mitochondrial_coverage_pipeline.get_output("coverage").get_output_path())
         ),
         "args": {
             "index": "gnomad_v3_mitochondrial_coverage",
@@ -239,7 +258,7 @@ DATASETS_CONFIG = {
     # gnomAD v3 short tandem repeats
     ##############################################################################################################
     "gnomad_v3_short_tandem_repeats": {
-        "get_table": lambda: hl.read_table(
+        "get_table": lambda: read_table(
             gnomad_v3_short_tandem_repeats_pipeline.get_output("short_tandem_repeats").get_output_path()
         ),
         "args": {
@@ -253,7 +272,7 @@ DATASETS_CONFIG = {
     # gnomAD SV v2 and v3
     ##############################################################################################################
     "gnomad_structural_variants_v2": {
-        "get_table": lambda: hl.read_table(gnomad_sv_v2_pipeline.get_output("structural_variants").get_output_path()),
+        "get_table": lambda: read_table(gnomad_sv_v2_pipeline.get_output("structural_variants").get_output_path()),
         "args": {
             "index": "gnomad_structural_variants_v2",
             "index_fields": ["variant_id", "xpos", "xend", "xpos2", "xend2", "genes"],
@@ -263,7 +282,7 @@ DATASETS_CONFIG = {
         },
     },
     "gnomad_structural_variants_v3": {
-        "get_table": lambda: hl.read_table(gnomad_sv_v3_pipeline.get_output("structural_variants").get_output_path()),
+        "get_table": lambda: read_table(gnomad_sv_v3_pipeline.get_output("structural_variants").get_output_path()),
         "args": {
             "index": "gnomad_structural_variants_v3",
             "index_fields": ["variant_id", "xpos", "xend", "xpos2", "xend2", "genes", "variant_id_upper_case"],
@@ -277,7 +296,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "gnomad_v2_variants": {
         "get_table": lambda: subset_table(
-            add_variant_document_id(hl.read_table(gnomad_v2_variants_pipeline.get_output("variants").get_output_path()))
+            add_variant_document_id(read_table(gnomad_v2_variants_pipeline.get_output("variants").get_output_path()))
         ),
         "args": {
             "index": "gnomad_v2_variants",
@@ -293,22 +312,23 @@ DATASETS_CONFIG = {
             "id_field": "document_id",
             "num_shards": 48,
             "block_size": 1_000,
+            "ingest_profile": "large",
         },
     },
     "gnomad_v2_exome_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(gnomad_v2_coverage_pipeline.get_output("exome_coverage").get_output_path())
+            read_table(gnomad_v2_coverage_pipeline.get_output("exome_coverage").get_output_path())
         ),
         "args": {"index": "gnomad_v2_exome_coverage", "id_field": "xpos", "num_shards": 48, "block_size": 10_000},
     },
     "gnomad_v2_genome_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(gnomad_v2_coverage_pipeline.get_output("genome_coverage").get_output_path())
+            read_table(gnomad_v2_coverage_pipeline.get_output("genome_coverage").get_output_path())
         ),
         "args": {"index": "gnomad_v2_genome_coverage", "id_field": "xpos", "num_shards": 48, "block_size": 10_000},
     },
     "gnomad_v2_mnvs": {
-        "get_table": lambda: hl.read_table(
+        "get_table": lambda: read_table(
             gnomad_v2_variants_pipeline.get_output("multinucleotide_variants").get_output_path()
         ),
         "args": {
@@ -321,7 +341,7 @@ DATASETS_CONFIG = {
     },
     "gnomad_v2_lof_curation_results": {
         "get_table": lambda: add_variant_document_id(
-            hl.read_table(gnomad_v2_lof_curation_results_pipeline.get_output("lof_curation_results").get_output_path())
+            read_table(gnomad_v2_lof_curation_results_pipeline.get_output("lof_curation_results").get_output_path())
         ),
         "args": {
             "index": "gnomad_v2_lof_curation_results",
@@ -332,7 +352,7 @@ DATASETS_CONFIG = {
         },
     },
     "gnomad_v2_variant_cooccurrence": {
-        "get_table": lambda: hl.read_table(
+        "get_table": lambda: read_table(
             gnomad_v2_variant_cooccurrence_pipeline.get_output("variant_cooccurrence").get_output_path()
         ).add_index(name="document_id"),
         "args": {
@@ -348,7 +368,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "exac_variants": {
         "get_table": lambda: subset_table(
-            add_variant_document_id(hl.read_table(exac_variants_pipeline.get_output("variants").get_output_path()))
+            add_variant_document_id(read_table(exac_variants_pipeline.get_output("variants").get_output_path()))
         ),
         "args": {
             "index": "exac_variants",
@@ -368,7 +388,7 @@ DATASETS_CONFIG = {
     },
     "exac_exome_coverage": {
         "get_table": lambda: subset_table(
-            hl.read_table(exac_coverage_pipeline.get_output("exome_coverage").get_output_path())
+            read_table(exac_coverage_pipeline.get_output("exome_coverage").get_output_path())
         ),
         "args": {"index": "exac_exome_coverage", "id_field": "xpos", "num_shards": 16, "block_size": 10_000},
     },
@@ -377,8 +397,11 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "clinvar_grch38_variants": {
         "get_table": lambda: truncate_clinvar_variant_ids(
-            subset_table(hl.read_table(clinvar_grch38_pipeline.get_output("clinvar_variants").get_output_path()))
+            subset_table(read_table(clinvar_grch38_pipeline.get_output("clinvar_variants").get_output_path()))
         ),
+        "get_changes": get_clinvar_changes,
+        "get_version": read_latest_clinvar_release_date,
+        "record_indexed_version": record_indexed_clinvar_release,
         "args": {
             "index": "clinvar_grch38_variants",
             "id_field": "clinvar_variation_id",
@@ -396,8 +419,11 @@ DATASETS_CONFIG = {
     },
     "clinvar_grch37_variants": {
         "get_table": lambda: truncate_clinvar_variant_ids(
-            subset_table(hl.read_table(clinvar_grch37_pipeline.get_output("clinvar_variants").get_output_path()))
+            subset_table(read_table(clinvar_grch37_pipeline.get_output("clinvar_variants").get_output_path()))
         ),
+        "get_changes": get_clinvar_changes,
+        "get_version": read_latest_clinvar_release_date,
+        "record_indexed_version": record_indexed_clinvar_release,
         "args": {
             "index": "clinvar_grch37_variants",
             "id_field": "clinvar_variation_id",
@@ -418,7 +444,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "liftover": {
         "get_table": lambda: add_liftover_document_id(
-            hl.read_table(liftover_pipeline.get_output("liftover").get_output_path())
+            read_table(liftover_pipeline.get_output("liftover").get_output_path())
         ),
         "args": {
             "index": "liftover",
@@ -433,7 +459,7 @@ DATASETS_CONFIG = {
     ##############################################################################################################
     "gnomad_v3_genomic_constraint_regions": {
         "get_table": lambda: subset_table(
-            hl.read_table(
+            read_table(
                 gnomad_v3_genomic_constraint_regions_pipeline.get_output(
                     "gnomad_v3_genomic_constraint_regions"
                 ).get_output_path()
@@ -445,8 +471,8 @@ DATASETS_CONFIG = {
         },
     },
     "missingness_sample": {
-        # Expected result when running check_missingness on this is:
+        # Expected result when running check_missingness on this is (True where n_missing > 0):
         # Struct(**{'A': False, 'B': True, 'C': True, 'D.X': False, 'D.Y': False, 'E.X': True, 'E.Y': False, 'F.X': False, 'F.Y': True, 'G.X': True, 'G.Y': True})
-        "get_table": lambda: hl.read_table("gs://gnomad-v4-data-pipeline/sample-missingness-data.ht")
+        "get_table": lambda: read_table("gs://gnomad-v4-data-pipeline/sample-missingness-data.ht")
     },
 }
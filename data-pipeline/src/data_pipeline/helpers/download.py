@@ -0,0 +1,432 @@
+"""
+Parallel, resumable downloads for DownloadTask.
+
+Files served over HTTP(S) by servers that support range requests are downloaded in chunks by a pool
+of threads and written directly to their destination. Progress is saved as each chunk completes, so
+a failed download resumes with the chunks that are missing. Other files (for example, files on FTP
+servers) are streamed to their destination in a single request. Failed streams to local destinations
+are resumed from the end of the partial file with a range request or, for FTP servers, a REST command.
+
+Local destinations are filled in place with positional writes to `<output>.partial`, which is renamed
+to the output path once complete. GCS destinations are written as one object per chunk under
+`<output>.parts/`, which are then composed into the output object. Streams to GCS are written to
+`<output>.partial`, which is moved to the output path once complete.
+"""
+
+import concurrent.futures
+import ftplib
+import hashlib
+import http.client
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+import attr
+import hail as hl
+from loguru import logger
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+DEFAULT_WORKERS = 8
+
+# Size of reads from the response stream. Memory use is bounded by this times the number of workers.
+BLOCK_SIZE = 1024 * 1024
+
+MAX_ATTEMPTS = 5
+
+# Maximum number of source objects in one `gsutil compose` call.
+GCS_COMPOSE_LIMIT = 32
+
+FTP_TIMEOUT = 60
+
+
+T = TypeVar("T")
+
+
+class DownloadError(Exception):
+    pass
+
+
+@attr.define
+class RemoteFile:
+    size: Optional[int]
+    supports_ranges: bool
+    etag: Optional[str]
+
+
+def _is_ftp_url(url):
+    return url.startswith("ftp://")
+
+
+def _ftp_connect(url) -> Tuple[ftplib.FTP, str]:
+    parsed_url = urllib.parse.urlparse(url)
+    ftp = ftplib.FTP(timeout=FTP_TIMEOUT)
+    ftp.connect(parsed_url.hostname or "", parsed_url.port or 21)
+    ftp.login(urllib.parse.unquote(parsed_url.username or "anonymous"), urllib.parse.unquote(parsed_url.password or ""))
+    ftp.voidcmd("TYPE I")
+    return ftp, urllib.parse.unquote(parsed_url.path)
+
+
+def get_remote_file_info(url) -> RemoteFile:
+    if _is_ftp_url(url):
+        ftp, path = _ftp_connect(url)
+        try:
+            size = ftp.size(path)
+        except ftplib.error_perm:
+            # The SIZE command is an extension that not all servers support.
+            size = None
+        finally:
+            ftp.close()
+        return RemoteFile(size=size, supports_ranges=False, etag=None)
+
+    if not url.startswith(("http://", "https://")):
+        return RemoteFile(size=None, supports_ranges=False, etag=None)
+
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request) as response:
+        content_length = response.headers.get("Content-Length")
+        return RemoteFile(
+            size=int(content_length) if content_length is not None else None,
+            supports_ranges=response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            etag=response.headers.get("ETag"),
+        )
+
+
+def _with_retries(description, fn: Callable[[], T]) -> T:
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except (
+            urllib.error.URLError,
+            http.client.HTTPException,
+            ftplib.error_temp,
+            ConnectionError,
+            TimeoutError,
+            EOFError,
+        ) as error:
+            # Client errors other than rate limiting, such as a missing file, will not succeed on a retry.
+            if isinstance(error, urllib.error.HTTPError) and error.code < 500 and error.code != 429:
+                raise
+            if attempt == MAX_ATTEMPTS:
+                raise
+            logger.warning(f"Retrying {description} after error: {error}")
+            time.sleep(2**attempt)
+            attempt += 1
+
+
+def _read_ftp_blocks(url, start=None) -> Iterator[bytes]:
+    ftp, path = _ftp_connect(url)
+    try:
+        # transfercmd sends REST before RETR to start the transfer at an offset.
+        with ftp.transfercmd(f"RETR {path}", rest=start) as connection:
+            for block in iter(lambda: connection.recv(BLOCK_SIZE), b""):
+                yield block
+        # Raises an error if the server reports that the transfer was incomplete.
+        ftp.voidresp()
+    finally:
+        ftp.close()
+
+
+def _read_blocks(url, start=None, end=None) -> Iterator[bytes]:
+    if _is_ftp_url(url):
+        assert end is None, "FTP downloads can only be read from an offset to the end of the file"
+        yield from _read_ftp_blocks(url, start)
+        return
+
+    request = urllib.request.Request(url)
+    if start is not None:
+        request.add_header("Range", f"bytes={start}-{'' if end is None else end - 1}")
+
+    with urllib.request.urlopen(request) as response:
+        if start is not None and response.status != 206:
+            raise DownloadError(f"Server did not return the requested range of {url}")
+
+        content_length = response.headers.get("Content-Length")
+        received = 0
+        for block in iter(lambda: response.read(BLOCK_SIZE), b""):
+            received += len(block)
+            yield block
+
+        # Reads with a size return what is available when the connection closes instead of raising an error.
+        if content_length is not None and received != int(content_length):
+            raise http.client.IncompleteRead(b"", int(content_length) - received)
+
+
+def _split_chunks(size, chunk_size) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+class _LocalChunkedDestination:
+    def __init__(self, output_path, download_id):
+        self.output_path = output_path
+        self.partial_path = f"{output_path}.partial"
+        self.progress_path = f"{output_path}.partial.json"
+        self.download_id = download_id
+        self._lock = threading.Lock()
+        self._completed: Set[int] = set()
+
+        if os.path.exists(self.progress_path) and os.path.exists(self.partial_path):
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            if progress["download_id"] == download_id:
+                self._completed = set(progress["completed_chunks"])
+
+    def completed_chunks(self) -> Set[int]:
+        return set(self._completed)
+
+    def prepare(self, size):
+        with open(self.partial_path, "ab") as f:
+            f.truncate(size)
+
+    def write_chunk(self, index, start, blocks: Iterator[bytes]):
+        fd = os.open(self.partial_path, os.O_WRONLY)
+        try:
+            offset = start
+            for block in blocks:
+                os.pwrite(fd, block, offset)
+                offset += len(block)
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            self._completed.add(index)
+            with open(self.progress_path, "w") as f:
+                json.dump({"download_id": self.download_id, "completed_chunks": sorted(self._completed)}, f)
+
+    def finalize(self, n_chunks):
+        os.replace(self.partial_path, self.output_path)
+        os.remove(self.progress_path)
+
+
+class _GoogleCloudStorageChunkedDestination:
+    def __init__(self, output_path, download_id):
+        self.output_path = output_path
+        self.parts_path = f"{output_path}.parts"
+        self.download_id = download_id
+        self._completed: Set[int] = set()
+
+        progress_path = f"{self.parts_path}/download.json"
+        if hl.hadoop_exists(progress_path):
+            with hl.hadoop_open(progress_path, "r") as f:
+                progress = json.load(f)
+            if progress["download_id"] == download_id:
+                # Chunks are written under a temporary name and renamed once complete, so every
+                # ".chunk" object holds a complete chunk.
+                self._completed = {
+                    int(os.path.basename(entry["path"]).split(".")[0])
+                    for entry in hl.hadoop_ls(self.parts_path)
+                    if entry["path"].endswith(".chunk")
+                }
+            else:
+                subprocess.check_call(["gsutil", "-m", "-q", "rm", "-r", self.parts_path])
+
+        with hl.hadoop_open(progress_path, "w") as f:
+            json.dump({"download_id": download_id}, f)
+
+    def _chunk_path(self, index):
+        return f"{self.parts_path}/{index:06d}.chunk"
+
+    def completed_chunks(self) -> Set[int]:
+        return set(self._completed)
+
+    def prepare(self, size):
+        pass
+
+    def write_chunk(self, index, start, blocks: Iterator[bytes]):
+        # Closing the file commits the object even if reading blocks fails partway through the chunk.
+        partial_path = f"{self._chunk_path(index)}.partial"
+        with hl.hadoop_open(partial_path, "wb") as f:
+            for block in blocks:
+                f.write(block)
+
+        _move(partial_path, self._chunk_path(index))
+
+    def finalize(self, n_chunks):
+        chunk_paths = [self._chunk_path(index) for index in range(n_chunks)]
+        composed = chunk_paths[:GCS_COMPOSE_LIMIT]
+        subprocess.check_call(["gsutil", "-q", "compose", *composed, self.output_path])
+        remaining = chunk_paths[GCS_COMPOSE_LIMIT:]
+        while remaining:
+            batch, remaining = remaining[: GCS_COMPOSE_LIMIT - 1], remaining[GCS_COMPOSE_LIMIT - 1 :]
+            subprocess.check_call(["gsutil", "-q", "compose", self.output_path, *batch, self.output_path])
+
+        subprocess.check_call(["gsutil", "-m", "-q", "rm", "-r", self.parts_path])
+
+
+def _download_chunked(url, output_path, remote_file: RemoteFile, chunk_size, workers):
+    assert remote_file.size is not None
+    download_id = f"{url}|{remote_file.size}|{remote_file.etag}|{chunk_size}"
+    destination = (
+        _GoogleCloudStorageChunkedDestination(output_path, download_id)
+        if output_path.startswith("gs://")
+        else _LocalChunkedDestination(output_path, download_id)
+    )
+
+    chunks = _split_chunks(remote_file.size, chunk_size)
+    completed = destination.completed_chunks()
+    if completed:
+        logger.info(f"Resuming download of {url} with {len(completed)} of {len(chunks)} chunks complete")
+
+    destination.prepare(remote_file.size)
+
+    def download_chunk(index):
+        start, end = chunks[index]
+        _with_retries(
+            f"chunk {index} of {url}", lambda: destination.write_chunk(index, start, _read_blocks(url, start, end))
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_chunk, index) for index in range(len(chunks)) if index not in completed]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    destination.finalize(len(chunks))
+
+
+def _move(source_path, destination_path):
+    if destination_path.startswith("gs://"):
+        subprocess.check_call(["gsutil", "-q", "mv", source_path, destination_path])
+    else:
+        os.replace(source_path, destination_path)
+
+
+def _download_stream_with_hadoop(url, output_path) -> str:
+    """
+    Download a file in a single request through Hail's Hadoop file system and return the MD5 of its content.
+
+    hl.hadoop_open compresses output based on the path's extension, which would compress an already
+    compressed ".gz" file a second time. So content is written to a path without a compression extension
+    and then moved to the output path.
+    """
+    md5 = hashlib.md5()
+    partial_path = f"{output_path}.partial"
+    with hl.hadoop_open(partial_path, "wb") as f:
+        for block in _read_blocks(url):
+            md5.update(block)
+            f.write(block)
+
+    _move(partial_path, output_path)
+    return md5.hexdigest()
+
+
+def _download_stream(url, output_path, resume_from_partial) -> str:
+    """Download a file in a single request and return the MD5 of its content."""
+    if output_path.startswith("gs://"):
+        return _download_stream_with_hadoop(url, output_path)
+
+    md5 = hashlib.md5()
+    partial_path = f"{output_path}.partial"
+    offset = 0
+    if resume_from_partial and os.path.exists(partial_path):
+        offset = os.path.getsize(partial_path)
+        with open(partial_path, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                md5.update(block)
+
+    with open(partial_path, "ab" if offset else "wb") as f:
+        for block in _read_blocks(url, offset or None):
+            md5.update(block)
+            f.write(block)
+
+    os.replace(partial_path, output_path)
+    return md5.hexdigest()
+
+
+def _file_size(path) -> int:
+    if path.startswith("gs://"):
+        return hl.hadoop_stat(path)["size_bytes"]
+    return os.path.getsize(path)
+
+
+def _file_checksum(path, algorithm) -> str:
+    digest = hashlib.new(algorithm)
+    if path.startswith("gs://"):
+        # Hail's Hadoop file handles are slow for large files, so stream objects through gsutil.
+        with subprocess.Popen(["gsutil", "cat", path], stdout=subprocess.PIPE) as process:
+            stdout = process.stdout
+            assert stdout is not None
+            for block in iter(lambda: stdout.read(BLOCK_SIZE), b""):
+                digest.update(block)
+        if process.returncode != 0:
+            raise DownloadError(f"Unable to read {path}")
+    else:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _remove(path):
+    if path.startswith("gs://"):
+        subprocess.check_call(["gsutil", "-q", "rm", path])
+    else:
+        os.remove(path)
+
+
+def download_file(
+    url,
+    output_path,
+    *,
+    expected_size: Optional[int] = None,
+    expected_checksum: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    get_remote_file_info: Callable[[str], RemoteFile] = get_remote_file_info,
+) -> str:
+    """
+    Download a file and verify its size and checksum.
+
+    `expected_checksum` is given as "<algorithm>:<hex digest>", for example "md5:0123...".
+
+    Returns a fingerprint of the downloaded content, used to detect when a downloaded file is
+    unchanged from a previous download.
+    """
+    remote_file = _with_retries(f"request for {url}", lambda: get_remote_file_info(url))
+    if expected_size is not None and remote_file.size is not None and remote_file.size != expected_size:
+        raise DownloadError(f"Expected {url} to be {expected_size} bytes, server reports {remote_file.size} bytes")
+
+    md5 = None
+    if remote_file.supports_ranges and remote_file.size is not None and remote_file.size > chunk_size:
+        _download_chunked(url, output_path, remote_file, chunk_size, workers)
+    else:
+        attempts = []
+
+        def download_stream():
+            # A partial file left by an earlier run may be from a different version of the file,
+            # so only resume partial downloads from failed attempts in this run.
+            resume_from_partial = bool(attempts) and (remote_file.supports_ranges or _is_ftp_url(url))
+            attempts.append(True)
+            return _download_stream(url, output_path, resume_from_partial)
+
+        md5 = _with_retries(f"download of {url}", download_stream)
+
+    size = _file_size(output_path)
+    expected_size = expected_size if expected_size is not None else remote_file.size
+    if expected_size is not None and size != expected_size:
+        _remove(output_path)
+        raise DownloadError(f"Expected {url} to be {expected_size} bytes, downloaded {size} bytes")
+
+    if expected_checksum:
+        algorithm, expected_digest = expected_checksum.split(":", 1)
+        digest = md5 if md5 is not None and algorithm == "md5" else _file_checksum(output_path, algorithm)
+        if digest != expected_digest.lower():
+            _remove(output_path)
+            raise DownloadError(f"Expected {algorithm} of {url} to be {expected_digest}, got {digest}")
+        return f"size={size},{algorithm}={digest}"
+
+    if md5 is not None:
+        return f"size={size},md5={md5}"
+
+    if remote_file.etag:
+        return f"size={size},etag={remote_file.etag}"
+
+    return f"size={size},md5={_file_checksum(output_path, 'md5')}"
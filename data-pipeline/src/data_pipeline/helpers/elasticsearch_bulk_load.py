@@ -0,0 +1,349 @@
+"""
+Load Hail tables into Elasticsearch with the bulk API.
+
+This is an alternative to `hl.export_elasticsearch` (the ES-Hadoop connector) that allows control
+over concurrency and retries and reports progress for each partition.
+
+Documents are first exported by Hail to a staging directory, with one file per table partition.
+Partition files are then streamed to Elasticsearch as `_bulk` requests by a bounded pool of workers,
+each with at most one request in flight. The number of documents in each request is adjusted based
+on response latency and rejections. Completed partitions are recorded in a checkpoint file, so a
+failed load resumes with the partitions that had not been loaded. Checkpoints are keyed on a fingerprint
+of the tables that documents are read from, so staged documents are not reused for a rebuilt table.
+"""
+
+import concurrent.futures
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+import attr
+import hail as hl
+from hail.ir import TableRead
+from loguru import logger
+
+from data_pipeline.pipeline import _file_system, _hash_json, content_fingerprint
+
+
+DEFAULT_CONCURRENCY = 8
+
+# Limits on the size of a single bulk request. Elasticsearch's default http.max_content_length is 100MB.
+DEFAULT_MAX_BATCH_BYTES = 32 * 1024 * 1024
+MIN_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 20_000
+
+# Batch sizes are increased while requests complete within this time and decreased when they take longer.
+DEFAULT_TARGET_LATENCY = 5.0
+
+MAX_REJECTED_ATTEMPTS = 10
+
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+
+DOCUMENTS_DIRECTORY_NAME = "documents.tsv.bgz"
+
+
+class BulkLoadError(Exception):
+    pass
+
+
+@attr.define
+class AdaptiveBatchSize:
+    """
+    Number of documents to send in each bulk request.
+
+    The size grows additively while requests complete within the target latency and shrinks
+    multiplicatively when they are slow or rejected by Elasticsearch. The size is shared by
+    all workers, since rejections reflect the load on the whole cluster.
+    """
+
+    size: int
+    min_size: int = MIN_BATCH_SIZE
+    max_size: int = MAX_BATCH_SIZE
+    target_latency: float = DEFAULT_TARGET_LATENCY
+    _lock: threading.Lock = attr.field(factory=threading.Lock, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.size = max(self.min_size, min(self.max_size, self.size))
+
+    def record_response(self, elapsed):
+        with self._lock:
+            if elapsed <= self.target_latency:
+                self.size = min(self.max_size, self.size + max(1, self.size // 10))
+            else:
+                self.size = max(self.min_size, int(self.size * self.target_latency / elapsed))
+
+    def record_rejection(self):
+        with self._lock:
+            self.size = max(self.min_size, self.size // 2)
+
+
+@attr.define
+class BulkLoadCheckpoint:
+    path: str
+    index: str
+    fingerprint: str
+    exported: bool = False
+    completed_partitions: Set[str] = attr.Factory(set)
+    _lock: threading.Lock = attr.field(factory=threading.Lock, init=False, repr=False)
+
+    @classmethod
+    def read(cls, path) -> Optional["BulkLoadCheckpoint"]:
+        file_system = _file_system(path)
+        if not file_system.exists(path):
+            return None
+
+        checkpoint = json.loads(file_system.read_text(path))
+        return cls(
+            path=path,
+            index=checkpoint["index"],
+            # Checkpoints written before loads were fingerprinted never match a table.
+            fingerprint=checkpoint.get("fingerprint", ""),
+            exported=checkpoint["exported"],
+            completed_partitions=set(checkpoint["completed_partitions"]),
+        )
+
+    def save(self):
+        with self._lock:
+            checkpoint = {
+                "index": self.index,
+                "fingerprint": self.fingerprint,
+                "exported": self.exported,
+                "completed_partitions": sorted(self.completed_partitions),
+            }
+
+            if not self.path.startswith("gs://"):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            with _file_system(self.path).open(self.path, "w") as f:
+                json.dump(checkpoint, f)
+
+    def mark_partition_complete(self, partition):
+        with self._lock:
+            self.completed_partitions.add(partition)
+        self.save()
+
+
+def table_content_fingerprint(table) -> str:
+    """
+    Fingerprint a table's row type and the contents of the Hail Tables that it is read from.
+
+    The fingerprint changes when any source table is rewritten, even if its schema is unchanged.
+    """
+    source_paths = sorted(
+        {
+            node.reader.path
+            for node in table._tir.base_search(  # pylint: disable=protected-access
+                lambda node: isinstance(node, TableRead) and hasattr(node.reader, "path")
+            )
+        }
+    )
+    return _hash_json(
+        {
+            "row_type": str(table.row.dtype),
+            "sources": {path: content_fingerprint(path) for path in source_paths},
+        }
+    )
+
+
+def export_bulk_documents(table, documents_path, id_field=None):
+    """
+    Export a table's rows as JSON documents, with one file per partition.
+
+    Each line contains a JSON encoded document ID, a tab, and the JSON encoded document.
+    JSON escapes tabs and newlines in strings, so neither appear elsewhere in a line.
+    """
+    # Key fields would be exported as additional columns.
+    table = table.key_by()
+    document_id = hl.json(table[id_field]) if id_field else hl.str("")
+    table = table.select(line=document_id + "\t" + hl.json(table.row))
+    # With parallel="header_per_shard", Hail writes a header to each partition file even if header is False.
+    table.export(documents_path, header=False, parallel="separate_header")
+
+
+def list_partition_files(documents_path) -> List[str]:
+    entries = _file_system(documents_path).ls(documents_path)
+    return sorted(entry["path"] for entry in entries if os.path.basename(entry["path"]).startswith("part-"))
+
+
+def _open_partition_file(path):
+    f = _file_system(path).open(path, "rb")
+    # Depending on the file system, compressed files may or may not be decompressed when opened.
+    if f.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=f)
+    return f
+
+
+def _read_bulk_actions(path, partition_number) -> Iterator[bytes]:
+    with _open_partition_file(path) as f:
+        for line_number, line in enumerate(f):
+            document_id, document = line.rstrip(b"\n").split(b"\t", 1)
+            # Use a deterministic ID for documents without one so that reloading a partially
+            # loaded partition replaces its documents instead of duplicating them.
+            if not document_id:
+                document_id = json.dumps(f"{partition_number}-{line_number}").encode("utf8")
+
+            yield b'{"index":{"_id":' + document_id + b"}}\n" + document + b"\n"
+
+
+def _batches(actions: Iterator[bytes], batch_size: AdaptiveBatchSize, max_batch_bytes) -> Iterator[List[bytes]]:
+    batch: List[bytes] = []
+    batch_bytes = 0
+    for action in actions:
+        if batch and (len(batch) >= batch_size.size or batch_bytes + len(action) > max_batch_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+
+        batch.append(action)
+        batch_bytes += len(action)
+
+    if batch:
+        yield batch
+
+
+def _send_batch(es_client, index, batch: List[bytes], batch_size: AdaptiveBatchSize, sleep=time.sleep):
+    """Send one bulk request, retrying any documents that Elasticsearch rejects due to load."""
+    attempt = 1
+    while True:
+        start_time = time.perf_counter()
+        # Return 429 responses instead of raising an error, so that they can be retried here.
+        response = es_client.bulk(index=index, body=b"".join(batch), ignore=429)
+        elapsed = time.perf_counter() - start_time
+
+        if response.get("status") == 429:
+            rejected = batch
+        else:
+            batch_size.record_response(elapsed)
+            if not response.get("errors"):
+                return
+
+            results = [next(iter(item.values())) for item in response["items"]]
+            failed = [result for result in results if result["status"] >= 400 and result["status"] != 429]
+            if failed:
+                raise BulkLoadError(f"Failed to index {len(failed)} documents, first error: {failed[0].get('error')}")
+
+            rejected = [action for action, result in zip(batch, results) if result["status"] == 429]
+
+        if attempt == MAX_REJECTED_ATTEMPTS:
+            raise BulkLoadError(f"Elasticsearch rejected {len(rejected)} documents after {attempt} attempts")
+
+        batch_size.record_rejection()
+        logger.warning(f"Elasticsearch rejected {len(rejected)} documents, retrying with batch size {batch_size.size}")
+        sleep(min(2**attempt, 60))
+        batch = rejected
+        attempt += 1
+
+
+def load_partition_files(
+    es_client,
+    index,
+    partition_files: List[str],
+    checkpoint: BulkLoadCheckpoint,
+    *,
+    batch_size: AdaptiveBatchSize,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    remaining: List[Tuple[int, str]] = [
+        (partition_number, path)
+        for partition_number, path in enumerate(partition_files)
+        if os.path.basename(path) not in checkpoint.completed_partitions
+    ]
+    if len(remaining) < len(partition_files):
+        logger.info(f"Resuming load of {index} with {len(partition_files) - len(remaining)} partitions complete")
+
+    completed_count = len(partition_files) - len(remaining)
+    progress_lock = threading.Lock()
+
+    def load_partition(partition_number, path):
+        nonlocal completed_count
+        document_count = 0
+        for batch in _batches(_read_bulk_actions(path, partition_number), batch_size, max_batch_bytes):
+            _send_batch(es_client, index, batch, batch_size, sleep=sleep)
+            document_count += len(batch)
+
+        checkpoint.mark_partition_complete(os.path.basename(path))
+        with progress_lock:
+            completed_count += 1
+            logger.info(
+                f"Loaded partition {partition_number} ({document_count} documents) into {index}, "
+                f"{completed_count}/{len(partition_files)} partitions complete, batch size {batch_size.size}"
+            )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(load_partition, partition_number, path) for partition_number, path in remaining]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _remove_directory(path):
+    if path.startswith("gs://"):
+        subprocess.check_call(["gsutil", "-m", "-q", "rm", "-r", path])
+    else:
+        shutil.rmtree(path)
+
+
+def bulk_load_table(
+    es_client,
+    table,
+    index,
+    staging_path,
+    *,
+    create_index: Callable[[str], None],
+    id_field=None,
+    block_size=5000,
+    concurrency=DEFAULT_CONCURRENCY,
+):
+    """
+    Load a table into an index, resuming an earlier failed load of the same table if there is one.
+
+    `create_index` is called with the index name when starting a new load. When resuming a load,
+    documents are loaded into the index created by the earlier load and the name of that index
+    is returned. A load is only resumed if the table's content fingerprint matches the checkpoint.
+    Otherwise, documents staged by the earlier load are removed.
+    """
+    checkpoint_path = f"{staging_path}/{CHECKPOINT_FILE_NAME}"
+    documents_path = f"{staging_path}/{DOCUMENTS_DIRECTORY_NAME}"
+    fingerprint = table_content_fingerprint(table)
+
+    checkpoint = BulkLoadCheckpoint.read(checkpoint_path)
+    if checkpoint and checkpoint.fingerprint == fingerprint and es_client.indices.exists(index=checkpoint.index):
+        index = checkpoint.index
+        logger.info(f"Resuming load into {index} from {checkpoint_path}")
+    else:
+        if checkpoint:
+            logger.info(f"Discarding checkpoint {checkpoint_path} for a different table or a deleted index")
+            _remove_directory(staging_path)
+
+        checkpoint = BulkLoadCheckpoint(path=checkpoint_path, index=index, fingerprint=fingerprint)
+        create_index(index)
+        checkpoint.save()
+
+    if not checkpoint.exported:
+        export_bulk_documents(table, documents_path, id_field=id_field)
+        checkpoint.exported = True
+        checkpoint.save()
+
+    load_partition_files(
+        es_client,
+        index,
+        list_partition_files(documents_path),
+        checkpoint,
+        batch_size=AdaptiveBatchSize(size=block_size),
+        concurrency=concurrency,
+    )
+
+    _remove_directory(staging_path)
+
+    return index
@@ -1,10 +1,14 @@
 import datetime
 import json
 import re
+import time
 from functools import reduce
 
 import elasticsearch
 import hail as hl
+from loguru import logger
+
+from data_pipeline.helpers.elasticsearch_bulk_load import DEFAULT_CONCURRENCY, bulk_load_table
 
 
 HAIL_TYPE_TO_ES_TYPE_MAPPING = {
@@ -19,6 +23,54 @@ HAIL_TYPE_TO_ES_TYPE_MAPPING = {
 }
 
 
+# Index settings used while loading documents and after loading is complete.
+# A value of None resets a setting to its default. The number of replicas after loading
+# is set by export_table_to_elasticsearch's num_replicas argument.
+# https://www.elastic.co/guide/en/elasticsearch/reference/7.17/tune-for-indexing-speed.html
+INGEST_PROFILES = {
+    "default": {
+        "ingest_settings": {
+            "index.number_of_replicas": 0,
+            "index.refresh_interval": -1,
+            "index.translog.durability": "async",
+            "index.translog.flush_threshold_size": "1gb",
+        },
+        "serving_settings": {
+            "index.refresh_interval": None,
+            "index.translog.durability": None,
+            "index.translog.flush_threshold_size": None,
+        },
+        "max_num_segments": 1,
+    },
+    # For the largest indices, defer merging during the load to the force merge afterwards.
+    # Loading creates many more segments per shard than the merge policy allows, and merging
+    # them while loading competes with indexing for disk I/O.
+    "large": {
+        "ingest_settings": {
+            "index.number_of_replicas": 0,
+            "index.refresh_interval": -1,
+            "index.translog.durability": "async",
+            "index.translog.flush_threshold_size": "2gb",
+            "index.merge.policy.segments_per_tier": 50,
+            "index.merge.policy.max_merge_at_once": 50,
+            "index.merge.scheduler.max_thread_count": 1,
+        },
+        "serving_settings": {
+            "index.refresh_interval": None,
+            "index.translog.durability": None,
+            "index.translog.flush_threshold_size": None,
+            "index.merge.policy.segments_per_tier": None,
+            "index.merge.policy.max_merge_at_once": None,
+            "index.merge.scheduler.max_thread_count": None,
+        },
+        # Merging large shards to a single segment takes a long time for little benefit to search speed.
+        "max_num_segments": 5,
+    },
+}
+
+FORCE_MERGE_POLL_INTERVAL = 60
+
+
 # https://hail.is/docs/0.2/types.html
 # https://www.elastic.co/guide/en/elasticsearch/reference/current/mapping-types.html
 def _elasticsearch_mapping_for_hail_type(dtype):
@@ -93,6 +145,166 @@ def get_index_fields(table, index_fields):
     return {field.split(".")[-1]: _get_index_field(field) for field in index_fields}
 
 
+def get_document_table(table, index_fields=None):
+    """
+    Select the fields exported to Elasticsearch documents from a table.
+
+    If `index_fields` are given, documents contain those fields for searching and the full row in
+    an unindexed `value` field.
+    """
+    table = table.key_by()
+    if index_fields:
+        table = table.select(**get_index_fields(table, index_fields), value=table.row)
+
+    return table
+
+
+def get_elasticsearch_client(host, auth=None, maxsize=10):
+    return elasticsearch.Elasticsearch(
+        host,
+        port=9200,
+        http_auth=auth,
+        maxsize=maxsize,
+        timeout=120,
+        max_retries=5,
+        retry_on_timeout=True,
+    )
+
+
+def update_index_alias(es_client, alias, index, delete_previous_indices=False):
+    """
+    Point an alias at an index, replacing any other indices it points to.
+
+    The alias is moved in a single request, so searches using the alias see either the previous
+    indices or the new index. Returns the names of the previous indices.
+    """
+    if es_client.indices.exists_alias(name=alias):
+        previous_indices = [name for name in es_client.indices.get_alias(name=alias) if name != index]
+    elif es_client.indices.exists(index=alias):
+        raise RuntimeError(f"Unable to create alias {alias}, an index with that name exists")
+    else:
+        previous_indices = []
+
+    actions = [{"remove": {"index": name, "alias": alias}} for name in previous_indices]
+    actions.append({"add": {"index": index, "alias": alias}})
+    es_client.indices.update_aliases(body={"actions": actions})
+    logger.info(f"Moved alias {alias} to {index} from {', '.join(previous_indices) or 'no indices'}")
+
+    if delete_previous_indices:
+        for name in previous_indices:
+            logger.info(f"Deleting index {name}")
+            es_client.indices.delete(index=name)
+
+    return previous_indices
+
+
+DELETE_BATCH_SIZE = 1000
+
+
+def delete_documents(es_client, index, document_ids):
+    """Delete documents from an index by ID. Returns the number of documents deleted."""
+    document_ids = list(document_ids)
+    n_deleted = 0
+    for i in range(0, len(document_ids), DELETE_BATCH_SIZE):
+        body = "".join(
+            json.dumps({"delete": {"_id": document_id}}) + "\n"
+            for document_id in document_ids[i : i + DELETE_BATCH_SIZE]
+        )
+        response = es_client.bulk(index=index, body=body)
+        for item in response["items"]:
+            status = item["delete"]["status"]
+            if status == 200:
+                n_deleted += 1
+            elif status != 404:
+                raise RuntimeError(f"Failed to delete document {item['delete']['_id']} from {index}: {item}")
+
+    return n_deleted
+
+
+def upsert_table_to_elasticsearch(
+    table,
+    host,
+    alias,
+    *,
+    id_field,
+    auth=None,
+    block_size=5000,
+    index_fields=None,
+    delete_ids=(),
+):
+    """
+    Update the documents for a table's rows in the index that an alias points to.
+
+    Documents are written with the same IDs and structure as `export_table_to_elasticsearch`, so existing
+    documents for the table's rows are replaced and new documents are added. Documents with IDs in
+    `delete_ids` are then deleted. Returns the name of the updated index.
+    """
+    es_client = get_elasticsearch_client(host, auth)
+
+    indices = list(es_client.indices.get_alias(name=alias))
+    if len(indices) != 1:
+        raise RuntimeError(f"Alias {alias} must point to exactly one index to update it, not {len(indices)}")
+    index = indices[0]
+
+    export_time = datetime.datetime.utcnow()
+    table = table.select_globals(exported_at=export_time.isoformat(timespec="seconds"), table_globals=table.globals)
+    table = get_document_table(table, index_fields)
+
+    elasticsearch_config = {"es.write.operation": "index", "es.mapping.id": id_field}
+    if auth:
+        elasticsearch_config["es.net.http.auth.user"] = auth[0]
+        elasticsearch_config["es.net.http.auth.pass"] = auth[1]
+
+    logger.info(f"Updating documents in {index}")
+    hl.export_elasticsearch(table, host, 9200, index, "_doc", block_size, elasticsearch_config, True)
+
+    if delete_ids:
+        n_deleted = delete_documents(es_client, index, delete_ids)
+        logger.info(f"Deleted {n_deleted} documents from {index}")
+
+    es_client.indices.refresh(index=index)
+    return index
+
+
+def _segment_count(es_client, index):
+    stats = es_client.indices.stats(index=index, metric="segments")
+    return stats["_all"]["primaries"]["segments"]["count"]
+
+
+def force_merge_index(es_client, index, max_num_segments=1, poll_interval=FORCE_MERGE_POLL_INTERVAL, sleep=time.sleep):
+    """
+    Force merge an index and wait for the merge to complete.
+
+    Force merges of large indices take longer than HTTP request timeouts, so the merge is run
+    as a task and polled for completion.
+    """
+    # Make sure all indexed documents are in segments before merging.
+    es_client.indices.refresh(index=index)
+
+    response = es_client.indices.forcemerge(
+        index=index, max_num_segments=max_num_segments, params={"wait_for_completion": "false"}
+    )
+    task_id = response["task"]
+
+    start_time = time.perf_counter()
+    while True:
+        task = es_client.tasks.get(task_id=task_id)
+        if task["completed"]:
+            break
+
+        elapsed = int(time.perf_counter() - start_time)
+        logger.info(
+            f"Force merging {index}: {_segment_count(es_client, index)} primary segments after {elapsed}s, "
+            f"target {max_num_segments} per shard"
+        )
+        sleep(poll_interval)
+
+    if "error" in task:
+        raise RuntimeError(f"Force merge of {index} failed: {task['error']}")
+
+    logger.info(f"Force merged {index} to {_segment_count(es_client, index)} primary segments")
+
+
 def export_table_to_elasticsearch(
     table,
     host,
@@ -103,17 +315,33 @@ def export_table_to_elasticsearch(
     id_field=None,
     index_fields=None,
     num_shards=1,
+    ingest_profile="default",
+    num_replicas=0,
+    bulk_load_staging_path=None,
+    bulk_load_concurrency=DEFAULT_CONCURRENCY,
 ):
+    """
+    Export a table to a new Elasticsearch index and return the name of the index.
+
+    Index settings from the named ingest profile are applied while loading documents. After loading,
+    the index is force merged to the profile's number of segments per shard and serving settings are applied.
+    Indices are loaded without replicas, and `num_replicas` replicas are added once loading is complete.
+
+    By default, documents are loaded with the ES-Hadoop connector. If `bulk_load_staging_path` is given,
+    documents are instead staged there and loaded with the bulk API, using at most `bulk_load_concurrency`
+    concurrent requests. In that case, a failed export resumes loading into the index it created.
+    """
+    profile = INGEST_PROFILES[ingest_profile]
+
     export_time = datetime.datetime.utcnow()
 
+    if index_fields and id_field and id_field not in [f.split(".")[-1] for f in index_fields]:
+        raise RuntimeError("id_field must be included in index_fields")
+
     table = table.select_globals(exported_at=export_time.isoformat(timespec="seconds"), table_globals=table.globals)
-    table = table.key_by()
+    table = get_document_table(table, index_fields)
 
     if index_fields:
-        if id_field and id_field not in [f.split(".")[-1] for f in index_fields]:
-            raise RuntimeError("id_field must be included in index_fields")
-
-        table = table.select(**get_index_fields(table, index_fields), value=table.row)
         mapping = elasticsearch_mapping_for_table(table, disable_fields=("value",))
     else:
         mapping = elasticsearch_mapping_for_table(table)
@@ -132,49 +360,71 @@ def export_table_to_elasticsearch(
         "settings": {
             "index.codec": "best_compression",
             "index.mapping.total_fields.limit": 10000,
-            "index.number_of_replicas": 0,
             "index.number_of_shards": num_shards,
-            "index.refresh_interval": -1,
+            **profile["ingest_settings"],
         },
     }
 
-    es_client = elasticsearch.Elasticsearch(host, port=9200, http_auth=auth)
+    # Bulk loading uses one connection per worker.
+    es_client = get_elasticsearch_client(host, auth, maxsize=bulk_load_concurrency)
     cluster_name = es_client.cluster.health()["cluster_name"]
 
     index = f"{index}-{export_time.strftime('%Y-%m-%d--%H-%M')}"
 
-    if es_client.indices.exists(index=index):
-        es_client.indices.delete(index=index)
+    def create_index(index):
+        if es_client.indices.exists(index=index):
+            es_client.indices.delete(index=index)
 
-    es_client.indices.create(index=index, body=request_body)
+        es_client.indices.create(index=index, body=request_body)
 
-    # Automatically set shard allocation based on available nodes.
-    # If temporary ingest nodes are present, use them. Otherwise, use existing permanent data nodes.
-    nodes = es_client.cat.nodes(format="json", h="name")  # pylint: disable=unexpected-keyword-arg
-    node_names = [node["name"] for node in nodes]
-    node_sets = set(re.sub(r"-[0-9]+$", "", node_name[len(f"{cluster_name}-es-") :]) for node_name in node_names)
+        # Automatically set shard allocation based on available nodes.
+        # If temporary ingest nodes are present, use them. Otherwise, use existing permanent data nodes.
+        nodes = es_client.cat.nodes(format="json", h="name")  # pylint: disable=unexpected-keyword-arg
+        node_names = [node["name"] for node in nodes]
+        node_sets = set(re.sub(r"-[0-9]+$", "", node_name[len(f"{cluster_name}-es-") :]) for node_name in node_names)
 
-    if "ingest" in node_sets:
-        es_client.indices.put_settings(
-            index=index, body={"index.routing.allocation.require._name": f"{cluster_name}-es-ingest-*"}
-        )
-    else:
-        data_node_sets = [node_set for node_set in node_sets if node_set.startswith("data-")]
-        if len(data_node_sets) == 1:
+        if "ingest" in node_sets:
             es_client.indices.put_settings(
-                index=index,
-                body={"index.routing.allocation.require._name": f"{cluster_name}-es-{data_node_sets[0]}-*"},
+                index=index, body={"index.routing.allocation.require._name": f"{cluster_name}-es-ingest-*"}
             )
+        else:
+            data_node_sets = [node_set for node_set in node_sets if node_set.startswith("data-")]
+            if len(data_node_sets) == 1:
+                es_client.indices.put_settings(
+                    index=index,
+                    body={"index.routing.allocation.require._name": f"{cluster_name}-es-{data_node_sets[0]}-*"},
+                )
+
+    if bulk_load_staging_path:
+        index = bulk_load_table(
+            es_client,
+            table,
+            index,
+            bulk_load_staging_path,
+            create_index=create_index,
+            id_field=id_field,
+            block_size=block_size,
+            concurrency=bulk_load_concurrency,
+        )
+    else:
+        create_index(index)
 
-    elasticsearch_config = {"es.write.operation": "index"}
+        elasticsearch_config = {"es.write.operation": "index"}
 
-    if auth:
-        elasticsearch_config["es.net.http.auth.user"] = auth[0]
-        elasticsearch_config["es.net.http.auth.pass"] = auth[1]
+        if auth:
+            elasticsearch_config["es.net.http.auth.user"] = auth[0]
+            elasticsearch_config["es.net.http.auth.pass"] = auth[1]
+
+        if id_field is not None:
+            elasticsearch_config["es.mapping.id"] = id_field
+
+        hl.export_elasticsearch(table, host, 9200, index, type_name, block_size, elasticsearch_config, True)
 
-    if id_field is not None:
-        elasticsearch_config["es.mapping.id"] = id_field
+    force_merge_index(es_client, index, max_num_segments=profile["max_num_segments"])
 
-    hl.export_elasticsearch(table, host, 9200, index, type_name, block_size, elasticsearch_config, True)
+    logger.info(f"Applying serving settings to {index}")
+    es_client.indices.put_settings(
+        index=index, body={**profile["serving_settings"], "index.number_of_replicas": num_replicas}
+    )
 
-    es_client.indices.forcemerge(index=index)
+    return index
@@ -0,0 +1,198 @@
+"""
+Check that an Elasticsearch index contains the documents exported from a Hail table.
+
+Validation compares:
+
+- The number of rows in the table with the number of documents in the index.
+- The number of rows and documents per contig, for tables with a `locus` or `xpos` field.
+  Missing documents from a partially failed export are usually concentrated in a few contigs.
+- The content of a random sample of documents, for tables exported with document IDs.
+
+Row counts are computed in one pass over the table that only reads the locus/xpos field. Sampled
+documents are taken from a random subset of partitions, so the cost of the sample does not grow
+with the size of the table.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import random
+from typing import Dict, List, Optional, Tuple
+
+import attr
+import hail as hl
+from loguru import logger
+
+from data_pipeline.helpers.elasticsearch_export import get_document_table
+
+
+DEFAULT_SAMPLE_SIZE = 1_000
+
+DEFAULT_SAMPLE_PARTITIONS = 16
+
+MGET_BATCH_SIZE = 100
+
+# Positions in xpos are offset by contig number times this.
+XPOS_CONTIG_MULTIPLIER = 1_000_000_000
+
+
+@attr.define
+class IndexValidationResult:
+    index: str
+    row_count: int
+    document_count: int
+    contig_counts: Dict[str, Tuple[int, int]] = attr.Factory(dict)
+    sampled_documents: int = 0
+    missing_documents: List[str] = attr.Factory(list)
+    mismatched_documents: List[str] = attr.Factory(list)
+
+    @property
+    def mismatched_contigs(self) -> Dict[str, Tuple[int, int]]:
+        return {
+            contig: (row_count, document_count)
+            for contig, (row_count, document_count) in self.contig_counts.items()
+            if row_count != document_count
+        }
+
+    @property
+    def is_valid(self) -> bool:
+        return (
+            self.row_count == self.document_count
+            and not self.mismatched_contigs
+            and not self.missing_documents
+            and not self.mismatched_documents
+        )
+
+    def summary(self) -> str:
+        lines = [f"{self.index}: {self.document_count} documents, {self.row_count} rows"]
+        for contig, (row_count, document_count) in sorted(self.mismatched_contigs.items()):
+            lines.append(f"    contig {contig}: {document_count} documents, {row_count} rows")
+        if self.sampled_documents:
+            lines.append(
+                f"    {self.sampled_documents} sampled documents: {len(self.missing_documents)} missing, "
+                f"{len(self.mismatched_documents)} changed"
+            )
+            for document_id in self.missing_documents[:10]:
+                lines.append(f"        missing {document_id}")
+            for document_id in self.mismatched_documents[:10]:
+                lines.append(f"        changed {document_id}")
+
+        return "\n".join(lines)
+
+
+def _normalize_document(value):
+    # Documents loaded through ES-Hadoop may omit null fields and format floats differently from Hail.
+    if isinstance(value, dict):
+        return {key: _normalize_document(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [_normalize_document(item) for item in value]
+    if isinstance(value, float):
+        return float(f"{value:.6g}")
+    return value
+
+
+def document_hash(document) -> str:
+    normalized = json.dumps(_normalize_document(document), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf8")).hexdigest()
+
+
+def _contig_buckets(documents) -> Tuple[Optional[hl.Expression], Optional[dict]]:
+    """Return expressions for the contig of each table row and an aggregation for contigs of documents."""
+    if "locus" in documents.row and isinstance(documents.locus.dtype, hl.tlocus):
+        return documents.locus.contig, {"terms": {"field": "locus.contig", "size": 10_000}}
+
+    if "xpos" in documents.row:
+        return (
+            hl.str(hl.int32(documents.xpos // XPOS_CONTIG_MULTIPLIER)),
+            {"histogram": {"field": "xpos", "interval": XPOS_CONTIG_MULTIPLIER, "min_doc_count": 1}},
+        )
+
+    return None, None
+
+
+def _document_contig_counts(es_client, index, aggregation) -> Dict[str, int]:
+    response = es_client.search(index=index, body={"size": 0, "aggs": {"contigs": aggregation}})
+    buckets = response["aggregations"]["contigs"]["buckets"]
+    if "histogram" in aggregation:
+        return {str(int(bucket["key"]) // XPOS_CONTIG_MULTIPLIER): bucket["doc_count"] for bucket in buckets}
+
+    return {bucket["key"]: bucket["doc_count"] for bucket in buckets}
+
+
+def _sample_documents(documents, row_count, id_field, sample_size, sample_partitions, seed) -> List[Tuple[str, str]]:
+    n_partitions = documents.n_partitions()
+    partitions = sorted(random.Random(seed).sample(range(n_partitions), min(sample_partitions, n_partitions)))
+    sample = documents._filter_partitions(partitions)  # pylint: disable=protected-access
+
+    # Sample more rows than needed, since the number of rows in each partition is not known.
+    fraction = min(1.0, 2 * sample_size * n_partitions / max(1, len(partitions)) / max(1, row_count))
+    sample = sample.sample(fraction, seed=seed)
+    sample = sample.select(document_id=hl.str(sample[id_field]), document=hl.json(sample.row))
+
+    return [(row.document_id, row.document) for row in sample.take(sample_size)]
+
+
+def _get_documents(es_client, index, document_ids: List[str]) -> Dict[str, dict]:
+    response = es_client.mget(index=index, body={"ids": document_ids})
+    return {document["_id"]: document["_source"] for document in response["docs"] if document.get("found")}
+
+
+def validate_index(
+    es_client,
+    table,
+    index,
+    *,
+    id_field=None,
+    index_fields=None,
+    sample_size=DEFAULT_SAMPLE_SIZE,
+    sample_partitions=DEFAULT_SAMPLE_PARTITIONS,
+    seed=0,
+    concurrency=8,
+) -> IndexValidationResult:
+    """
+    Compare the contents of an index with the table it was exported from.
+
+    `id_field` and `index_fields` should be the same as those used to export the table. Documents
+    can only be sampled from indices with an `id_field`.
+    """
+    documents = get_document_table(table, index_fields)
+
+    es_client.indices.refresh(index=index)
+    document_count = es_client.count(index=index)["count"]
+
+    contig, contig_aggregation = _contig_buckets(documents)
+    if contig is not None:
+        table_counts = documents.aggregate(hl.struct(count=hl.agg.count(), contigs=hl.agg.counter(contig)))
+        row_count = table_counts.count
+        document_contig_counts = _document_contig_counts(es_client, index, contig_aggregation)
+        contig_counts = {
+            contig: (table_counts.contigs.get(contig, 0), document_contig_counts.get(contig, 0))
+            for contig in set(table_counts.contigs) | set(document_contig_counts)
+        }
+    else:
+        row_count = documents.count()
+        contig_counts = {}
+
+    result = IndexValidationResult(
+        index=index, row_count=row_count, document_count=document_count, contig_counts=contig_counts
+    )
+
+    if id_field and sample_size:
+        sample = _sample_documents(documents, row_count, id_field, sample_size, sample_partitions, seed)
+        document_ids = [document_id for document_id, _ in sample]
+
+        indexed_documents = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            batches = [document_ids[i : i + MGET_BATCH_SIZE] for i in range(0, len(document_ids), MGET_BATCH_SIZE)]
+            for batch_documents in executor.map(lambda batch: _get_documents(es_client, index, batch), batches):
+                indexed_documents.update(batch_documents)
+
+        result.sampled_documents = len(sample)
+        for document_id, document in sample:
+            if document_id not in indexed_documents:
+                result.missing_documents.append(document_id)
+            elif document_hash(json.loads(document)) != document_hash(indexed_documents[document_id]):
+                result.mismatched_documents.append(document_id)
+
+    logger.info(f"Validated {index}\n{result.summary()}")
+    return result
@@ -0,0 +1,105 @@
+import datetime
+import json
+import posixpath
+from typing import List, Optional, Tuple
+
+import hail as hl
+
+from data_pipeline.data_types.locus import normalized_contig
+from data_pipeline.helpers.parquet_reader import PARQUET_METADATA_FILE
+from data_pipeline.pipeline import _file_system
+
+PARQUET_PARTITION_FIELD = "chrom"
+
+_ARROW_PRIMITIVE_TYPES = {
+    hl.tbool: "bool",
+    hl.tint32: "int32",
+    hl.tint64: "int64",
+    hl.tfloat32: "float",
+    hl.tfloat64: "double",
+    hl.tstr: "string",
+}
+
+
+def arrow_type_name(dtype: hl.HailType) -> str:
+    """
+    Name of the Arrow type that a Parquet column written from an expanded Hail type is read as.
+
+    Only the types left by `hl.Table.expand_types` are supported. Spark writes arrays as Parquet
+    lists with an "element" field.
+    """
+    if dtype in _ARROW_PRIMITIVE_TYPES:
+        return _ARROW_PRIMITIVE_TYPES[dtype]
+
+    if isinstance(dtype, hl.tarray):
+        return f"list<element: {arrow_type_name(dtype.element_type)}>"
+
+    if isinstance(dtype, hl.tstruct):
+        return f"struct<{', '.join(f'{name}: {arrow_type_name(field_type)}' for name, field_type in dtype.items())}>"
+
+    raise ValueError(f"Unsupported type for Parquet export: {dtype}")
+
+
+def _with_partition_field(table: hl.Table) -> Tuple[hl.Table, List[str]]:
+    if PARQUET_PARTITION_FIELD in table.row:
+        return table, [PARQUET_PARTITION_FIELD]
+
+    if "locus" in table.row and isinstance(table.locus.dtype, hl.tlocus):
+        table = table.annotate(**{PARQUET_PARTITION_FIELD: normalized_contig(table.locus.contig)})
+        return table, [PARQUET_PARTITION_FIELD]
+
+    return table, []
+
+
+def _has_parquet_files(output_path: str) -> bool:
+    return any(not posixpath.basename(f["path"]).startswith(("_", ".")) for f in hl.hadoop_ls(output_path))
+
+
+def export_table_to_parquet(table: hl.Table, output_path: str, dataset: Optional[str] = None) -> dict:
+    """
+    Write a Hail Table to Parquet files that can be read without Hail or Spark.
+
+    Locus, interval, set, dict, and tuple fields are expanded to structs and arrays with
+    `hl.Table.expand_types`, and all other fields keep their nesting. Tables with a `chrom` or
+    `locus` field are partitioned into a directory for each chromosome, so readers can skip files
+    for other chromosomes.
+
+    The table's key, Hail and Arrow schemas, globals, and row count are written to a metadata
+    file alongside the Parquet files. Returns the metadata.
+
+    A table with no rows is written as a single Parquet file with no rows, so that it can still be
+    opened and its schema read.
+    """
+    output_path = output_path.rstrip("/")
+    table, partition_by = _with_partition_field(table)
+
+    # expand_types sorts tables by their key, which does not require a shuffle for tables read from disk.
+    expanded_table = table.expand_types()
+    df = expanded_table.to_spark(flatten=False)
+    df.write.parquet(output_path, mode="overwrite", partitionBy=partition_by or None)
+    if not _has_parquet_files(output_path):
+        # Spark writes no files for a table with no rows when partitioning by a field, which leaves readers
+        # without a schema. Write a single file with no rows instead, with the partition field as a column.
+        df.limit(0).coalesce(1).write.parquet(output_path, mode="overwrite")
+
+    metadata = {
+        "dataset": dataset,
+        "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+        "key": list(table.key),
+        "partition_by": partition_by,
+        "row_type": str(table.row.dtype),
+        "arrow_schema": {
+            field: arrow_type_name(field_type)
+            for field, field_type in expanded_table.row.dtype.items()
+            if field not in partition_by
+        },
+        "globals": json.loads(hl.eval(hl.json(table.globals))),
+        # Spark counts rows from the Parquet footers without reading any columns.
+        "rows": df.sparkSession.read.parquet(output_path).count(),
+    }
+
+    metadata_path = f"{output_path}/{PARQUET_METADATA_FILE}"
+    with _file_system(metadata_path).open(metadata_path, "w") as f:
+        f.write(json.dumps(metadata, indent=2, sort_keys=True))
+
+    return metadata
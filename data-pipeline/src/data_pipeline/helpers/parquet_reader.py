@@ -0,0 +1,76 @@
+# Read tables written by the export_to_parquet pipeline without Hail, Spark, or a JVM.
+#
+# This module requires pyarrow, which is not a dependency of the data pipeline itself. It does not import
+# Hail, so it can be used from notebooks and services that only install pyarrow.
+
+import json
+import os
+from typing import List, Optional
+
+# Readers skip files whose names start with "_" when listing a dataset's Parquet files.
+PARQUET_METADATA_FILE = "_table_metadata.json"
+
+
+def _file_system(path):
+    from pyarrow import fs  # pylint: disable=import-outside-toplevel
+
+    if "://" not in path:
+        path = os.path.abspath(path)
+
+    file_system, base_path = fs.FileSystem.from_uri(path)
+    if isinstance(file_system, fs.LocalFileSystem):
+        # Memory-map local files, so that reading a column maps its pages instead of copying them.
+        file_system = fs.LocalFileSystem(use_mmap=True)
+
+    return file_system, base_path.rstrip("/")
+
+
+def read_parquet_metadata(path) -> dict:
+    """Read the metadata written alongside a table exported to Parquet."""
+    file_system, base_path = _file_system(path)
+    with file_system.open_input_stream(f"{base_path}/{PARQUET_METADATA_FILE}") as f:
+        return json.loads(f.read())
+
+
+def open_parquet_table(path):
+    """
+    Open a table exported to Parquet as a `pyarrow.dataset.Dataset`.
+
+    Files are memory-mapped when the table is on a local disk. Chromosome directories are read as
+    a string `chrom` field, so filtering on it skips files for other chromosomes.
+    """
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+
+    metadata = read_parquet_metadata(path)
+    partitioning = None
+    if metadata["partition_by"]:
+        partitioning = ds.partitioning(
+            pa.schema([(field, pa.string()) for field in metadata["partition_by"]]), flavor="hive"
+        )
+
+    file_system, base_path = _file_system(path)
+    return ds.dataset(base_path, filesystem=file_system, format="parquet", partitioning=partitioning)
+
+
+def read_parquet_table(path, columns: Optional[List[str]] = None, chroms: Optional[List[str]] = None, row_filter=None):
+    """
+    Read a table exported to Parquet into a `pyarrow.Table`.
+
+    Only the Parquet columns for `columns` are read. Nested fields can be selected with dotted
+    paths, such as "locus.position", which are returned as top level columns with that name.
+    Rows can be limited to `chroms` and to rows matching `row_filter`, a `pyarrow.compute` expression.
+    """
+    import pyarrow.compute as pc  # pylint: disable=import-outside-toplevel
+
+    dataset = open_parquet_table(path)
+
+    if chroms is not None:
+        chroms_filter = pc.field("chrom").isin(chroms)
+        row_filter = chroms_filter if row_filter is None else chroms_filter & row_filter
+
+    projection = None
+    if columns is not None:
+        projection = {column: pc.field(*column.split(".")) for column in columns}
+
+    return dataset.to_table(columns=projection, filter=row_filter)
@@ -1,9 +1,20 @@
 import argparse
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import inspect
+import json
+import math
 import os
+import posixpath
+import re
 import shutil
+import stat
+import statistics
 import subprocess
-import tempfile
+import sys
+import threading
 import time
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Union
@@ -13,11 +24,71 @@ from collections import OrderedDict
 from loguru import logger
 
 import hail as hl
+from pyspark import SparkContext
 
 from data_pipeline.config import PipelineConfig
+from data_pipeline.helpers.download import download_file
+from data_pipeline.helpers.timestamp import generate_iso_timestamp_for_filename
 
 
-class GoogleCloudStorageFileSystem:
+class FileSystem:
+    """
+    Operations used to check pipeline outputs and inputs.
+
+    Stat results are dicts in the format returned by `hl.hadoop_stat`, with "path", "is_dir",
+    "size_bytes", and "modification_time" keys.
+    """
+
+    # Whether fingerprints are computed from file contents or only from file metadata.
+    fingerprints_content = False
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def modified_time(self, path):
+        stat_result = self.stat(path)
+        if stat_result is None:
+            raise FileNotFoundError(path)
+
+        return stat_result["modification_time"]
+
+    def stat(self, path) -> Optional[dict]:
+        raise NotImplementedError
+
+    def ls(self, path) -> List[dict]:
+        raise NotImplementedError
+
+    def open(self, path, mode="r"):
+        raise NotImplementedError
+
+    def read_text(self, path):
+        with self.open(path, "r") as f:
+            return f.read()
+
+    def disk_usage(self, path) -> int:
+        raise NotImplementedError
+
+    def fingerprint(self, path):
+        return _stat_fingerprint(self.stat(path))
+
+    def table_fingerprint(self, path):
+        # Hail Tables are identified by their table and row metadata, which include the schema and
+        # partitioning and change whenever the table is rewritten.
+        digest = hashlib.sha256()
+        for metadata_file in ("metadata.json.gz", "rows/metadata.json.gz"):
+            with self.open(f"{path}/{metadata_file}", "rb") as f:
+                digest.update(_checksum(f, "sha256").encode("utf-8"))
+        return f"table={digest.hexdigest()}"
+
+    def invalidate(self, path):
+        pass
+
+
+class GoogleCloudStorageFileSystem(FileSystem):
+    # Reading a whole object through the Hadoop FS to checksum it is slow for large files,
+    # so objects in GCS are identified by size and modification time instead.
+    fingerprints_content = False
+
     def exists(self, path):  # pylint: disable=no-self-use
         return hl.hadoop_exists(path)
 
@@ -31,8 +102,28 @@ class GoogleCloudStorageFileSystem:
         stat = hl.hadoop_stat(path)
         return stat["modification_time"]
 
+    def stat(self, path):  # pylint: disable=no-self-use
+        if not hl.hadoop_exists(path):
+            return None
+
+        return hl.hadoop_stat(path)
+
+    def ls(self, path):  # pylint: disable=no-self-use
+        return hl.hadoop_ls(path)
+
+    def open(self, path, mode="r"):  # pylint: disable=no-self-use
+        return hl.hadoop_open(path, mode)
+
+    def disk_usage(self, path):  # pylint: disable=no-self-use
+        # Listing a Hail Table through the Hadoop FS takes a call per directory, and tables
+        # have a directory per partition in their index.
+        output = subprocess.check_output(["gsutil", "du", "-s", path]).decode("utf8")
+        return int(output.split()[0])
+
+
+class LocalFileSystem(FileSystem):
+    fingerprints_content = True
 
-class LocalFileSystem:
     def exists(self, path):  # pylint: disable=no-self-use
         return os.path.isfile(path)
 
@@ -40,32 +131,643 @@ class LocalFileSystem:
         stat_result = os.stat(path)
         return datetime.datetime.fromtimestamp(stat_result.st_mtime)
 
+    def stat(self, path):  # pylint: disable=no-self-use
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        return _local_stat(path, stat_result)
+
+    def ls(self, path):  # pylint: disable=no-self-use
+        with os.scandir(path) as entries:
+            return [_local_stat(entry.path, entry.stat()) for entry in entries]
+
+    def open(self, path, mode="r"):  # pylint: disable=no-self-use
+        return open(path, mode)
+
+    def disk_usage(self, path):  # pylint: disable=no-self-use
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+    def fingerprint(self, path):  # pylint: disable=no-self-use
+        with open(path, "rb") as f:
+            return f"size={os.path.getsize(path)},md5={_checksum(f)}"
+
+
+def _local_stat(path, stat_result):
+    return {
+        "path": path,
+        "is_dir": stat.S_ISDIR(stat_result.st_mode),
+        "size_bytes": stat_result.st_size,
+        "modification_time": datetime.datetime.fromtimestamp(stat_result.st_mtime),
+    }
+
+
+def _stat_fingerprint(stat_result):
+    return f"size={stat_result['size_bytes']},modified={stat_result['modification_time']}"
+
+
+def _normalize_path(path):
+    scheme, separator, rest = path.rpartition("://")
+    return scheme + separator + re.sub("/+", "/", rest).rstrip("/")
+
+
+def _backend_file_system(path) -> FileSystem:
+    return GoogleCloudStorageFileSystem() if path.startswith("gs://") else LocalFileSystem()
+
+
+class CachedFileSystem(FileSystem):
+    """
+    Memoizes file system lookups for the duration of a pipeline run.
+
+    The first lookup of a path lists its parent directory and caches the stats of every entry in it,
+    so checking the outputs and inputs of all tasks costs one listing per directory instead of a
+    round trip per path. Cached results are invalidated when a path is written through this file
+    system or by a call to `invalidate`.
+    """
+
+    def __init__(self, backend_for_path: Callable[[str], FileSystem] = _backend_file_system):
+        self._backend_for_path = backend_for_path
+        self._lock = threading.RLock()
+        self._stats: Dict[str, Optional[dict]] = {}
+        self._listed_directories = set()
+        self._memoized: Dict[tuple, object] = {}
+
+    def _memoize(self, key, compute):
+        with self._lock:
+            if key in self._memoized:
+                return self._memoized[key]
+
+        value = compute()
+        with self._lock:
+            self._memoized[key] = value
+
+        return value
+
+    def stat(self, path):
+        path = _normalize_path(path)
+        directory = posixpath.dirname(path)
+
+        with self._lock:
+            if path in self._stats:
+                return self._stats[path]
+
+            if directory in self._listed_directories:
+                return None
+
+        backend = self._backend_for_path(path)
+        try:
+            entries = backend.ls(directory)
+        except Exception:  # pylint: disable=broad-except
+            # Listing fails if the directory does not exist. Fall back to checking this path alone.
+            stat_result = backend.stat(path)
+            with self._lock:
+                self._stats[path] = stat_result
+            return stat_result
+
+        with self._lock:
+            for entry in entries:
+                self._stats[_normalize_path(entry["path"])] = entry
+            self._listed_directories.add(directory)
+            return self._stats.get(path)
+
+    def ls(self, path):
+        path = _normalize_path(path)
+        entries = self._backend_for_path(path).ls(path)
+        with self._lock:
+            for entry in entries:
+                self._stats[_normalize_path(entry["path"])] = entry
+            self._listed_directories.add(path)
+
+        return entries
+
+    def open(self, path, mode="r"):
+        if any(c in mode for c in "wx"):
+            self.invalidate(path)
+
+        return self._backend_for_path(path).open(path, mode)
+
+    def disk_usage(self, path):
+        return self._backend_for_path(path).disk_usage(path)
+
+    def read_text(self, path):
+        return self._memoize(("read_text", _normalize_path(path)), lambda: self._backend_for_path(path).read_text(path))
+
+    def fingerprint(self, path):
+        backend = self._backend_for_path(path)
+        if backend.fingerprints_content:
+            return self._memoize(("fingerprint", _normalize_path(path)), lambda: backend.fingerprint(path))
+
+        return _stat_fingerprint(self.stat(path))
+
+    def table_fingerprint(self, path):
+        return self._memoize(
+            ("table_fingerprint", _normalize_path(path)), lambda: FileSystem.table_fingerprint(self, path)
+        )
+
+    def invalidate(self, path):
+        path = _normalize_path(path)
+
+        def is_affected(p):
+            return p == path or p.startswith(path + "/")
+
+        with self._lock:
+            self._stats = {p: s for p, s in self._stats.items() if not is_affected(p)}
+            self._memoized = {k: v for k, v in self._memoized.items() if not is_affected(k[1])}
+            self._listed_directories = {d for d in self._listed_directories if not is_affected(d)}
+            self._listed_directories.discard(posixpath.dirname(path))
+
+
+_run_file_system: Optional[CachedFileSystem] = None
+
+
+@contextlib.contextmanager
+def cached_file_system():
+    """Cache file system lookups made by pipeline tasks within this context."""
+    global _run_file_system  # pylint: disable=global-statement
+    previous_file_system = _run_file_system
+    _run_file_system = CachedFileSystem()
+    try:
+        yield _run_file_system
+    finally:
+        _run_file_system = previous_file_system
+
+
+def _file_system(path) -> FileSystem:
+    return _run_file_system or _backend_file_system(path)
+
+
+class TableRegistry:
+    """
+    Opens each Hail Table once for the duration of a pipeline run.
+
+    `hl.read_table` loads a table's metadata to determine its type and partitioning, so tasks that
+    read the same path share the Table returned by the first read. Small tables that many tasks join
+    against can be persisted the first time they are read with `persist=True`, after which all reads
+    of that path return the persisted table. Entries are dropped, and persisted tables unpersisted,
+    when a task rewrites the table or the run ends.
+    """
+
+    def __init__(self, read: Callable[[str], hl.Table] = hl.read_table):
+        self._read = read
+        self._lock = threading.RLock()
+        self._tables: Dict[str, hl.Table] = {}
+        self._persisted: Dict[str, hl.Table] = {}
+
+    def read_table(self, path, persist=False) -> hl.Table:
+        path = _normalize_path(path)
+        with self._lock:
+            if path in self._persisted:
+                return self._persisted[path]
+
+            table = self._tables.get(path)
+
+        if table is None:
+            table = self._read(path)
+            with self._lock:
+                table = self._tables.setdefault(path, table)
+
+        if persist:
+            persisted_table = table.persist()
+            with self._lock:
+                if path not in self._persisted:
+                    self._persisted[path] = persisted_table
+                    persisted_table = None
+                table = self._persisted[path]
+
+            # Another task persisted this table first.
+            if persisted_table is not None:
+                persisted_table.unpersist()
+
+        return table
+
+    def invalidate(self, path):
+        path = _normalize_path(path)
+
+        def is_affected(p):
+            return p == path or p.startswith(path + "/")
+
+        with self._lock:
+            self._tables = {p: t for p, t in self._tables.items() if not is_affected(p)}
+            unpersist = [t for p, t in self._persisted.items() if is_affected(p)]
+            self._persisted = {p: t for p, t in self._persisted.items() if not is_affected(p)}
+
+        for table in unpersist:
+            table.unpersist()
+
+    def close(self):
+        with self._lock:
+            persisted = list(self._persisted.values())
+            self._tables = {}
+            self._persisted = {}
+
+        for table in persisted:
+            table.unpersist()
+
+
+_run_table_registry: Optional[TableRegistry] = None
+
+
+@contextlib.contextmanager
+def table_registry():
+    """Share Hail Tables read by pipeline tasks within this context."""
+    global _run_table_registry  # pylint: disable=global-statement
+    previous_table_registry = _run_table_registry
+    _run_table_registry = TableRegistry()
+    try:
+        yield _run_table_registry
+    finally:
+        _run_table_registry.close()
+        _run_table_registry = previous_table_registry
+
+
+def read_table(path, persist=False) -> hl.Table:
+    """
+    Read a Hail Table, reusing the table opened by an earlier task in the current pipeline run.
+
+    `persist` should only be used for small tables that are joined against by several tasks. It has
+    no effect outside of a pipeline run.
+    """
+    if _run_table_registry:
+        return _run_table_registry.read_table(path, persist=persist)
+
+    return hl.read_table(path)
+
+
+def _invalidate_table(path):
+    if _run_table_registry:
+        _run_table_registry.invalidate(path)
+
 
 def file_exists(path):
-    file_system = GoogleCloudStorageFileSystem() if path.startswith("gs://") else LocalFileSystem()
+    file_system = _file_system(path)
     check_path = path + "/_SUCCESS" if path.endswith(".ht") else path
     return file_system.exists(check_path)
 
 
 def modified_time(path):
-    file_system = GoogleCloudStorageFileSystem() if path.startswith("gs://") else LocalFileSystem()
+    file_system = _file_system(path)
     check_path = path + "/_SUCCESS" if path.endswith(".ht") else path
     return file_system.modified_time(check_path)
 
 
+def _checksum(f, algorithm="md5", chunk_size=1 << 20):
+    digest = hashlib.new(algorithm)
+    for chunk in iter(lambda: f.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hash_json(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(path):
+    """Fingerprint the current contents of a file or Hail Table."""
+    path = path.rstrip("/")
+    file_system = _file_system(path)
+    if path.endswith(".ht"):
+        return file_system.table_fingerprint(path)
+
+    return file_system.fingerprint(path)
+
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def manifest_path(path):
+    return path.rstrip("/") + MANIFEST_SUFFIX
+
+
+def read_manifest(path) -> Optional[dict]:
+    path = manifest_path(path)
+    file_system = _file_system(path)
+    if not file_system.exists(path):
+        return None
+
+    return json.loads(file_system.read_text(path))
+
+
+def write_manifest(path, manifest: dict):
+    path = manifest_path(path)
+    with _file_system(path).open(path, "w") as f:
+        f.write(json.dumps(manifest, indent=2, sort_keys=True))
+
+
+# Number of past run times kept in each output's manifest for estimating task durations.
+ELAPSED_HISTORY_LENGTH = 10
+
+
+def _elapsed_history(path, elapsed) -> List[float]:
+    previous_manifest = read_manifest(path) or {}
+    return (previous_manifest.get("elapsed_history", []) + [round(elapsed, 1)])[-ELAPSED_HISTORY_LENGTH:]
+
+
+def estimated_duration(path) -> Optional[float]:
+    """Estimate how long it takes to produce an output from the run times recorded in its manifest."""
+    manifest = read_manifest(path)
+    if not manifest or not manifest.get("elapsed_history"):
+        return None
+
+    return statistics.median(manifest["elapsed_history"])
+
+
+def estimated_output_size(path) -> Optional[int]:
+    """Estimate the size of an output from the size recorded in its manifest when it was last written."""
+    manifest = read_manifest(path)
+    if not manifest:
+        return None
+
+    return manifest.get("output_size_bytes")
+
+
+# Table IR nodes with the same partitioning as their child.
+_PARTITION_PRESERVING_TABLE_IRS = (hl.ir.TableMapRows, hl.ir.TableMapGlobals, hl.ir.TableFilter)
+# Table IR nodes whose partitioning is known without computing any rows.
+_PARTITIONED_SOURCE_TABLE_IRS = (hl.ir.TableRead, hl.ir.TableRange)
+
+
+def known_n_partitions(table: hl.Table) -> Optional[int]:
+    """
+    Number of partitions in a table, if it can be found without computing the table.
+
+    That is the case for tables read from disk and for row, global, and filter maps over them. For other
+    tables, such as ones keyed by an unsorted field or grouped, `n_partitions` runs the upstream
+    shuffle to find the partition count, and the table is then computed again when it is written.
+    """
+    tir = table._tir  # pylint: disable=protected-access
+    while isinstance(tir, _PARTITION_PRESERVING_TABLE_IRS):
+        tir = tir.children[0]
+
+    if not isinstance(tir, _PARTITIONED_SOURCE_TABLE_IRS):
+        return None
+
+    return table.n_partitions()
+
+
+@attr.define
+class OutputPolicy:
+    """
+    Chooses the number of partitions a task's output Hail Table is written with.
+
+    The partition count is chosen so that each partition holds about `target_partition_bytes`,
+    based on the estimated size of the output. Tables with too many partitions are combined with
+    `naive_coalesce`, which merges adjacent partitions without a shuffle. Tables with too few
+    partitions are shuffled with `repartition`. Partition counts within a factor of `tolerance` of
+    the target are left unchanged.
+
+    Outputs with no size estimate, which is the case on a task's first run, are shuffled into
+    `default_partitions` partitions if it is set and otherwise keep the task's partitioning.
+
+    Tables whose partition count is not known without computing them are not counted. They are
+    only combined with `naive_coalesce`, which does nothing to tables with at most the target
+    number of partitions.
+    """
+
+    target_partition_bytes: int = 128 * 1024 * 1024
+    max_partitions: int = 10_000
+    tolerance: float = 2.0
+    default_partitions: Optional[int] = None
+
+    def target_partitions(self, estimated_size_bytes: int) -> int:
+        return max(1, min(self.max_partitions, math.ceil(estimated_size_bytes / self.target_partition_bytes)))
+
+    def apply(self, table: hl.Table, estimated_size_bytes: Optional[int]):
+        """Repartition `table` for writing. Returns the table and a description of what was done."""
+        policy = {"target_partition_bytes": self.target_partition_bytes, "estimated_size_bytes": estimated_size_bytes}
+        if estimated_size_bytes is None:
+            if self.default_partitions is None:
+                return table, {**policy, "method": "unchanged"}
+
+            table = table.repartition(self.default_partitions, shuffle=True)
+            return table, {**policy, "partitions": self.default_partitions, "method": "default"}
+
+        target_partitions = self.target_partitions(estimated_size_bytes)
+        partitions = known_n_partitions(table)
+        policy.update(input_partitions=partitions, partitions=partitions)
+
+        if partitions is None:
+            table = table.naive_coalesce(target_partitions)
+            return table, {**policy, "method": "naive_coalesce"}
+
+        if partitions > target_partitions * self.tolerance:
+            table = table.naive_coalesce(target_partitions)
+            return table, {**policy, "partitions": target_partitions, "method": "naive_coalesce"}
+
+        if partitions * self.tolerance < target_partitions:
+            table = table.repartition(target_partitions, shuffle=True)
+            return table, {**policy, "partitions": target_partitions, "method": "repartition"}
+
+        return table, {**policy, "method": "unchanged"}
+
+
+def format_duration(seconds):
+    return f"{int(seconds // 60)}m{seconds % 60:02.0f}s"
+
+
+def _remove_directory(path):
+    if path.startswith("gs://"):
+        subprocess.check_call(["gsutil", "-m", "-q", "rm", "-r", path])
+    else:
+        shutil.rmtree(path)
+
+
+def checkpoints_root(output_path):
+    return output_path.rstrip("/") + ".checkpoints"
+
+
+@attr.define
+class TaskCheckpoints:
+    """
+    Intermediate tables written by a task function while producing its output.
+
+    Each checkpoint is identified by the task's fingerprints and its name, so if the task fails
+    after writing a checkpoint, a retry with the same inputs, code, and parameters reads it instead
+    of recomputing it. Checkpoints are removed once the task's output has been written.
+    """
+
+    root: str
+    fingerprint: str
+    _read: Callable[[str], hl.Table] = hl.read_table
+    # Whether each checkpoint used by the current run of the task was "reused" or "written".
+    used: Dict[str, str] = attr.Factory(dict)
+
+    def checkpoint(self, table: hl.Table, name: str) -> hl.Table:
+        path = f"{self.root}/{name}.ht"
+        fingerprint = _hash_json({"task": self.fingerprint, "checkpoint": name})
+
+        manifest = read_manifest(path)
+        if manifest and manifest.get("fingerprint") == fingerprint and file_exists(path):
+            logger.info(f"Reusing checkpoint {path}")
+            self.used[name] = "reused"
+            return self._read(path)
+
+        if not path.startswith("gs://"):
+            Path(self.root).mkdir(parents=True, exist_ok=True)
+
+        table = table.checkpoint(path, overwrite=True)
+        _file_system(path).invalidate(self.root)
+        write_manifest(
+            path, {"fingerprint": fingerprint, "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds")}
+        )
+        self.used[name] = "written"
+        return table
+
+    def remove(self):
+        file_system = _file_system(self.root)
+        if file_system.stat(self.root) is not None:
+            _remove_directory(self.root)
+            file_system.invalidate(self.root)
+
+
+_current_task = threading.local()
+
+
+@contextlib.contextmanager
+def _task_checkpoints(checkpoints: TaskCheckpoints):
+    previous_checkpoints = getattr(_current_task, "checkpoints", None)
+    _current_task.checkpoints = checkpoints
+    try:
+        yield checkpoints
+    finally:
+        _current_task.checkpoints = previous_checkpoints
+
+
+def checkpoint(table: hl.Table, name: str) -> hl.Table:
+    """
+    Write an intermediate table computed by a task function under the task's output path.
+
+    If a previous attempt of the task wrote this checkpoint with the same inputs, code, and
+    parameters, the table is read from it instead. Outside of a pipeline task, the table is cached.
+    """
+    checkpoints = getattr(_current_task, "checkpoints", None)
+    if checkpoints is None:
+        return table.cache()
+
+    return checkpoints.checkpoint(table, name)
+
+
+@contextlib.contextmanager
+def _spark_job_group(job_group):
+    """
+    Run Spark jobs started within this context in a job group and count their jobs and stages.
+
+    The counts are added to the yielded dict when the context exits. They are not available if
+    no Spark context has been started.
+    """
+    stats = {}
+    spark_context = SparkContext._active_spark_context  # pylint: disable=protected-access
+    if spark_context is None:
+        yield stats
+        return
+
+    spark_context.setJobGroup(job_group, job_group)
+    try:
+        yield stats
+    finally:
+        status_tracker = spark_context.statusTracker()
+        job_ids = status_tracker.getJobIdsForGroup(job_group)
+        job_infos = [status_tracker.getJobInfo(job_id) for job_id in job_ids]
+        stats["spark_jobs"] = len(job_ids)
+        stats["spark_stages"] = sum(len(job_info.stageIds) for job_info in job_infos if job_info)
+        # Setting a local property to null removes it, though PySpark's type hints only allow strings.
+        spark_context.setLocalProperty("spark.jobGroup.id", None)  # type: ignore
+
+
+def _output_metrics(output_path, result=None) -> dict:
+    metrics = {}
+    try:
+        metrics["output_size_bytes"] = _file_system(output_path).disk_usage(output_path)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.warning(f"Unable to get size of {output_path}: {error}")
+
+    if isinstance(result, hl.Table):
+        # Row counts for each partition are stored in the table's metadata, so this does not scan the table.
+        table = hl.read_table(output_path)
+        metrics["rows"] = table.count()
+        metrics["partitions"] = table.n_partitions()
+
+    return metrics
+
+
+# Directory under the output root where metrics for each pipeline run are written.
+METRICS_DIRECTORY = "pipeline_metrics"
+
+
+def read_task_metrics(metrics_root) -> List[dict]:
+    """Read task metrics recorded by all pipeline runs that wrote metrics under `metrics_root`."""
+    file_system = _file_system(metrics_root)
+    metrics_files = sorted(entry["path"] for entry in file_system.ls(metrics_root) if entry["path"].endswith(".jsonl"))
+    return [json.loads(line) for path in metrics_files for line in file_system.read_text(path).splitlines() if line]
+
+
+@attr.define
+class TaskMetricsWriter:
+    """
+    Records metrics for each task run during a pipeline run.
+
+    Metrics for each run are written to a separate JSONL file, which is rewritten as each
+    task finishes, since objects in GCS cannot be appended to.
+    """
+
+    path: str
+    pipeline: Optional[str] = None
+    records: List[dict] = attr.Factory(list)
+    _lock: threading.Lock = attr.Factory(threading.Lock)
+
+    def record(self, metrics: dict):
+        with self._lock:
+            self.records.append({"pipeline": self.pipeline, **metrics})
+            if not self.path.startswith("gs://"):
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with _file_system(self.path).open(self.path, "w") as f:
+                f.write("".join(json.dumps(record, sort_keys=True) + "\n" for record in self.records))
+
+
+def task_function_fingerprint(task_function: Callable) -> str:
+    try:
+        source = inspect.getsource(task_function)
+    except (OSError, TypeError):
+        source = f"{getattr(task_function, '__module__', None)}.{getattr(task_function, '__qualname__', None)}"
+
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
 _pipeline_config = {}
 
 
+def set_output_root(output_root):
+    """Set the root path for outputs of pipelines that are not created with a PipelineConfig."""
+    _pipeline_config["output_root"] = output_root.rstrip("/")
+
+
+def get_output_root():
+    return _pipeline_config.get("output_root")
+
+
 @attr.define
 class DownloadTask:
     _config: Optional[PipelineConfig]
     _name: str
     _url: str
     _output_path: str
+    _expected_size: Optional[int] = None
+    _expected_checksum: Optional[str] = None
 
     @classmethod
-    def create(cls, config: Optional[PipelineConfig], name: str, url: str, output_path: str):
-        return cls(config, name, url, output_path)
+    def create(
+        cls,
+        config: Optional[PipelineConfig],
+        name: str,
+        url: str,
+        output_path: str,
+        expected_size: Optional[int] = None,
+        expected_checksum: Optional[str] = None,
+    ):
+        return cls(config, name, url, output_path, expected_size, expected_checksum)
 
     def get_output_path(self):
         if self._config:
@@ -83,26 +785,58 @@ class DownloadTask:
     def get_inputs(self):
         raise NotImplementedError("Method not valid for DownloadTask")
 
+    def get_dependencies(self) -> List[Union["Task", "DownloadTask"]]:
+        return []
+
+    def get_output_fingerprint(self):
+        manifest = read_manifest(self.get_output_path())
+        if manifest:
+            return manifest["fingerprint"]
+
+        return content_fingerprint(self.get_output_path())
+
     def run(self, force=False):
         output_path = self.get_output_path()
         should_run, reason = (True, "Forced") if force else self.should_run()
         if should_run:
             logger.info(f"Running {self._name} ({reason}")
 
+            started_at = datetime.datetime.utcnow()
             start = time.perf_counter()
-            with tempfile.NamedTemporaryFile() as tmp:
-                subprocess.check_call(["curl", "-o", tmp.name, self._url])
-
-                if output_path.startswith("gs://"):
-                    subprocess.check_call(["gsutil", "cp", tmp.name, output_path])
-                else:
-                    shutil.copyfile(tmp.name, output_path)
+            # Record a fingerprint of the downloaded content so that re-downloading an identical
+            # file does not cause downstream tasks to rerun.
+            fingerprint = download_file(
+                self._url,
+                output_path,
+                expected_size=self._expected_size,
+                expected_checksum=self._expected_checksum,
+            )
+            _file_system(output_path).invalidate(output_path)
 
             stop = time.perf_counter()
             elapsed = stop - start
-            logger.info(f"Finished {self._name} in {int(elapsed // 60)}m{elapsed % 60:02.0f}s")
-        else:
-            logger.info(f"Skipping {self._name}")
+            write_manifest(
+                output_path,
+                {
+                    "fingerprint": fingerprint,
+                    "url": self._url,
+                    "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+                    "elapsed_history": _elapsed_history(output_path, elapsed),
+                },
+            )
+            logger.info(f"Finished {self._name} in {format_duration(elapsed)}")
+            return {
+                "task": self._name,
+                "reason": reason,
+                "started_at": started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+                "elapsed": round(elapsed, 1),
+                "output_path": output_path,
+                **_output_metrics(output_path),
+            }
+
+        logger.info(f"Skipping {self._name}")
+        return None
 
 
 @attr.define
@@ -113,6 +847,7 @@ class Task:
     _inputs: dict
     _params: dict
     _config: Optional[PipelineConfig] = None
+    _output_policy: OutputPolicy = attr.Factory(OutputPolicy)
 
     @classmethod
     def create(
@@ -123,12 +858,15 @@ class Task:
         output_path: str,
         inputs: Optional[dict] = None,
         params: Optional[dict] = None,
+        output_policy: Optional[OutputPolicy] = None,
     ):
         if inputs is None:
             inputs = {}
         if params is None:
             params = {}
-        return cls(name, task_function, output_path, inputs, params, config)
+        if output_policy is None:
+            output_policy = OutputPolicy()
+        return cls(name, task_function, output_path, inputs, params, config, output_policy)
 
     def get_output_path(self):
         if self._config:
@@ -155,17 +893,82 @@ class Task:
 
         return paths
 
+    def get_dependencies(self) -> List[Union["Task", "DownloadTask"]]:
+        return [v for v in self._inputs.values() if isinstance(v, (Task, DownloadTask))]
+
+    def get_fingerprints(self) -> dict:
+        input_fingerprints = {}
+        for k, path in self.get_inputs().items():
+            v = self._inputs[k]
+            if isinstance(v, (Task, DownloadTask)):
+                input_fingerprints[k] = v.get_output_fingerprint()
+            else:
+                input_fingerprints[k] = content_fingerprint(path)
+
+        return {
+            "inputs": input_fingerprints,
+            "task_function": task_function_fingerprint(self._task_function),
+            "params": _hash_json(self._params),
+        }
+
+    def get_output_fingerprint(self):
+        # A task's output is identified by everything that went into producing it, so downstream
+        # tasks are unaffected when this task is rerun with the same inputs, code, and parameters.
+        manifest = read_manifest(self.get_output_path())
+        if manifest:
+            return manifest["fingerprint"]
+
+        return content_fingerprint(self.get_output_path())
+
+    def write_manifest(self, elapsed: Optional[float] = None, output_size_bytes: Optional[int] = None):
+        output_path = self.get_output_path()
+        fingerprints = self.get_fingerprints()
+        manifest = {
+            **fingerprints,
+            "fingerprint": _hash_json(fingerprints),
+            "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+        }
+        if elapsed is not None:
+            manifest["elapsed_history"] = _elapsed_history(output_path, elapsed)
+        if output_size_bytes is not None:
+            manifest["output_size_bytes"] = output_size_bytes
+
+        write_manifest(output_path, manifest)
+
     def should_run(self):
         output_path = self.get_output_path()
         if not file_exists(output_path):
             return (True, "Output does not exist")
 
-        if self._inputs:
-            output_mod_time = modified_time(output_path)
-            input_mod_time = max(modified_time(path) for path in self.get_inputs().values())
+        manifest = read_manifest(output_path)
+        if manifest is None:
+            # Outputs written before fingerprint manifests were introduced fall back to comparing
+            # modification times. A manifest is recorded for them the next time the task is skipped.
+            if self._inputs:
+                output_mod_time = modified_time(output_path)
+                input_mod_time = max(modified_time(path) for path in self.get_inputs().values())
 
-            if input_mod_time > output_mod_time:
-                return (True, "Input is newer than output")
+                if input_mod_time > output_mod_time:
+                    return (True, "Input is newer than output")
+
+            return (False, None)
+
+        fingerprints = self.get_fingerprints()
+
+        previous_inputs = manifest.get("inputs", {})
+        changed_inputs = sorted(
+            k
+            for k in set(previous_inputs) | set(fingerprints["inputs"])
+            if previous_inputs.get(k) != fingerprints["inputs"].get(k)
+        )
+        if changed_inputs:
+            return (True, f"Inputs changed: {', '.join(changed_inputs)}")
+
+        if manifest.get("task_function") != fingerprints["task_function"]:
+            return (True, "Task function changed")
+
+        if manifest.get("params") != fingerprints["params"]:
+            return (True, "Parameters changed")
 
         return (False, None)
 
@@ -174,26 +977,104 @@ class Task:
         should_run, reason = (True, "Forced") if force else self.should_run()
         if should_run:
             logger.info(f"Running {self._name} ({reason})")
+            started_at = datetime.datetime.utcnow()
             start = time.perf_counter()
-            result = self._task_function(**self.get_inputs(), **self._params)
+            checkpoints = TaskCheckpoints(checkpoints_root(output_path), _hash_json(self.get_fingerprints()))
+            if force:
+                checkpoints.remove()
+
+            with (
+                _spark_job_group(f"{self._name}-{started_at.isoformat()}") as spark_stats,
+                _task_checkpoints(checkpoints),
+            ):
+                result = self._task_function(**self.get_inputs(), **self._params)
 
-            if self._config:
-                if "gs://" not in self._config.output_root:
-                    Path(self._config.output_root).mkdir(parents=True, exist_ok=True)
+                output_policy = None
+                if isinstance(result, hl.Table):
+                    result, output_policy = self._output_policy.apply(result, estimated_output_size(output_path))
+
+                if self._config:
+                    if "gs://" not in self._config.output_root:
+                        Path(self._config.output_root).mkdir(parents=True, exist_ok=True)
 
-            result.write(output_path, overwrite=True)  # pylint: disable=unexpected-keyword-arg
+                result.write(output_path, overwrite=True)  # pylint: disable=unexpected-keyword-arg
+
+            _file_system(output_path).invalidate(output_path)
+            _invalidate_table(output_path)
             stop = time.perf_counter()
             elapsed = stop - start
-            logger.info(f"Finished {self._name} in {int(elapsed // 60)}m{elapsed % 60:02.0f}s")
-        else:
-            logger.info(f"Skipping {self._name}")
+            output_metrics = _output_metrics(output_path, result)
+            self.write_manifest(elapsed, output_metrics.get("output_size_bytes"))
+            # The output may have been computed from checkpoints, so they are only removed once it has been written.
+            checkpoints.remove()
+            logger.info(f"Finished {self._name} in {format_duration(elapsed)}")
+            metrics = {
+                "task": self._name,
+                "reason": reason,
+                "started_at": started_at.isoformat(timespec="seconds"),
+                "finished_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+                "elapsed": round(elapsed, 1),
+                "output_path": output_path,
+                **output_metrics,
+                **spark_stats,
+            }
+            if output_policy:
+                metrics["output_policy"] = output_policy
+            if checkpoints.used:
+                metrics["checkpoints"] = checkpoints.used
+            return metrics
+
+        if read_manifest(output_path) is None:
+            self.write_manifest()
+        logger.info(f"Skipping {self._name}")
+        return None
+
+
+@attr.define
+class TaskPlan:
+    name: str
+    will_run: bool
+    reason: Optional[str]
+    estimated_duration: Optional[float]
+    dependencies: List[str]
+    on_critical_path: bool = False
+
+
+def format_plan(plans: List[TaskPlan]) -> str:
+    tasks_to_run = [plan for plan in plans if plan.will_run]
+    name_width = max((len(plan.name) for plan in plans), default=0)
+
+    lines = [f"{len(tasks_to_run)} of {len(plans)} tasks will run", ""]
+    for plan in plans:
+        marker = "*" if plan.on_critical_path else " "
+        status = "RUN " if plan.will_run else "SKIP"
+        estimate = format_duration(plan.estimated_duration) if plan.estimated_duration is not None else "unknown"
+        line = f"{marker} {status} {plan.name:<{name_width}}  {estimate:>9}"
+        if plan.will_run:
+            line += f"  {plan.reason}"
+        lines.append(line.rstrip())
+
+    critical_path = [plan for plan in plans if plan.on_critical_path]
+    if critical_path:
+        critical_path_duration = sum(plan.estimated_duration or 0 for plan in critical_path)
+        total_duration = sum(plan.estimated_duration or 0 for plan in tasks_to_run)
+        unknown_estimates = [plan.name for plan in tasks_to_run if plan.estimated_duration is None]
+        lines += [
+            "",
+            f"Critical path (*): {format_duration(critical_path_duration)}",
+            f"Total for all tasks: {format_duration(total_duration)}",
+        ]
+        if unknown_estimates:
+            lines.append(f"No recorded run times for: {', '.join(unknown_estimates)}")
+
+    return "\n".join(lines)
 
 
 @attr.define
 class Pipeline:
     config: Optional[PipelineConfig] = None
-    _tasks: OrderedDict = OrderedDict()
-    _outputs: dict = {}
+    _tasks: OrderedDict = attr.Factory(OrderedDict)
+    _outputs: dict = attr.Factory(dict)
 
     def add_task(
         self,
@@ -202,12 +1083,13 @@ class Pipeline:
         output_path: str,
         inputs: Optional[dict] = None,
         params: Optional[dict] = None,
+        output_policy: Optional[OutputPolicy] = None,
     ):
         if inputs is None:
             inputs = {}
         if params is None:
             params = {}
-        task = Task.create(self.config, name, task_function, output_path, inputs, params)
+        task = Task.create(self.config, name, task_function, output_path, inputs, params, output_policy)
         self._tasks[name] = task
         return task
 
@@ -225,9 +1107,124 @@ class Pipeline:
     def get_all_task_names(self) -> List[str]:
         return list(self._tasks.keys())
 
-    def run(self, force_tasks=None) -> None:
-        for task_name, task in self._tasks.items():
-            task.run(force=force_tasks and task_name in force_tasks)
+    def get_task_dependencies(self) -> Dict[str, List[str]]:
+        # Inputs that are tasks from another pipeline (for example, genes pipeline outputs used by
+        # a variants pipeline) are not scheduled here; those must be run by their own pipeline.
+        task_names = {id(task): task_name for task_name, task in self._tasks.items()}
+        return {
+            task_name: [
+                task_names[id(dependency)] for dependency in task.get_dependencies() if id(dependency) in task_names
+            ]
+            for task_name, task in self._tasks.items()
+        }
+
+    def plan(self, force_tasks=None) -> List[TaskPlan]:
+        """
+        Determine which tasks would run, and why, without running any of them.
+
+        A task will run if it is stale or if any task it depends on will run. Durations are estimated
+        from run times recorded in output manifests, and the chain of dependent tasks with the longest
+        estimated duration, which bounds the run time of the pipeline with any number of workers, is
+        marked as the critical path.
+        """
+        dependencies = self.get_task_dependencies()
+        plans: Dict[str, TaskPlan] = OrderedDict()
+
+        with cached_file_system():
+            for task_name, task in self._tasks.items():
+                upstream_tasks_to_run = [d for d in dependencies[task_name] if plans[d].will_run]
+                if force_tasks and task_name in force_tasks:
+                    will_run, reason = True, "Forced"
+                elif upstream_tasks_to_run:
+                    will_run, reason = True, f"Upstream tasks will run: {', '.join(upstream_tasks_to_run)}"
+                else:
+                    will_run, reason = task.should_run()
+
+                plans[task_name] = TaskPlan(
+                    name=task_name,
+                    will_run=will_run,
+                    reason=reason,
+                    estimated_duration=estimated_duration(task.get_output_path()),
+                    dependencies=dependencies[task_name],
+                )
+
+        # Tasks are added after the tasks they depend on, so insertion order is a topological order.
+        finish_times: Dict[str, float] = {}
+        critical_predecessor: Dict[str, Optional[str]] = {}
+        for task_name, plan in plans.items():
+            predecessor = max(plan.dependencies, key=lambda d: (finish_times[d], plans[d].will_run), default=None)
+            start_time = finish_times[predecessor] if predecessor else 0
+            duration = (plan.estimated_duration or 0) if plan.will_run else 0
+            finish_times[task_name] = start_time + duration
+            critical_predecessor[task_name] = predecessor
+
+        tasks_to_run = [task_name for task_name, plan in plans.items() if plan.will_run]
+        if tasks_to_run:
+            # Prefer later tasks on ties, since those are at the end of longer chains of dependencies.
+            task_name = max(reversed(tasks_to_run), key=lambda t: finish_times[t])
+            while task_name:
+                if plans[task_name].will_run:
+                    plans[task_name].on_critical_path = True
+                task_name = critical_predecessor[task_name]
+
+        return list(plans.values())
+
+    def run(self, force_tasks=None, workers: int = 1, metrics_writer: Optional[TaskMetricsWriter] = None) -> None:
+        """
+        Run tasks in dependency order, running up to `workers` independent tasks concurrently.
+
+        Each task is started as soon as all tasks it takes as inputs have finished, so the total
+        run time is bounded by the longest chain of dependent tasks rather than the sum of all tasks.
+        Ready tasks are started in the order they were added to the pipeline. If a task fails, no
+        new tasks are started and the error is raised once running tasks have finished.
+
+        If `metrics_writer` is given, metrics for each task that runs are recorded with it.
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        dependencies = self.get_task_dependencies()
+        remaining = OrderedDict(
+            (task_name, set(task_dependencies)) for task_name, task_dependencies in dependencies.items()
+        )
+        running = {}
+        errors = []
+
+        with (
+            cached_file_system(),
+            table_registry(),
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor,
+        ):
+            while remaining or running:
+                if not errors:
+                    ready = [task_name for task_name, waiting_on in remaining.items() if not waiting_on]
+                    for task_name in ready[: workers - len(running)]:
+                        del remaining[task_name]
+                        force = bool(force_tasks and task_name in force_tasks)
+                        running[executor.submit(self._tasks[task_name].run, force=force)] = task_name
+
+                if not running:
+                    if not errors:
+                        raise RuntimeError(f"Unable to schedule tasks: {', '.join(remaining)}")
+                    break
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task_name = running.pop(future)
+                    error = future.exception()
+                    if error:
+                        logger.error(f"Failed {task_name}: {error}")
+                        errors.append(error)
+                    else:
+                        for waiting_on in remaining.values():
+                            waiting_on.discard(task_name)
+
+                        task_metrics = future.result()
+                        if metrics_writer and task_metrics:
+                            metrics_writer.record(task_metrics)
+
+        if errors:
+            raise errors[0]
 
     def set_outputs(self, outputs) -> None:
         for output_name, task_name in outputs.items():
@@ -262,17 +1259,38 @@ def run_pipeline(pipeline: Pipeline):
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--force", choices=task_names, nargs="+")
     group.add_argument("--force-all", action="store_true")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Maximum number of independent tasks to run concurrently"
+    )
+    parser.add_argument(
+        "--plan", action="store_true", help="Show which tasks would run and their estimated duration, then exit"
+    )
     args = parser.parse_args()
 
     if args.output_root:
-        _pipeline_config["output_root"] = args.output_root.rstrip("/")
+        set_output_root(args.output_root)
 
-    pipeline_args = {}
+    force_tasks = None
     if args.force_all:
-        pipeline_args["force_tasks"] = task_names
+        force_tasks = task_names
     elif args.force:
-        pipeline_args["force_tasks"] = args.force
+        force_tasks = args.force
 
     hl.init()
 
-    pipeline.run(**pipeline_args)
+    if args.plan:
+        print(format_plan(pipeline.plan(force_tasks=force_tasks)))
+        return
+
+    output_root = pipeline.config.output_root if pipeline.config else get_output_root()
+    metrics_writer = None
+    if output_root:
+        pipeline_name = pipeline.config.name if pipeline.config else Path(sys.argv[0]).stem
+        metrics_writer = TaskMetricsWriter(
+            os.path.join(
+                output_root, METRICS_DIRECTORY, f"{generate_iso_timestamp_for_filename()}-{pipeline_name}.jsonl"
+            ),
+            pipeline=pipeline_name,
+        )
+
+    pipeline.run(force_tasks=force_tasks, workers=args.workers, metrics_writer=metrics_writer)
@@ -7,40 +7,57 @@ from data_pipeline.helpers.datasets_config import DATASETS_CONFIG
 from data_pipeline.pipeline import _pipeline_config
 
 
-def get_n_columns(table):
-    return len(list(table.row.items()))
+def _field_path(path, field):
+    return f"{path}.{field}" if path else field
 
 
-def decompose_table(table):
-    table = table.flatten()
-    for column in table.row.items():
-        column_name = column[0]
-        column_type = str(column[1].dtype)
-        if column_type.startswith("array<") or column_type.startswith("set<"):
-            table = table.explode(column_name)
-    return table
+def missingness_aggregation(expr, path=""):
+    """
+    Aggregation counting missing values for each field path in a (possibly nested) expression.
+
+    Array elements are aggregated with nested `hl.agg.explode` aggregators, so that each array is
+    traversed on its own instead of exploding the table by every array. Paths match the field names
+    produced by `Table.flatten`. Missing arrays are counted under the path of the array and missing
+    array elements under the path of the array followed by "[]".
+    """
+    n_missing = {}
+    nested = {}
+
+    def visit(expr, path):
+        if isinstance(expr.dtype, hl.tstruct):
+            for field in expr.dtype:
+                visit(expr[field], _field_path(path, field))
+        elif isinstance(expr.dtype, hl.tarray):
+            n_missing[path] = hl.agg.count_where(hl.is_missing(expr))
+            element_path = f"{path}[]"
+            nested[element_path] = hl.agg.explode(lambda element: missingness_aggregation(element, element_path), expr)
+        else:
+            n_missing[path] = hl.agg.count_where(hl.is_missing(expr))
+
+    visit(expr, path)
+
+    return hl.struct(n=hl.agg.count(), n_missing=hl.struct(**n_missing), nested=hl.struct(**nested))
+
+
+def missingness_counts(result):
+    """Flatten the result of `missingness_aggregation` to a dict of field path -> missing/present counts."""
+    counts = {}
+    for path, n_missing in result.n_missing.items():
+        counts[path] = hl.Struct(n_missing=n_missing, n_present=result.n - n_missing)
+
+    for nested_result in result.nested.values():
+        counts.update(missingness_counts(nested_result))
+
+    return counts
 
 
 def extract_missingness(dataset):
     dataset_config = DATASETS_CONFIG[dataset]
     table = dataset_config["get_table"]()
+    # Convert sets and dicts to arrays and loci, intervals, and tuples to structs.
     table = table.expand_types()
 
-    previous_n_columns = -1
-    n_columns = get_n_columns(table)
-    while n_columns > previous_n_columns:
-        previous_n_columns = n_columns
-        table = decompose_table(table)
-        n_columns = get_n_columns(table)
-
-    table = table.repartition(1000)
-
-    aggregation_params = {
-        column_name: hl.agg.any(hl.is_missing(table[column_name])) for column_name in table.row.keys()
-    }
-
-    missingness = table.aggregate(hl.struct(**aggregation_params))
-    return missingness
+    return missingness_counts(table.aggregate(missingness_aggregation(table.row)))
 
 
 def main(argv):
@@ -58,7 +75,10 @@ def main(argv):
     if unknown_datasets:
         raise RuntimeError(f"Unknown datasets: {', '.join(unknown_datasets)}")
     for dataset in datasets:
-        print(extract_missingness(dataset))
+        print(dataset)
+        print("\t".join(["field", "n_missing", "n_present"]))
+        for path, counts in extract_missingness(dataset).items():
+            print("\t".join([path, str(counts.n_missing), str(counts.n_present)]))
 
 
 if __name__ == "__main__":
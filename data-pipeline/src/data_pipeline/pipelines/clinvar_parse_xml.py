@@ -18,6 +18,8 @@ pipeline.add_task(
     import_clinvar_xml,
     "/clinvar/clinvar.ht",
     {"clinvar_xml_path": pipeline.get_task("download_clinvar_xml")},
+    # Only records that changed since the previous import are parsed.
+    {"incremental": True},
 )
 
 ###############################################
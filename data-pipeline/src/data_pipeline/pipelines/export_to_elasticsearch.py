@@ -1,29 +1,152 @@
 # Run this pipeline with `deployctl elasticsearch load-datasets`
 
 import argparse
+import concurrent.futures
 import logging
 import subprocess
 import sys
 
-from data_pipeline.helpers.elasticsearch_export import export_table_to_elasticsearch
-from data_pipeline.pipeline import _pipeline_config
+from data_pipeline.helpers.elasticsearch_export import (
+    export_table_to_elasticsearch,
+    get_elasticsearch_client,
+    update_index_alias,
+    upsert_table_to_elasticsearch,
+)
+from data_pipeline.pipeline import get_output_root, set_output_root, table_registry
 
 from data_pipeline.helpers.datasets_config import DATASETS_CONFIG
+from data_pipeline.helpers.elasticsearch_validation import validate_index
 
 logger = logging.getLogger("gnomad_data_pipeline")
 
+BULK_LOAD_STAGING_DIRECTORY = "elasticsearch_bulk_load"
 
-def export_datasets(elasticsearch_host, elasticsearch_auth, datasets):
-    base_args = {
-        "host": elasticsearch_host,
-        "auth": elasticsearch_auth,
-    }
 
-    for dataset in datasets:
-        logger.info("exporting dataset %s", dataset)
-        dataset_config = DATASETS_CONFIG[dataset]
-        table = dataset_config["get_table"]()
-        export_table_to_elasticsearch(table, **base_args, **dataset_config.get("args", {}))
+def export_dataset(
+    dataset,
+    elasticsearch_host,
+    elasticsearch_auth,
+    bulk_load=False,
+    bulk_load_concurrency=None,
+    num_replicas=None,
+    update_aliases=False,
+    delete_previous_indices=False,
+    validate=True,
+    upsert_changes=False,
+):
+    logger.info("exporting dataset %s", dataset)
+    dataset_config = DATASETS_CONFIG[dataset]
+    table = dataset_config["get_table"]()
+
+    export_args = {**dataset_config.get("args", {})}
+
+    # Datasets that support updating changed documents record which version of their data is in the
+    # index that their alias points to, since changes are relative to a specific earlier version.
+    version = dataset_config["get_version"]() if "get_version" in dataset_config else None
+
+    if upsert_changes:
+        if "get_changes" not in dataset_config:
+            raise RuntimeError(f"Dataset {dataset} does not support updating changed documents")
+
+        changed_rows, removed_ids = dataset_config["get_changes"](table, export_args["index"])
+        index = upsert_table_to_elasticsearch(
+            changed_rows,
+            host=elasticsearch_host,
+            alias=export_args["index"],
+            auth=elasticsearch_auth,
+            id_field=export_args["id_field"],
+            block_size=export_args.get("block_size", 5000),
+            index_fields=export_args.get("index_fields"),
+            delete_ids=removed_ids,
+        )
+        logger.info("updated changed documents for dataset %s in index %s", dataset, index)
+    else:
+        if bulk_load:
+            export_args["bulk_load_staging_path"] = f"{get_output_root()}/{BULK_LOAD_STAGING_DIRECTORY}/{dataset}"
+        if bulk_load_concurrency:
+            export_args["bulk_load_concurrency"] = bulk_load_concurrency
+        if num_replicas is not None:
+            export_args["num_replicas"] = num_replicas
+
+        index = export_table_to_elasticsearch(table, host=elasticsearch_host, auth=elasticsearch_auth, **export_args)
+        logger.info("exported dataset %s to index %s", dataset, index)
+
+    es_client = get_elasticsearch_client(elasticsearch_host, elasticsearch_auth)
+    if validate:
+        # After updating changed documents, the whole index is compared with the whole table.
+        validation = validate_index(
+            es_client,
+            table,
+            index,
+            id_field=export_args.get("id_field"),
+            index_fields=export_args.get("index_fields"),
+        )
+        if not validation.is_valid:
+            raise RuntimeError(f"Index {index} does not match dataset {dataset}\n{validation.summary()}")
+
+    if update_aliases:
+        # Indices are named with the alias used by the API followed by a timestamp.
+        update_index_alias(
+            es_client, dataset_config["args"]["index"], index, delete_previous_indices=delete_previous_indices
+        )
+
+    if version is not None and (upsert_changes or update_aliases):
+        dataset_config["record_indexed_version"](dataset_config["args"]["index"], version)
+
+
+def export_datasets(
+    elasticsearch_host,
+    elasticsearch_auth,
+    datasets,
+    bulk_load=False,
+    bulk_load_concurrency=None,
+    num_replicas=None,
+    parallelism=1,
+    update_aliases=False,
+    delete_previous_indices=False,
+    validate=True,
+    upsert_changes=False,
+):
+    """
+    Export datasets to Elasticsearch, with up to `parallelism` datasets exported concurrently.
+
+    Unless `validate` is false, each new index is checked against the dataset's table. If `update_aliases`
+    is set, each dataset's alias is then moved to its new index. A failure to export one dataset does not
+    stop the export of other datasets.
+
+    If `upsert_changes` is set, only documents for rows that have changed since the previous export are
+    written to the index that each dataset's alias points to, and documents for removed rows are deleted.
+
+    Datasets that read the same pipeline outputs share the tables opened for them.
+    """
+    with table_registry(), concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {
+            executor.submit(
+                export_dataset,
+                dataset,
+                elasticsearch_host,
+                elasticsearch_auth,
+                bulk_load=bulk_load,
+                bulk_load_concurrency=bulk_load_concurrency,
+                num_replicas=num_replicas,
+                update_aliases=update_aliases,
+                delete_previous_indices=delete_previous_indices,
+                validate=validate,
+                upsert_changes=upsert_changes,
+            ): dataset
+            for dataset in datasets
+        }
+
+        failed_datasets = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("failed to export dataset %s", futures[future])
+                failed_datasets.append(futures[future])
+
+    if failed_datasets:
+        raise RuntimeError(f"Failed to export datasets: {', '.join(sorted(failed_datasets))}")
 
 
 def main(argv):
@@ -32,10 +155,48 @@ def main(argv):
     parser.add_argument("--secret", required=True)
     parser.add_argument("--output-root", required=True)
     parser.add_argument("--datasets", required=True)
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Load documents with the bulk API instead of ES-Hadoop. Failed loads resume from a checkpoint.",
+    )
+    parser.add_argument("--bulk-load-concurrency", type=int, help="Maximum number of concurrent bulk requests")
+    parser.add_argument(
+        "--num-replicas", type=int, help="Number of replicas of each new index to create after loading documents"
+    )
+    parser.add_argument(
+        "--parallelism", type=int, default=1, help="Maximum number of datasets to export to the cluster concurrently"
+    )
+    parser.add_argument(
+        "--update-aliases",
+        action="store_true",
+        help="After validating each new index, move the dataset's alias to it",
+    )
+    parser.add_argument(
+        "--delete-previous-indices",
+        action="store_true",
+        help="Delete indices that datasets' aliases pointed to before they were updated",
+    )
+    parser.add_argument(
+        "--skip-validation",
+        action="store_true",
+        help="Do not compare document counts and sampled documents in new indices with the datasets' tables",
+    )
+    parser.add_argument(
+        "--upsert-changes",
+        action="store_true",
+        help="Update changed documents in the index each dataset's alias points to instead of creating new indices",
+    )
     args = parser.parse_args(argv)
 
-    # TODO: clean this up
-    _pipeline_config["output_root"] = args.output_root.rstrip("/")
+    if args.delete_previous_indices and not args.update_aliases:
+        parser.error("--delete-previous-indices requires --update-aliases")
+    if args.update_aliases and args.skip_validation:
+        parser.error("--update-aliases requires validation")
+    if args.upsert_changes and (args.update_aliases or args.bulk_load):
+        parser.error("--upsert-changes cannot be used with --update-aliases or --bulk-load")
+
+    set_output_root(args.output_root)
 
     elasticsearch_password = subprocess.check_output(
         ["gcloud", "secrets", "versions", "access", "latest", f"--secret={args.secret}"]
@@ -47,7 +208,17 @@ def main(argv):
         raise RuntimeError(f"Unknown datasets: {', '.join(unknown_datasets)}")
 
     export_datasets(
-        elasticsearch_host=args.host, elasticsearch_auth=("elastic", elasticsearch_password), datasets=datasets
+        elasticsearch_host=args.host,
+        elasticsearch_auth=("elastic", elasticsearch_password),
+        datasets=datasets,
+        bulk_load=args.bulk_load,
+        bulk_load_concurrency=args.bulk_load_concurrency,
+        num_replicas=args.num_replicas,
+        parallelism=args.parallelism,
+        update_aliases=args.update_aliases,
+        delete_previous_indices=args.delete_previous_indices,
+        validate=not args.skip_validation,
+        upsert_changes=args.upsert_changes,
     )
 
 
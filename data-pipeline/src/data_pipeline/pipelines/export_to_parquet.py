@@ -0,0 +1,68 @@
+# Export browser tables to Parquet for consumers that do not run Hail or Spark.
+#
+# Tables are written to <output root>/parquet/<dataset> and can be read with data_pipeline.helpers.parquet_reader.
+
+import argparse
+import concurrent.futures
+import logging
+import sys
+
+from data_pipeline.helpers.datasets_config import DATASETS_CONFIG
+from data_pipeline.helpers.parquet_export import export_table_to_parquet
+from data_pipeline.pipeline import get_output_root, set_output_root, table_registry
+
+logger = logging.getLogger("gnomad_data_pipeline")
+
+PARQUET_DIRECTORY = "parquet"
+
+
+def export_dataset_to_parquet(dataset):
+    logger.info("exporting dataset %s to Parquet", dataset)
+    table = DATASETS_CONFIG[dataset]["get_table"]()
+    output_path = f"{get_output_root()}/{PARQUET_DIRECTORY}/{dataset}"
+    metadata = export_table_to_parquet(table, output_path, dataset=dataset)
+    logger.info("exported %d rows of dataset %s to %s", metadata["rows"], dataset, output_path)
+
+
+def export_datasets_to_parquet(datasets, parallelism=1):
+    """
+    Export datasets to Parquet, with up to `parallelism` datasets exported concurrently.
+
+    A failure to export one dataset does not stop the export of other datasets.
+    """
+    with table_registry(), concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+        futures = {executor.submit(export_dataset_to_parquet, dataset): dataset for dataset in datasets}
+
+        failed_datasets = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("failed to export dataset %s", futures[future])
+                failed_datasets.append(futures[future])
+
+    if failed_datasets:
+        raise RuntimeError(f"Failed to export datasets: {', '.join(sorted(failed_datasets))}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-root", required=True)
+    parser.add_argument("--datasets", required=True)
+    parser.add_argument(
+        "--parallelism", type=int, default=1, help="Maximum number of datasets to export to the cluster concurrently"
+    )
+    args = parser.parse_args(argv)
+
+    set_output_root(args.output_root)
+
+    datasets = args.datasets.split(",")
+    unknown_datasets = [d for d in datasets if d not in DATASETS_CONFIG.keys()]
+    if unknown_datasets:
+        raise RuntimeError(f"Unknown datasets: {', '.join(unknown_datasets)}")
+
+    export_datasets_to_parquet(datasets, parallelism=args.parallelism)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
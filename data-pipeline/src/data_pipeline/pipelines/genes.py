@@ -1,6 +1,6 @@
 import hail as hl
 
-from data_pipeline.pipeline import Pipeline, run_pipeline
+from data_pipeline.pipeline import OutputPolicy, Pipeline, read_table, run_pipeline
 
 from data_pipeline.helpers import annotate_table
 
@@ -134,6 +134,7 @@ pipeline.add_task(
         "exomes": "gs://gcp-public-data--gnomad/release/2.1.1/ht/exomes/gnomad.exomes.r2.1.1.sites.ht",
         "genomes": "gs://gcp-public-data--gnomad/release/2.1.1/ht/genomes/gnomad.genomes.r2.1.1.sites.ht",
     },
+    output_policy=OutputPolicy(default_partitions=32),
 )
 
 pipeline.add_task(
@@ -144,6 +145,7 @@ pipeline.add_task(
         "exomes": "gs://gcp-public-data--gnomad/release/4.0/ht/exomes/gnomad.exomes.v4.0.sites.ht",
         "genomes": "gs://gcp-public-data--gnomad/release/4.0/ht/genomes/gnomad.genomes.v4.0.sites.ht",
     },
+    output_policy=OutputPolicy(default_partitions=32),
 )
 
 ###############################################
@@ -348,7 +350,7 @@ pipeline.add_task(
 
 
 def annotate_with_preferred_transcript(table_path):
-    ds = hl.read_table(table_path)
+    ds = read_table(table_path)
 
     if "mane_select_transcript" in ds.row:
         preferred_transcript_id = hl.or_else(ds.mane_select_transcript.ensembl_id, ds.canonical_transcript_id)
@@ -409,6 +411,7 @@ pipeline.add_task(
     {
         "keep_mane_version_global_annotation": False,
     },
+    output_policy=OutputPolicy(default_partitions=100),
 )
 
 pipeline.add_task(
@@ -453,8 +456,8 @@ pipeline.add_task(
 
 
 def annotate_v4_with_constraint(genes_path, constraint_path):
-    genes = hl.read_table(genes_path)
-    constraint = hl.read_table(constraint_path)
+    genes = read_table(genes_path)
+    constraint = read_table(constraint_path)
 
     constraint_match = constraint[genes.preferred_transcript_id]
 
@@ -531,6 +534,7 @@ pipeline.add_task(
     {
         "keep_mane_version_global_annotation": True,
     },
+    output_policy=OutputPolicy(default_partitions=100),
 )
 
 ###############################################
@@ -0,0 +1,106 @@
+# Show changes in task metrics between pipeline runs.
+#
+# Run this with `deployctl data-pipeline run pipeline_metrics` to read metrics written under the
+# configured data pipeline output, or directly with `--output-root` for a local output directory.
+
+import argparse
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from data_pipeline.pipeline import (
+    METRICS_DIRECTORY,
+    format_duration,
+    get_output_root,
+    read_task_metrics,
+    set_output_root,
+)
+
+
+COMPARED_METRICS = ["elapsed", "output_size_bytes", "rows", "partitions", "spark_stages"]
+
+
+def compare_task_metrics(records: List[dict], threshold: float = 1.5) -> List[dict]:
+    """
+    Compare the latest run of each task with its previous run.
+
+    A task is flagged as a regression if its run time increased by at least a factor of `threshold`.
+    """
+    records_by_task: Dict[str, List[dict]] = defaultdict(list)
+    for record in sorted(records, key=lambda r: r["started_at"]):
+        records_by_task[record["task"]].append(record)
+
+    comparisons = []
+    for task_name, task_records in records_by_task.items():
+        latest = task_records[-1]
+        previous = task_records[-2] if len(task_records) > 1 else None
+
+        comparison = {
+            "task": task_name,
+            "runs": len(task_records),
+            "latest": {metric: latest.get(metric) for metric in COMPARED_METRICS},
+            "previous": {metric: previous.get(metric) for metric in COMPARED_METRICS} if previous else None,
+            "elapsed_ratio": None,
+            "regression": False,
+        }
+        if previous and previous.get("elapsed") and latest.get("elapsed") is not None:
+            comparison["elapsed_ratio"] = latest["elapsed"] / previous["elapsed"]
+            comparison["regression"] = comparison["elapsed_ratio"] >= threshold
+
+        comparisons.append(comparison)
+
+    return comparisons
+
+
+def _format_metric(metric, value):
+    if value is None:
+        return "-"
+    if metric == "elapsed":
+        return format_duration(value)
+    return f"{value:,}"
+
+
+def format_comparisons(comparisons: List[dict]) -> str:
+    lines = []
+    for comparison in sorted(comparisons, key=lambda c: (not c["regression"], c["task"])):
+        status = "REGRESSION" if comparison["regression"] else ""
+        ratio = f"{comparison['elapsed_ratio']:.2f}x" if comparison["elapsed_ratio"] is not None else "-"
+        lines.append(f"{comparison['task']} ({comparison['runs']} runs) {ratio} {status}".rstrip())
+
+        for metric in COMPARED_METRICS:
+            latest = _format_metric(metric, comparison["latest"][metric])
+            if comparison["previous"]:
+                previous = _format_metric(metric, comparison["previous"][metric])
+                lines.append(f"    {metric:<18} {previous:>16} -> {latest}")
+            else:
+                lines.append(f"    {metric:<18} {latest:>16}")
+
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output-root", required=True)
+    parser.add_argument("--pipeline", help="Only show metrics for this pipeline")
+    parser.add_argument("--task", nargs="+", help="Only show metrics for these tasks")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.5,
+        help="Flag tasks whose run time increased by at least this factor since the previous run",
+    )
+    args = parser.parse_args(argv)
+
+    set_output_root(args.output_root)
+
+    records = read_task_metrics(f"{get_output_root()}/{METRICS_DIRECTORY}")
+    if args.pipeline:
+        records = [record for record in records if record.get("pipeline") == args.pipeline]
+    if args.task:
+        records = [record for record in records if record["task"] in args.task]
+
+    print(format_comparisons(compare_task_metrics(records, threshold=args.threshold)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
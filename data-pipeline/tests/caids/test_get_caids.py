@@ -0,0 +1,220 @@
+import asyncio
+import csv
+import gzip
+import io
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from caids import get_caids as get_caids_module
+from caids.get_caids import AdaptiveConcurrencyLimiter, get_caids, read_lines
+
+VCF_HEADER = """##fileformat=VCFv4.2
+##contig=<ID=chr1,length=248956422,assembly=GRCh38>
+##contig=<ID=chrUn_KI270302v1,length=2274,assembly=GRCh38>
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+"""
+
+
+def vcf_lines(*positions):
+    return "".join(f"chr1\t{pos}\t.\tA\tG\t.\t.\t.\n" for pos in positions)
+
+
+async def run_with_mock_registry(requests, *args, fail_first_requests=0, **kwargs):
+    async def annotate_vcf(request):
+        assert request.query["assembly"] == "GRCh38"
+        if len(requests) < fail_first_requests:
+            requests.append(None)
+            return web.Response(status=503)
+
+        vcf = await request.text()
+        requested_positions = []
+        annotated_lines = []
+        for line in vcf.splitlines():
+            if line.startswith("#"):
+                annotated_lines.append(line)
+                continue
+
+            contig, pos, _, *rest = line.split("\t")
+            requested_positions.append(int(pos))
+            # Position 3 is not registered.
+            annotated_lines.append("\t".join([contig, pos, "." if pos == "3" else f"CA{pos}", *rest]))
+
+        requests.append(requested_positions)
+        return web.Response(text="\n".join(annotated_lines))
+
+    app = web.Application()
+    app.router.add_post("/annotateVcf", annotate_vcf)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        await get_caids(*args, registry_url=f"http://127.0.0.1:{port}/annotateVcf", **kwargs)
+    finally:
+        await runner.cleanup()
+
+
+def read_output(output_directory):
+    return {
+        path.name: sorted(
+            (row["locus"], row["alleles"], row["CAID"]) for row in csv.DictReader(open(path), delimiter="\t")
+        )
+        for path in sorted(output_directory.iterdir())
+    }
+
+
+def test_get_caids_with_cache(tmp_path):
+    vcf_directory = tmp_path / "variants.vcf.bgz"
+    vcf_directory.mkdir()
+    (vcf_directory / "header").write_text(VCF_HEADER)
+    (vcf_directory / "part-00000.bgz").write_text(vcf_lines(1, 2, 2))
+    (vcf_directory / "part-00001.bgz").write_text(vcf_lines(3, 4))
+
+    cache_path = str(tmp_path / "caids.sqlite")
+    # Local output directories must exist before writing.
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+
+    requests = []
+    asyncio.run(run_with_mock_registry(requests, str(vcf_directory), str(tmp_path / "first"), cache_path=cache_path))
+
+    # Duplicate variants are only requested once.
+    assert sorted(requests) == [[1, 2], [3, 4]]
+    assert read_output(tmp_path / "first") == {
+        "part-00000.tsv": [
+            ("chr1:1", '["A", "G"]', "CA1"),
+            ("chr1:2", '["A", "G"]', "CA2"),
+            ("chr1:2", '["A", "G"]', "CA2"),
+        ],
+        "part-00001.tsv": [("chr1:3", '["A", "G"]', "."), ("chr1:4", '["A", "G"]', "CA4")],
+    }
+
+    # Cached variants are not requested again. Variants without a CAID are.
+    (vcf_directory / "part-00001.bgz").write_text(vcf_lines(3, 4, 5))
+    requests = []
+    asyncio.run(run_with_mock_registry(requests, str(vcf_directory), str(tmp_path / "second"), cache_path=cache_path))
+
+    assert requests == [[3, 5]]
+    assert read_output(tmp_path / "second") == {
+        "part-00000.tsv": [
+            ("chr1:1", '["A", "G"]', "CA1"),
+            ("chr1:2", '["A", "G"]', "CA2"),
+            ("chr1:2", '["A", "G"]', "CA2"),
+        ],
+        "part-00001.tsv": [
+            ("chr1:3", '["A", "G"]', "."),
+            ("chr1:4", '["A", "G"]', "CA4"),
+            ("chr1:5", '["A", "G"]', "CA5"),
+        ],
+    }
+
+
+def test_get_caids_retries_transient_errors(tmp_path):
+    vcf_directory = tmp_path / "variants.vcf.gz"
+    vcf_directory.mkdir()
+    (vcf_directory / "header.gz").write_bytes(gzip.compress(VCF_HEADER.encode()))
+    # Block gzipped, like parts written by Hail.
+    (vcf_directory / "part-00000.gz").write_bytes(
+        gzip.compress(vcf_lines(1, 2).encode()) + gzip.compress(vcf_lines(3, 4).encode())
+    )
+    (tmp_path / "output").mkdir()
+
+    requests = []
+    asyncio.run(run_with_mock_registry(requests, str(vcf_directory), str(tmp_path / "output"), fail_first_requests=1))
+
+    assert requests == [None, [1, 2, 3, 4]]
+    assert read_output(tmp_path / "output") == {
+        "part-00000.tsv": [
+            ("chr1:1", '["A", "G"]', "CA1"),
+            ("chr1:2", '["A", "G"]', "CA2"),
+            ("chr1:3", '["A", "G"]', "."),
+            ("chr1:4", '["A", "G"]', "CA4"),
+        ],
+    }
+
+
+class BytesStream:
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    async def read(self, n=-1):
+        return self._data.read(n)
+
+
+async def collect(lines):
+    return [line async for line in lines]
+
+
+def test_read_lines(monkeypatch):
+    # Read small chunks to split lines and gzip members across reads.
+    monkeypatch.setattr(get_caids_module, "STREAM_CHUNK_SIZE", 7)
+
+    data = gzip.compress(b"first line\nsecond") + gzip.compress(b" line\nthird line")
+    assert asyncio.run(collect(read_lines(BytesStream(data), gzipped=True))) == [  # type: ignore
+        "first line",
+        "second line",
+        "third line",
+    ]
+    assert asyncio.run(collect(read_lines(BytesStream(b"a\nb\n")))) == ["a", "b"]  # type: ignore
+
+
+def test_adaptive_concurrency_limiter():
+    async def run():
+        # Requests here take no time, so ignore latency.
+        limiter = AdaptiveConcurrencyLimiter(4, max_limit=8, latency_tolerance=float("inf"))
+
+        async def succeed():
+            return 1
+
+        async def fail():
+            raise aiohttp.ClientResponseError(None, (), status=503)  # type: ignore
+
+        # Limit increases while requests succeed...
+        for _ in range(20):
+            await limiter.run(succeed)
+        assert limiter.limit > 6
+
+        # ...but not beyond the maximum.
+        for _ in range(100):
+            await limiter.run(succeed)
+        assert limiter.limit == 8
+
+        # Limit decreases on transient errors.
+        with pytest.raises(aiohttp.ClientResponseError):
+            await limiter.run(fail)
+        assert limiter.limit == 4
+
+        # Concurrent requests are limited.
+        in_flight = 0
+        max_in_flight = 0
+
+        async def slow_request():
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return 0
+
+        await asyncio.gather(*(limiter.run(slow_request) for _ in range(20)))
+        assert max_in_flight == 4
+
+        # Limit decreases when latency increases.
+        limiter = AdaptiveConcurrencyLimiter(4)
+
+        async def request(duration, work=1):
+            await asyncio.sleep(duration)
+            return work
+
+        await limiter.run(lambda: request(0.01))
+        limit = limiter.limit
+        # Latency is per unit of work.
+        await limiter.run(lambda: request(0.05, work=10))
+        assert limiter.limit > limit
+        await limiter.run(lambda: request(0.1))
+        assert limiter.limit < limit
+
+    asyncio.run(run())
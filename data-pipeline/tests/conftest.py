@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+
+import attr
+import pytest
+
+
+@pytest.fixture(scope="session")
+def hail():
+    if shutil.which("java") is None:
+        pytest.skip("Hail requires Java")
+
+    import hail as hl  # pylint: disable=import-outside-toplevel
+
+    hl.init(quiet=True)
+    yield hl
+    hl.stop()
+
+
+@pytest.fixture
+def output_tmp():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        yield temp_dir
+
+
+@attr.define
+class WritableFile:
+    """A task result that writes its text to the task's output path."""
+
+    text: str = "Hi"
+
+    def write(self, path, overwrite=False):
+        with open(path, "w") as f:
+            f.write(self.text)
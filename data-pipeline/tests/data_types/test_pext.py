@@ -0,0 +1,39 @@
+from data_pipeline.data_types.pext import collapse_bases_to_regions
+
+
+def base(chrom, pos, mean, **tissues):
+    return {"chrom": chrom, "pos": pos, "values": {"mean": mean, "tissues": {"liver": 0.0, "lung": 0.0, **tissues}}}
+
+
+def test_collapse_bases_to_regions(hail):
+    hl = hail
+
+    bases = [
+        base("1", 100, 0.5),
+        base("1", 101, 0.5),
+        base("1", 102, 0.5, liver=0.25),
+        base("1", 103, 0.5, liver=0.25),
+        # Gap
+        base("1", 110, 0.5, liver=0.25),
+        base("1", 111, 0.75, liver=0.25),
+        base("2", 112, 0.75, liver=0.25),
+    ]
+    dtype = hl.tarray(
+        hl.tstruct(
+            chrom=hl.tstr,
+            pos=hl.tint32,
+            values=hl.tstruct(mean=hl.tfloat64, tissues=hl.tstruct(liver=hl.tfloat64, lung=hl.tfloat64)),
+        )
+    )
+
+    regions = hl.eval(collapse_bases_to_regions(hl.literal(list(reversed(bases)), dtype)))
+
+    assert [(r.chrom, r.start, r.stop, r.mean, r.tissues.liver) for r in regions] == [
+        ("1", 100, 101, 0.5, 0.0),
+        ("1", 102, 103, 0.5, 0.25),
+        ("1", 110, 110, 0.5, 0.25),
+        ("1", 111, 111, 0.75, 0.25),
+        ("2", 112, 112, 0.75, 0.25),
+    ]
+
+    assert hl.eval(collapse_bases_to_regions(hl.empty_array(dtype.element_type))) == []
@@ -0,0 +1,57 @@
+import random
+
+from data_pipeline.data_types.region import merge_overlapping_regions
+
+
+def merge_overlapping_regions_reference(regions):
+    merged = []
+    for region in sorted(regions, key=lambda region: region["start"]):
+        if merged and region["start"] <= merged[-1]["stop"] + 1:
+            merged[-1] = {
+                **merged[-1],
+                "stop": max(merged[-1]["stop"], region["stop"]),
+                "xstop": max(merged[-1]["xstop"], region["xstop"]),
+            }
+        else:
+            merged.append(region)
+
+    return merged
+
+
+def random_regions(n, seed=0):
+    rng = random.Random(seed)
+    regions = []
+    for i in range(n):
+        start = rng.randint(1, 10_000)
+        stop = start + rng.randint(0, 200)
+        # Distinct start positions, so that the order of merged fields from the first region is well defined.
+        start, stop = 2 * n * start + i, 2 * n * stop + i
+        regions.append({"name": str(i), "start": start, "stop": stop, "xstart": 10**9 + start, "xstop": 10**9 + stop})
+
+    return regions
+
+
+def test_merge_overlapping_regions(hail):
+    hl = hail
+
+    regions = [
+        {"name": "a", "start": 10, "stop": 20, "xstart": 1_000_000_010, "xstop": 1_000_000_020},
+        {"name": "b", "start": 15, "stop": 18, "xstart": 1_000_000_015, "xstop": 1_000_000_018},
+        {"name": "c", "start": 21, "stop": 30, "xstart": 1_000_000_021, "xstop": 1_000_000_030},
+        {"name": "d", "start": 1, "stop": 5, "xstart": 1_000_000_001, "xstop": 1_000_000_005},
+        {"name": "e", "start": 40, "stop": 50, "xstart": 1_000_000_040, "xstop": 1_000_000_050},
+    ]
+    dtype = hl.tarray(hl.tstruct(name=hl.tstr, start=hl.tint32, stop=hl.tint32, xstart=hl.tint64, xstop=hl.tint64))
+
+    assert [dict(region) for region in hl.eval(merge_overlapping_regions(hl.literal(regions, dtype)))] == [
+        {"name": "d", "start": 1, "stop": 5, "xstart": 1_000_000_001, "xstop": 1_000_000_005},
+        {"name": "a", "start": 10, "stop": 30, "xstart": 1_000_000_010, "xstop": 1_000_000_030},
+        {"name": "e", "start": 40, "stop": 50, "xstart": 1_000_000_040, "xstop": 1_000_000_050},
+    ]
+
+    assert hl.eval(merge_overlapping_regions(hl.empty_array(dtype.element_type))) == []
+
+    for n_regions in [1, 2, 100, 2_000]:
+        regions = random_regions(n_regions, seed=n_regions)
+        merged = hl.eval(merge_overlapping_regions(hl.literal(regions, dtype)))
+        assert [dict(region) for region in merged] == merge_overlapping_regions_reference(regions)
@@ -0,0 +1,133 @@
+import random
+
+
+from data_pipeline.data_types.variant import (
+    compressed_variant_id,
+    decode_compressed_variant_ids,
+    encode_compressed_variant_ids,
+)
+
+
+VARIANTS = [
+    # (contig, position, ref, alt)
+    ("chr1", 12345, "A", "G"),
+    ("chr1", 12345, "AC", "GT"),
+    ("1", 100, "ACGT", "A"),
+    ("X", 5, "A", "ACGTA"),
+    ("chrMT", 7, "C", "CN"),
+    ("1", 9, "T", "TTTTGGG"),
+]
+
+EXPECTED_IDS = [
+    "1-12345-A-G",
+    "1-12345-AC-GT",
+    "1-100d3-A",
+    "X-5i4-Gw",
+    "M-7i1-null",
+    "1-9i6-_6g",
+]
+
+
+def test_encode_compressed_variant_ids():
+    assert encode_compressed_variant_ids(*zip(*VARIANTS)) == EXPECTED_IDS
+
+
+def test_encode_compressed_variant_ids_empty():
+    assert encode_compressed_variant_ids([], [], [], []) == []
+
+
+def test_decode_compressed_variant_ids():
+    assert decode_compressed_variant_ids(EXPECTED_IDS) == [
+        "1-12345-A-G",
+        "1-12345-AC-GT",
+        None,  # Deletions require the reference sequence
+        "X-5-A-ACGTA",
+        None,  # Alleles with bases other than A, C, G, or T cannot be decoded
+        "1-9-T-TTTTGGG",
+    ]
+
+
+def test_decode_deletions_with_reference_sequence():
+    reference = {"1": "N" * 99 + "ACGTACGT"}
+
+    def reference_sequence(contig, start, end):
+        return reference[contig][start - 1 : end]
+
+    assert decode_compressed_variant_ids(["1-100d3-A", "1-101d1-CT"], reference_sequence) == [
+        "1-100-ACGT-A",
+        "1-101-CGT-CT",
+    ]
+
+
+def test_decode_non_minimal_insertion():
+    # The reference allele of non-minimal insertions is not in the compressed ID. Some of these are
+    # detected by the length of the packed alt allele not matching the expected length.
+    [variant_id] = encode_compressed_variant_ids(["1"], [100], ["ACG"], ["ACGTA"])
+    assert decode_compressed_variant_ids([variant_id]) == [None]
+
+
+def random_variants(n, seed=0):
+    rng = random.Random(seed)
+
+    def random_allele(length):
+        return "".join(rng.choice("ACGT") for _ in range(length))
+
+    variants = []
+    for _ in range(n):
+        contig = rng.choice(["chr1", "chr2", "chr10", "chrX", "chrY", "chrM"])
+        position = rng.randint(1, 10_000)
+        variant_type = rng.choice(["snv", "mnv", "insertion", "deletion"])
+        if variant_type == "snv":
+            ref, alt = random_allele(1), random_allele(1)
+        elif variant_type == "mnv":
+            length = rng.randint(2, 5)
+            ref, alt = random_allele(length), random_allele(length)
+        elif variant_type == "insertion":
+            ref = random_allele(1)
+            alt = ref + random_allele(rng.randint(1, 30))
+        else:
+            alt = random_allele(1)
+            ref = alt + random_allele(rng.randint(1, 30))
+
+        variants.append((contig, position, ref, alt))
+
+    return variants
+
+
+def test_round_trip():
+    variants = random_variants(1_000)
+    reference_alleles = {(contig, position): ref for contig, position, ref, _ in variants}
+
+    def reference_sequence(contig, start, end):
+        contig = "chrM" if contig == "M" else f"chr{contig}"
+        return reference_alleles[(contig, start)]
+
+    ids = encode_compressed_variant_ids(*zip(*variants))
+    decoded = decode_compressed_variant_ids(ids, reference_sequence)
+
+    # Variants with the same position may have different reference alleles, so only check
+    # variants at positions with a single reference allele.
+    assert [
+        variant_id
+        for variant_id, (contig, position, ref, alt) in zip(decoded, variants)
+        if reference_alleles[(contig, position)] == ref
+    ] == [
+        f"{contig.replace('chr', '')}-{position}-{ref}-{alt}"
+        for contig, position, ref, alt in variants
+        if reference_alleles[(contig, position)] == ref
+    ]
+
+
+def test_encode_compressed_variant_ids_matches_hail(hail):
+    hl = hail
+    variants = [(f"chr{contig}" if not contig.startswith("chr") else contig, *rest) for contig, *rest in VARIANTS]
+    variants = [("chrM" if contig == "chrMT" else contig, *rest) for contig, *rest in variants]
+    variants.extend(random_variants(5_000))
+
+    hail_ids = hl.eval(
+        hl.literal(variants).map(
+            lambda v: compressed_variant_id(hl.locus(v[0], v[1], reference_genome="GRCh38"), hl.array([v[2], v[3]]))
+        )
+    )
+
+    assert encode_compressed_variant_ids(*zip(*variants)) == hail_ids
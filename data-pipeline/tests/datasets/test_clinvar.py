@@ -0,0 +1,263 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from data_pipeline import pipeline
+from data_pipeline.datasets.clinvar import (
+    CLINVAR_INCREMENTAL_STATE_DIRECTORY,
+    _parse_variant,
+    _write_incremental_state,
+    parse_clinvar_xml_to_tsv_shards,
+    read_clinvar_changes,
+    read_record_fingerprints,
+    record_indexed_clinvar_release,
+    split_variation_archive_records,
+    variation_archive_record_version,
+)
+
+
+def variation_archive(variation_id, trait_name, mapping_type="Name", mapping_value=None, classified=True, version=1):
+    if not classified:
+        return (
+            f'<VariationArchive VariationID="{variation_id}" Version="{version}"><IncludedRecord/></VariationArchive>'
+        )
+
+    mapping_value = trait_name if mapping_value is None else mapping_value
+    return f"""
+<VariationArchive VariationID="{variation_id}" VariationName="NM_000001.1:c.{variation_id}A&gt;G" \
+Accession="VCV{variation_id:09d}" Version="{version}">
+  <ClassifiedRecord>
+    <SimpleAllele AlleleID="{variation_id + 1000}">
+      <Location>
+        <SequenceLocation Assembly="GRCh38" Chr="1" positionVCF="{variation_id}" referenceAlleleVCF="A"
+          alternateAlleleVCF="G"/>
+      </Location>
+      <XRefList><XRef DB="dbSNP" ID="{variation_id + 2000}"/></XRefList>
+    </SimpleAllele>
+    <Classifications>
+      <GermlineClassification DateLastEvaluated="2023-01-01">
+        <ReviewStatus>criteria provided, single submitter</ReviewStatus>
+        <Description>Pathogenic</Description>
+      </GermlineClassification>
+    </Classifications>
+    <ClinicalAssertionList>
+      <ClinicalAssertion ID="{variation_id + 3000}">
+        <ClinVarAccession Accession="SCV{variation_id:09d}" SubmitterName="Lab &amp; Co"/>
+        <Classification DateLastEvaluated="2022-12-01">
+          <ReviewStatus>criteria provided, single submitter</ReviewStatus>
+          <GermlineClassification>Pathogenic</GermlineClassification>
+        </Classification>
+        <TraitSet>
+          <Trait Type="Disease">
+            <Name><ElementValue Type="Preferred">{trait_name}</ElementValue></Name>
+            <XRef DB="OMIM" ID="{variation_id + 4000}"/>
+          </Trait>
+        </TraitSet>
+      </ClinicalAssertion>
+    </ClinicalAssertionList>
+    <TraitMappingList>
+      <TraitMapping ClinicalAssertionID="{variation_id + 3000}" TraitType="Disease" MappingType="{mapping_type}"
+        MappingValue="{mapping_value}" MappingRef="Preferred">
+        <MedGen CUI="C{variation_id:07d}" Name="MedGen {variation_id}"/>
+      </TraitMapping>
+    </TraitMappingList>
+  </ClassifiedRecord>
+</VariationArchive>"""
+
+
+def clinvar_xml(records):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<ClinVarVariationRelease xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ReleaseDate="2024-01-07">'
+        + "".join(records)
+        + "\n</ClinVarVariationRelease>\n"
+    ).encode("utf8")
+
+
+RECORDS = [
+    variation_archive(1, "Some disease"),
+    # Names that cannot be used in an XPath predicate built with quoteattr.
+    variation_archive(2, "Parkinson&apos;s disease &quot;type 2&quot;"),
+    variation_archive(3, "Not classified", classified=False),
+    variation_archive(4, "Unmapped disease", mapping_value="Other disease"),
+    variation_archive(5, "Mapped by XRef", mapping_type="XRef", mapping_value="4005"),
+]
+
+
+def test_split_variation_archive_records():
+    xml = clinvar_xml(RECORDS)
+
+    # Read small blocks to split end tags across reads.
+    header, records = split_variation_archive_records(io.BytesIO(xml), read_size=7)
+    records = list(records)
+
+    assert header.rstrip().endswith(b'ReleaseDate="2024-01-07">')
+    assert len(records) == 5
+    assert all(
+        record.startswith(b"<VariationArchive ") and record.endswith(b"</VariationArchive>") for record in records
+    )
+    assert b"".join(records) == b"".join(record.strip().encode("utf8") for record in RECORDS)
+
+
+def test_variation_archive_record_version():
+    record = b'<VariationArchive VariationID="12" VariationName="c.1A>G" Version="3"><Other/></VariationArchive>'
+    variation_id, version, fingerprint = variation_archive_record_version(record)
+
+    assert (variation_id, version) == ("12", "3")
+    assert fingerprint != variation_archive_record_version(record.replace(b'Version="3"', b'Version="4"'))[2]
+
+
+def test_parse_clinvar_xml_to_tsv_shards(tmp_path):
+    xml_path = tmp_path / "clinvar.xml.gz"
+    with gzip.open(xml_path, "wb") as xml_file:
+        xml_file.write(clinvar_xml(RECORDS))
+
+    output_directory = tmp_path / "variants"
+    release_date = parse_clinvar_xml_to_tsv_shards(
+        str(xml_path), str(output_directory), _parse_variant, records_per_shard=2, processes=2
+    )
+
+    assert release_date == "2024-01-07"
+    assert sorted(path.name for path in output_directory.iterdir()) == [
+        "part-00000.tsv",
+        "part-00001.tsv",
+        "part-00002.tsv",
+        "records.tsv.gz",
+    ]
+
+    variants = {}
+    for shard_path in sorted(output_directory.glob("part-*.tsv")):
+        with open(shard_path) as shard_file:
+            for row in csv.DictReader(shard_file, delimiter="\t"):
+                assert row["locus_GRCh37"] == "NA"
+                variant = json.loads(row["variant"])
+                variants[variant["clinvar_variation_id"]] = (row["locus_GRCh38"], variant)
+
+    assert sorted(variants) == ["1", "2", "4", "5"]
+    assert variants["1"][0] == "chr1:1"
+    assert variants["1"][1]["rsid"] == "2001"
+    assert variants["1"][1]["submissions"][0]["submitter_name"] == "Lab & Co"
+
+    conditions = {
+        variation_id: variant["submissions"][0]["conditions"] for variation_id, (_, variant) in variants.items()
+    }
+    assert conditions == {
+        "1": [{"name": "MedGen 1", "medgen_id": "C0000001"}],
+        "2": [{"name": "MedGen 2", "medgen_id": "C0000002"}],
+        "4": [{"name": "Unmapped disease", "medgen_id": None}],
+        "5": [{"name": "MedGen 5", "medgen_id": "C0000005"}],
+    }
+
+
+def test_parse_clinvar_xml_to_tsv_shards_incrementally(tmp_path):
+    xml_path = tmp_path / "clinvar.xml"
+    xml_path.write_bytes(clinvar_xml(RECORDS))
+    parse_clinvar_xml_to_tsv_shards(str(xml_path), str(tmp_path / "previous"), _parse_variant, processes=1)
+    previous_record_fingerprints = read_record_fingerprints(str(tmp_path / "previous" / "records.tsv.gz"))
+
+    assert sorted(previous_record_fingerprints) == ["1", "2", "3", "4", "5"]
+
+    # Update record 2, remove record 4, and add record 6.
+    xml_path.write_bytes(
+        clinvar_xml(
+            [
+                RECORDS[0],
+                variation_archive(2, "Another disease", version=2),
+                RECORDS[2],
+                RECORDS[4],
+                variation_archive(6, "New disease"),
+            ]
+        )
+    )
+    output_directory = tmp_path / "current"
+    parse_clinvar_xml_to_tsv_shards(
+        str(xml_path),
+        str(output_directory),
+        _parse_variant,
+        processes=1,
+        previous_record_fingerprints=previous_record_fingerprints,
+    )
+
+    with gzip.open(output_directory / "records.tsv.gz", "rt") as records_file:
+        records = {row["variation_id"]: row for row in csv.DictReader(records_file, delimiter="\t")}
+    assert {variation_id: record["changed"] for variation_id, record in records.items()} == {
+        "1": "false",
+        "2": "true",
+        "3": "false",
+        "5": "false",
+        "6": "true",
+    }
+    assert records["2"]["version"] == "2"
+
+    with open(output_directory / "part-00000.tsv") as shard_file:
+        parsed_variation_ids = [
+            json.loads(row["variant"])["clinvar_variation_id"] for row in csv.DictReader(shard_file, delimiter="\t")
+        ]
+    assert parsed_variation_ids == ["2", "6"]
+
+
+def test_parse_clinvar_xml_to_tsv_shards_without_changes(tmp_path):
+    xml_path = tmp_path / "clinvar.xml"
+    xml_path.write_bytes(clinvar_xml(RECORDS))
+    parse_clinvar_xml_to_tsv_shards(str(xml_path), str(tmp_path / "previous"), _parse_variant, processes=1)
+
+    output_directory = tmp_path / "current"
+    parse_clinvar_xml_to_tsv_shards(
+        str(xml_path),
+        str(output_directory),
+        _parse_variant,
+        processes=1,
+        previous_record_fingerprints=read_record_fingerprints(str(tmp_path / "previous" / "records.tsv.gz")),
+    )
+
+    # A shard with only a header is written so that the shards can still be imported.
+    assert sorted(path.name for path in output_directory.iterdir()) == ["part-00000.tsv", "records.tsv.gz"]
+    with open(output_directory / "part-00000.tsv") as shard_file:
+        assert list(csv.DictReader(shard_file, delimiter="\t")) == []
+
+
+def test_read_record_fingerprints_from_decompressing_file_system(hail, tmp_path, monkeypatch):
+    from data_pipeline.pipeline import GoogleCloudStorageFileSystem  # pylint: disable=import-outside-toplevel
+
+    xml_path = tmp_path / "clinvar.xml"
+    xml_path.write_bytes(clinvar_xml(RECORDS))
+    parse_clinvar_xml_to_tsv_shards(str(xml_path), str(tmp_path / "variants"), _parse_variant, processes=1)
+    records_path = str(tmp_path / "variants" / "records.tsv.gz")
+    fingerprints = read_record_fingerprints(records_path)
+
+    # Files read through Hail's Hadoop file system, as on GCS, are decompressed based on their extension.
+    monkeypatch.setattr("data_pipeline.datasets.clinvar._file_system", lambda path: GoogleCloudStorageFileSystem())
+    assert read_record_fingerprints(records_path) == fingerprints
+
+
+def test_read_clinvar_changes_requires_index_with_previous_release(tmp_path, monkeypatch):
+    monkeypatch.setitem(pipeline._pipeline_config, "output_root", str(tmp_path))
+    state_root = str(tmp_path) + CLINVAR_INCREMENTAL_STATE_DIRECTORY
+    _write_incremental_state(
+        state_root,
+        {
+            "release_date": "2024-01-14",
+            "previous_release_date": "2024-01-07",
+            "records_path": str(tmp_path / "records.tsv.gz"),
+            "variants_path": str(tmp_path / "variants.ht"),
+            "removed_variation_ids": [],
+        },
+    )
+
+    with pytest.raises(RuntimeError, match="clinvar_grch38_variants contains release unknown"):
+        read_clinvar_changes("clinvar_grch38_variants")
+
+    # The index missed the 2024-01-07 release, so changes from 2024-01-07 to 2024-01-14 are not enough to update it.
+    record_indexed_clinvar_release("clinvar_grch38_variants", "2023-12-31")
+    with pytest.raises(RuntimeError, match="clinvar_grch38_variants contains release 2023-12-31"):
+        read_clinvar_changes("clinvar_grch38_variants")
+
+    record_indexed_clinvar_release("clinvar_grch37_variants", "2024-01-07")
+    with open(f"{state_root}/latest.json") as f:
+        assert json.load(f)["indexed_release_dates"] == {
+            "clinvar_grch37_variants": "2024-01-07",
+            "clinvar_grch38_variants": "2023-12-31",
+        }
@@ -0,0 +1,36 @@
+from hail import Struct
+
+from data_pipeline.pipelines.check_missingness import missingness_aggregation, missingness_counts
+
+
+def test_missingness_aggregation(hail):
+    hl = hail
+
+    dtype = hl.tstruct(
+        a=hl.tint32,
+        b=hl.tstruct(x=hl.tint32, y=hl.tstr),
+        c=hl.tarray(hl.tstruct(x=hl.tint32, z=hl.tarray(hl.tint32))),
+        d=hl.tarray(hl.tint32),
+    )
+    rows = [
+        {"a": 1, "b": {"x": 1, "y": "a"}, "c": [{"x": 1, "z": [1, None]}, {"x": None, "z": []}], "d": []},
+        {"a": None, "b": None, "c": [], "d": [1, None, 3]},
+        {"a": 3, "b": {"x": None, "y": "c"}, "c": None, "d": None},
+    ]
+    table = hl.Table.parallelize(rows, dtype)
+
+    counts = missingness_counts(table.aggregate(missingness_aggregation(table.row)))
+
+    # Empty and missing arrays do not hide missing values in other fields. Missing arrays are counted
+    # separately from missing array elements.
+    assert counts == {
+        "a": Struct(n_missing=1, n_present=2),
+        "b.x": Struct(n_missing=2, n_present=1),
+        "b.y": Struct(n_missing=1, n_present=2),
+        "c": Struct(n_missing=1, n_present=2),
+        "c[].x": Struct(n_missing=1, n_present=1),
+        "c[].z": Struct(n_missing=0, n_present=2),
+        "c[].z[]": Struct(n_missing=1, n_present=1),
+        "d": Struct(n_missing=1, n_present=2),
+        "d[]": Struct(n_missing=1, n_present=2),
+    }
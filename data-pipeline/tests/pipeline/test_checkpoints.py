@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from data_pipeline import pipeline
+from data_pipeline.config import PipelineConfig
+from data_pipeline.pipeline import Pipeline, TaskCheckpoints, checkpoint, checkpoints_root
+
+
+class FakeTable:
+    def __init__(self, value):
+        self.value = value
+        self.cached = False
+
+    def checkpoint(self, path, overwrite=False):
+        os.makedirs(path, exist_ok=overwrite)
+        with open(os.path.join(path, "value"), "w") as f:
+            f.write(self.value)
+        with open(os.path.join(path, "_SUCCESS"), "w"):
+            pass
+        return FakeTable(self.value)
+
+    def cache(self):
+        self.cached = True
+        return self
+
+    def write(self, path, overwrite=False):
+        with open(path, "w") as f:
+            f.write(self.value)
+
+
+class FakeReader:
+    def __init__(self):
+        self.reads = []
+
+    def __call__(self, path):
+        self.reads.append(os.path.basename(path))
+        with open(os.path.join(path, "value")) as f:
+            return FakeTable(f.read())
+
+
+class FlakyTaskFunction:
+    def __init__(self):
+        self.fail = True
+
+    def __call__(self, suffix):
+        a = checkpoint(FakeTable("a" + suffix), "a")
+        if self.fail:
+            self.fail = False
+            raise RuntimeError("Preempted")
+
+        b = checkpoint(FakeTable(a.value + "b"), "b")
+        return FakeTable(b.value + "c")
+
+
+@pytest.fixture
+def reader(monkeypatch):
+    reader = FakeReader()
+    monkeypatch.setattr(
+        pipeline, "TaskCheckpoints", lambda root, fingerprint: TaskCheckpoints(root, fingerprint, reader)
+    )
+    return reader
+
+
+def create_task(output_tmp, task_function, suffix="-"):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    return Pipeline(config=config).add_task("flaky", task_function, "output.txt", params={"suffix": suffix})
+
+
+def test_retried_task_reuses_checkpoints(tmp_path, reader):
+    task_function = FlakyTaskFunction()
+    task = create_task(str(tmp_path), task_function)
+
+    with pytest.raises(RuntimeError):
+        task.run()
+    assert os.path.exists(checkpoints_root(task.get_output_path()) + "/a.ht/_SUCCESS")
+
+    metrics = task.run()
+    assert metrics["checkpoints"] == {"a": "reused", "b": "written"}
+    assert reader.reads == ["a.ht"]
+    with open(task.get_output_path()) as f:
+        assert f.read() == "a-bc"
+
+    # Checkpoints are removed once the output is written.
+    assert not os.path.exists(checkpoints_root(task.get_output_path()))
+
+
+def test_checkpoints_not_reused_when_parameters_change(tmp_path, reader):
+    task_function = FlakyTaskFunction()
+    with pytest.raises(RuntimeError):
+        create_task(str(tmp_path), task_function).run()
+
+    task = create_task(str(tmp_path), task_function, suffix="+")
+    assert task.run()["checkpoints"] == {"a": "written", "b": "written"}
+    assert reader.reads == []
+    with open(task.get_output_path()) as f:
+        assert f.read() == "a+bc"
+
+
+def test_forced_task_removes_checkpoints(tmp_path, reader):
+    task_function = FlakyTaskFunction()
+    task = create_task(str(tmp_path), task_function)
+    with pytest.raises(RuntimeError):
+        task.run()
+
+    assert task.run(force=True)["checkpoints"] == {"a": "written", "b": "written"}
+    assert reader.reads == []
+
+
+def test_checkpoint_outside_task_caches_table():
+    table = FakeTable("a")
+    assert checkpoint(table, "a") is table
+    assert table.cached
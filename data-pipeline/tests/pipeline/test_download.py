@@ -0,0 +1,273 @@
+import gzip
+import hashlib
+import http.server
+import io
+import json
+import os
+import ftplib
+import re
+import threading
+import urllib.error
+
+import pytest
+
+from data_pipeline.helpers.download import (
+    DownloadError,
+    _download_stream_with_hadoop,
+    _GoogleCloudStorageChunkedDestination,
+    download_file,
+)
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Set by the server fixture
+    content = CONTENT
+    supports_ranges = True
+    requested_ranges = []
+    fail_ranges_starting_at = set()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send_headers(self, status, length, content_range=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", '"test-etag"')
+        if self.supports_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        if self.path == "/missing.txt":
+            self.send_error(404)
+            return
+
+        self._send_headers(200, len(self.content))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        range_header = self.headers.get("Range")
+        if not range_header or not self.supports_ranges:
+            self._send_headers(200, len(self.content))
+            self.wfile.write(self.content)
+            return
+
+        start, end = re.match(r"bytes=(\d+)-(\d*)", range_header).groups()
+        start = int(start)
+        end = int(end) + 1 if end else len(self.content)
+        self.requested_ranges.append((start, end))
+
+        if start in self.fail_ranges_starting_at:
+            self.fail_ranges_starting_at.discard(start)
+            self.close_connection = True
+            self._send_headers(206, end - start, f"bytes {start}-{end - 1}/{len(self.content)}")
+            self.wfile.write(self.content[start : start + 10])
+            return
+
+        self._send_headers(206, end - start, f"bytes {start}-{end - 1}/{len(self.content)}")
+        self.wfile.write(self.content[start:end])
+
+
+@pytest.fixture
+def server():
+    handler = type(
+        "TestRangeRequestHandler",
+        (RangeRequestHandler,),
+        {"requested_ranges": [], "fail_ranges_starting_at": set()},
+    )
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, handler, f"http://127.0.0.1:{httpd.server_address[1]}/file.txt"
+    httpd.shutdown()
+
+
+def test_download_in_chunks(server, output_tmp):
+    _, handler, url = server
+    output_path = os.path.join(output_tmp, "file.txt")
+
+    md5 = hashlib.md5(CONTENT).hexdigest()
+    fingerprint = download_file(url, output_path, expected_checksum=f"md5:{md5}", chunk_size=10_000, workers=4)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert fingerprint == f"size={len(CONTENT)},md5={md5}"
+    assert len(handler.requested_ranges) == 26
+    assert not os.path.exists(output_path + ".partial")
+
+
+def test_download_retries_failed_chunks(server, output_tmp, monkeypatch):
+    _, handler, url = server
+    monkeypatch.setattr("data_pipeline.helpers.download.time.sleep", lambda seconds: None)
+    handler.fail_ranges_starting_at.add(50_000)
+
+    output_path = os.path.join(output_tmp, "file.txt")
+    download_file(url, output_path, chunk_size=10_000, workers=4)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert handler.requested_ranges.count((50_000, 60_000)) == 2
+
+
+def test_download_resumes_from_completed_chunks(server, output_tmp):
+    _, handler, url = server
+    output_path = os.path.join(output_tmp, "file.txt")
+
+    # Simulate an earlier download that failed after completing the first 20 chunks.
+    with open(output_path + ".partial", "wb") as f:
+        f.write(CONTENT[:200_000])
+        f.truncate(len(CONTENT))
+    with open(output_path + ".partial.json", "w") as f:
+        download_id = f'{url}|{len(CONTENT)}|"test-etag"|10000'
+        json.dump({"download_id": download_id, "completed_chunks": list(range(20))}, f)
+
+    download_file(url, output_path, chunk_size=10_000, workers=4)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert sorted(handler.requested_ranges) == [
+        (start, min(start + 10_000, len(CONTENT))) for start in range(200_000, len(CONTENT), 10_000)
+    ]
+
+
+def test_download_without_range_support(server, output_tmp):
+    _, handler, url = server
+    handler.supports_ranges = False
+
+    output_path = os.path.join(output_tmp, "file.txt")
+    fingerprint = download_file(url, output_path, chunk_size=10_000)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert fingerprint == f"size={len(CONTENT)},md5={hashlib.md5(CONTENT).hexdigest()}"
+    assert handler.requested_ranges == []
+
+
+def test_download_checksum_mismatch(server, output_tmp):
+    _, _, url = server
+    output_path = os.path.join(output_tmp, "file.txt")
+
+    with pytest.raises(DownloadError, match="Expected md5"):
+        download_file(url, output_path, expected_checksum="md5:0123", chunk_size=10_000)
+
+    assert not os.path.exists(output_path)
+
+
+def test_download_size_mismatch(server, output_tmp):
+    _, _, url = server
+    output_path = os.path.join(output_tmp, "file.txt")
+
+    with pytest.raises(DownloadError, match="Expected .* to be 100 bytes"):
+        download_file(url, output_path, expected_size=100)
+
+
+def test_download_does_not_retry_client_errors(server, output_tmp, monkeypatch):
+    httpd, _, _ = server
+
+    def sleep(seconds):
+        raise AssertionError("Client errors should not be retried")
+
+    monkeypatch.setattr("data_pipeline.helpers.download.time.sleep", sleep)
+
+    with pytest.raises(urllib.error.HTTPError):
+        download_file(
+            f"http://127.0.0.1:{httpd.server_address[1]}/missing.txt", os.path.join(output_tmp, "missing.txt")
+        )
+
+
+def test_chunk_objects_are_only_written_once_complete(hail, output_tmp):
+    # The GCS destination only uses gsutil to remove parts from other downloads and to compose chunks,
+    # so chunks can be written to a local path through Hail's Hadoop file system.
+    output_path = os.path.join(output_tmp, "file.txt")
+
+    def failing_blocks():
+        yield CONTENT[:10]
+        raise ConnectionError("Connection reset")
+
+    destination = _GoogleCloudStorageChunkedDestination(output_path, "download-1")
+    with pytest.raises(ConnectionError):
+        destination.write_chunk(0, 0, failing_blocks())
+    destination.write_chunk(1, 100, iter([CONTENT[100:200]]))
+
+    assert _GoogleCloudStorageChunkedDestination(output_path, "download-1").completed_chunks() == {1}
+    with open(os.path.join(output_path + ".parts", "000001.chunk"), "rb") as f:
+        assert f.read() == CONTENT[100:200]
+
+
+def test_download_stream_with_hadoop_does_not_recompress(hail, server, output_tmp):
+    _, handler, url = server
+    handler.content = gzip.compress(CONTENT)
+
+    # hl.hadoop_open compresses output written to paths ending in ".gz".
+    output_path = os.path.join(output_tmp, "file.txt.gz")
+    md5 = _download_stream_with_hadoop(url, output_path)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == handler.content
+    assert md5 == hashlib.md5(handler.content).hexdigest()
+    assert not os.path.exists(output_path + ".partial")
+
+
+class FakeDataConnection(io.BytesIO):
+    def recv(self, size):
+        return self.read(size)
+
+
+class FakeFTP:
+    content = CONTENT
+    # Set by tests
+    retr_offsets = []
+    fail_after = None
+
+    def __init__(self, timeout=None):
+        self.incomplete = False
+
+    def connect(self, host, port):
+        pass
+
+    def login(self, user, passwd):
+        pass
+
+    def voidcmd(self, cmd):
+        pass
+
+    def size(self, path):
+        assert path == "/pub/file.txt.gz"
+        return len(self.content)
+
+    def transfercmd(self, cmd, rest=None):
+        assert cmd == "RETR /pub/file.txt.gz"
+        offset = rest or 0
+        self.retr_offsets.append(offset)
+        end = len(self.content)
+        if self.fail_after is not None:
+            end = min(end, offset + self.fail_after)
+            FakeFTP.fail_after = None
+            self.incomplete = True
+
+        return FakeDataConnection(self.content[offset:end])
+
+    def voidresp(self):
+        if self.incomplete:
+            raise ftplib.error_temp("426 Connection closed; transfer aborted.")
+
+    def close(self):
+        pass
+
+
+def test_ftp_download_resumes_with_rest(output_tmp, monkeypatch):
+    monkeypatch.setattr("data_pipeline.helpers.download.time.sleep", lambda seconds: None)
+    monkeypatch.setattr("data_pipeline.helpers.download.ftplib.FTP", FakeFTP)
+    monkeypatch.setattr(FakeFTP, "retr_offsets", [])
+    monkeypatch.setattr(FakeFTP, "fail_after", 100_000)
+
+    output_path = os.path.join(output_tmp, "file.txt.gz")
+    fingerprint = download_file("ftp://ftp.example.org/pub/file.txt.gz", output_path)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert fingerprint == f"size={len(CONTENT)},md5={hashlib.md5(CONTENT).hexdigest()}"
+    assert FakeFTP.retr_offsets == [0, 100_000]
@@ -0,0 +1,204 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import types
+
+import pytest
+
+from data_pipeline.helpers.elasticsearch_bulk_load import (
+    AdaptiveBatchSize,
+    BulkLoadCheckpoint,
+    BulkLoadError,
+    bulk_load_table,
+    export_bulk_documents,
+    list_partition_files,
+    load_partition_files,
+    table_content_fingerprint,
+)
+
+
+class FakeElasticsearch:
+    def __init__(self, reject_requests=0, reject_documents=None, fail_documents=None):
+        self.documents = {}
+        self.requests = []
+        self._reject_requests = reject_requests
+        self._reject_documents = set(reject_documents or [])
+        self._fail_documents = set(fail_documents or [])
+        self._lock = threading.Lock()
+
+    def bulk(self, index, body, ignore=None):
+        assert ignore == 429
+        lines = body.decode("utf8").splitlines()
+        actions = [(json.loads(lines[i])["index"]["_id"], json.loads(lines[i + 1])) for i in range(0, len(lines), 2)]
+
+        with self._lock:
+            self.requests.append([document_id for document_id, _ in actions])
+            if self._reject_requests:
+                self._reject_requests -= 1
+                return {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+
+            items = []
+            for document_id, document in actions:
+                if document_id in self._fail_documents:
+                    items.append({"index": {"_id": document_id, "status": 400, "error": {"type": "parse_exception"}}})
+                elif document_id in self._reject_documents:
+                    self._reject_documents.discard(document_id)
+                    items.append({"index": {"_id": document_id, "status": 429}})
+                else:
+                    self.documents[(index, document_id)] = document
+                    items.append({"index": {"_id": document_id, "status": 201}})
+
+            return {"errors": any(item["index"]["status"] >= 400 for item in items), "items": items}
+
+
+@pytest.fixture
+def staging_path():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        documents_path = os.path.join(temp_dir, "documents.tsv.bgz")
+        os.makedirs(documents_path)
+
+        for partition in range(3):
+            lines = [f'"doc-{partition}-{i}"\t{json.dumps({"value": i})}\n' for i in range(10)]
+            # Files may or may not be decompressed when opened, depending on the file system.
+            open_file = gzip.open if partition % 2 else open
+            with open_file(os.path.join(documents_path, f"part-{partition}.bgz"), "wt") as f:
+                f.writelines(lines)
+
+        with open(os.path.join(documents_path, "_SUCCESS"), "w") as f:
+            pass
+
+        yield temp_dir
+
+
+def no_sleep(seconds):
+    pass
+
+
+def test_load_partition_files(staging_path):
+    es_client = FakeElasticsearch()
+    checkpoint = BulkLoadCheckpoint(path=os.path.join(staging_path, "checkpoint.json"), index="test", fingerprint="")
+    partition_files = list_partition_files(os.path.join(staging_path, "documents.tsv.bgz"))
+    assert [os.path.basename(path) for path in partition_files] == ["part-0.bgz", "part-1.bgz", "part-2.bgz"]
+
+    load_partition_files(
+        es_client, "test", partition_files, checkpoint, batch_size=AdaptiveBatchSize(size=4, min_size=1), sleep=no_sleep
+    )
+
+    assert len(es_client.documents) == 30
+    assert es_client.documents[("test", "doc-1-3")] == {"value": 3}
+    assert max(len(request) for request in es_client.requests) > 4
+
+    saved_checkpoint = BulkLoadCheckpoint.read(checkpoint.path)
+    assert saved_checkpoint.completed_partitions == {"part-0.bgz", "part-1.bgz", "part-2.bgz"}
+
+
+def test_load_partition_files_resumes_from_checkpoint(staging_path):
+    es_client = FakeElasticsearch()
+    checkpoint = BulkLoadCheckpoint(
+        path=os.path.join(staging_path, "checkpoint.json"),
+        index="test",
+        fingerprint="",
+        exported=True,
+        completed_partitions={"part-0.bgz", "part-2.bgz"},
+    )
+
+    load_partition_files(
+        es_client,
+        "test",
+        list_partition_files(os.path.join(staging_path, "documents.tsv.bgz")),
+        checkpoint,
+        batch_size=AdaptiveBatchSize(size=100),
+        sleep=no_sleep,
+    )
+
+    assert sorted(es_client.documents) == [("test", f"doc-1-{i}") for i in range(10)]
+
+
+def test_load_partition_files_retries_rejected_documents(staging_path):
+    es_client = FakeElasticsearch(reject_requests=1, reject_documents=["doc-0-5"])
+    checkpoint = BulkLoadCheckpoint(path=os.path.join(staging_path, "checkpoint.json"), index="test", fingerprint="")
+    batch_size = AdaptiveBatchSize(size=1000, min_size=1)
+
+    load_partition_files(
+        es_client,
+        "test",
+        list_partition_files(os.path.join(staging_path, "documents.tsv.bgz")),
+        checkpoint,
+        batch_size=batch_size,
+        concurrency=1,
+        sleep=no_sleep,
+    )
+
+    assert len(es_client.documents) == 30
+    assert ["doc-0-5"] in es_client.requests
+    assert batch_size.size < 1000
+
+
+def test_load_partition_files_raises_on_failed_documents(staging_path):
+    es_client = FakeElasticsearch(fail_documents=["doc-2-0"])
+    checkpoint = BulkLoadCheckpoint(path=os.path.join(staging_path, "checkpoint.json"), index="test", fingerprint="")
+
+    with pytest.raises(BulkLoadError, match="parse_exception"):
+        load_partition_files(
+            es_client,
+            "test",
+            list_partition_files(os.path.join(staging_path, "documents.tsv.bgz")),
+            checkpoint,
+            batch_size=AdaptiveBatchSize(size=100),
+            concurrency=1,
+            sleep=no_sleep,
+        )
+
+    assert "part-2.bgz" not in BulkLoadCheckpoint.read(checkpoint.path).completed_partitions
+
+
+def test_adaptive_batch_size():
+    batch_size = AdaptiveBatchSize(size=1000, target_latency=2.0)
+
+    batch_size.record_response(1.0)
+    assert batch_size.size == 1100
+
+    batch_size.record_response(5.5)
+    assert batch_size.size == 400
+
+    batch_size.record_rejection()
+    assert batch_size.size == 200
+
+    for _ in range(10):
+        batch_size.record_rejection()
+    assert batch_size.size == batch_size.min_size
+
+
+def test_bulk_load_table_discards_checkpoint_for_rebuilt_table(hail, tmp_path):
+    hl = hail
+    table_path = str(tmp_path / "table.ht")
+    staging_path = str(tmp_path / "staging")
+
+    # Simulate a failed load of an earlier version of the table.
+    hl.utils.range_table(10).annotate(value=1).write(table_path)
+    table = hl.read_table(table_path)
+    fingerprint = table_content_fingerprint(table)
+    export_bulk_documents(table, os.path.join(staging_path, "documents.tsv.bgz"), id_field="idx")
+    BulkLoadCheckpoint(
+        path=os.path.join(staging_path, "checkpoint.json"), index="test-1", fingerprint=fingerprint, exported=True
+    ).save()
+
+    # Rebuild the table with the same schema.
+    hl.utils.range_table(10).annotate(value=2).write(table_path, overwrite=True)
+    table = hl.read_table(table_path)
+    assert table_content_fingerprint(table) != fingerprint
+
+    es_client = FakeElasticsearch()
+    es_client.indices = types.SimpleNamespace(exists=lambda index: True)
+    created_indices = []
+    index = bulk_load_table(
+        es_client, table, "test-2", staging_path, create_index=created_indices.append, id_field="idx"
+    )
+
+    assert index == "test-2"
+    assert created_indices == ["test-2"]
+    assert sorted(es_client.documents) == [("test-2", i) for i in range(10)]
+    assert {document["value"] for document in es_client.documents.values()} == {2}
+    assert not os.path.exists(staging_path)
@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from data_pipeline.helpers.elasticsearch_export import (  # noqa: E402
+    delete_documents,
+    force_merge_index,
+    update_index_alias,
+)
+
+
+class FakeIndicesClient:
+    def __init__(self):
+        self.calls = []
+        self.segment_count = 100
+
+    def refresh(self, index):
+        self.calls.append(("refresh", index))
+
+    def forcemerge(self, index, max_num_segments, params):
+        self.calls.append(("forcemerge", index, max_num_segments, params))
+        return {"task": "node:1"}
+
+    def stats(self, index, metric):
+        self.segment_count = max(self.segment_count // 10, 1)
+        return {"_all": {"primaries": {"segments": {"count": self.segment_count}}}}
+
+
+class FakeAliasIndicesClient:
+    def __init__(self, indices, aliases):
+        self.indices = set(indices)
+        self.aliases = aliases
+        self.requests = []
+
+    def exists(self, index):
+        return index in self.indices
+
+    def exists_alias(self, name):
+        return any(name in aliases for aliases in self.aliases.values())
+
+    def get_alias(self, name):
+        return {index: {"aliases": {name: {}}} for index, aliases in self.aliases.items() if name in aliases}
+
+    def update_aliases(self, body):
+        self.requests.append(body)
+        for action in body["actions"]:
+            for action_type, params in action.items():
+                aliases = self.aliases.setdefault(params["index"], set())
+                if action_type == "add":
+                    aliases.add(params["alias"])
+                else:
+                    aliases.discard(params["alias"])
+
+    def delete(self, index):
+        self.indices.discard(index)
+        self.aliases.pop(index, None)
+
+
+class FakeTasksClient:
+    def __init__(self, polls_until_complete, error=None):
+        self._polls_until_complete = polls_until_complete
+        self._error = error
+        self.polls = 0
+
+    def get(self, task_id):
+        assert task_id == "node:1"
+        self.polls += 1
+        task = {"completed": self.polls > self._polls_until_complete}
+        if task["completed"] and self._error:
+            task["error"] = self._error
+        return task
+
+
+class FakeElasticsearch:
+    def __init__(self, polls_until_complete=0, error=None):
+        self.indices = FakeIndicesClient()
+        self.tasks = FakeTasksClient(polls_until_complete, error=error)
+
+
+def test_force_merge_index_polls_task():
+    es_client = FakeElasticsearch(polls_until_complete=3)
+    sleeps = []
+
+    force_merge_index(es_client, "test", max_num_segments=5, poll_interval=10, sleep=sleeps.append)
+
+    assert es_client.indices.calls == [
+        ("refresh", "test"),
+        ("forcemerge", "test", 5, {"wait_for_completion": "false"}),
+    ]
+    assert sleeps == [10, 10, 10]
+
+
+def test_force_merge_index_raises_on_task_error():
+    es_client = FakeElasticsearch(error={"type": "illegal_state_exception"})
+
+    with pytest.raises(RuntimeError, match="illegal_state_exception"):
+        force_merge_index(es_client, "test", sleep=lambda seconds: None)
+
+
+def test_update_index_alias():
+    indices = FakeAliasIndicesClient(
+        indices=["genes-2024", "genes-2025", "genes-2026"],
+        aliases={"genes-2024": {"genes"}, "genes-2025": {"genes", "other"}},
+    )
+    es_client = FakeElasticsearch()
+    es_client.indices = indices
+
+    previous_indices = update_index_alias(es_client, "genes", "genes-2026", delete_previous_indices=True)
+
+    assert sorted(previous_indices) == ["genes-2024", "genes-2025"]
+    # The alias is moved in a single request.
+    assert len(indices.requests) == 1
+    assert indices.requests[0]["actions"][-1] == {"add": {"index": "genes-2026", "alias": "genes"}}
+    assert indices.aliases == {"genes-2026": {"genes"}}
+    assert indices.indices == {"genes-2026"}
+
+
+def test_update_index_alias_with_existing_index_name():
+    es_client = FakeElasticsearch()
+    es_client.indices = FakeAliasIndicesClient(indices=["genes", "genes-2026"], aliases={})
+
+    with pytest.raises(RuntimeError, match="an index with that name exists"):
+        update_index_alias(es_client, "genes", "genes-2026")
+
+
+class FakeBulkElasticsearch:
+    def __init__(self, document_ids):
+        self.document_ids = set(document_ids)
+        self.requests = []
+
+    def bulk(self, index, body):
+        self.requests.append(index)
+        items = []
+        for line in body.splitlines():
+            document_id = json.loads(line)["delete"]["_id"]
+            status = 200 if document_id in self.document_ids else 404
+            self.document_ids.discard(document_id)
+            items.append({"delete": {"_id": document_id, "status": status}})
+        return {"items": items}
+
+
+def test_delete_documents():
+    es_client = FakeBulkElasticsearch([str(i) for i in range(1500)])
+
+    n_deleted = delete_documents(es_client, "clinvar", [str(i) for i in range(1000, 2500)])
+
+    assert n_deleted == 500
+    assert es_client.requests == ["clinvar", "clinvar"]
+    assert es_client.document_ids == {str(i) for i in range(1000)}
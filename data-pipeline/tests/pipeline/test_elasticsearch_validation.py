@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from data_pipeline.helpers.elasticsearch_validation import IndexValidationResult, document_hash  # noqa: E402
+
+
+def test_document_hash_ignores_serialization_differences():
+    hail_document = {"variant_id": "1-55516888-G-GA", "af": 0.10000000149011612, "flags": [], "caid": None}
+    indexed_document = {"flags": [], "af": 0.1, "variant_id": "1-55516888-G-GA"}
+
+    assert document_hash(hail_document) == document_hash(indexed_document)
+    assert document_hash(hail_document) != document_hash({**indexed_document, "af": 0.2})
+
+
+def test_index_validation_result():
+    result = IndexValidationResult(
+        index="test", row_count=30, document_count=30, contig_counts={"1": (10, 10), "2": (20, 20)}
+    )
+    assert result.is_valid
+
+    result = IndexValidationResult(
+        index="test",
+        row_count=30,
+        document_count=25,
+        contig_counts={"1": (10, 10), "2": (20, 15)},
+        sampled_documents=10,
+        missing_documents=["2-123-A-C"],
+    )
+    assert not result.is_valid
+    assert result.mismatched_contigs == {"2": (20, 15)}
+    assert result.summary() == "\n".join(
+        [
+            "test: 25 documents, 30 rows",
+            "    contig 2: 15 documents, 20 rows",
+            "    10 sampled documents: 1 missing, 0 changed",
+            "        missing 2-123-A-C",
+        ]
+    )
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import pytest
+
+from data_pipeline.pipeline import CachedFileSystem, LocalFileSystem
+
+
+class CountingLocalFileSystem(LocalFileSystem):
+    def __init__(self):
+        self.calls = []
+
+    def stat(self, path):
+        self.calls.append(("stat", path))
+        return super().stat(path)
+
+    def ls(self, path):
+        self.calls.append(("ls", path))
+        return super().ls(path)
+
+
+@pytest.fixture
+def data_dir():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in ("a.txt", "b.txt", "c.txt"):
+            with open(os.path.join(temp_dir, name), "w") as f:
+                f.write(name)
+        yield temp_dir
+
+
+def test_cached_file_system_lists_each_directory_once(data_dir):
+    backend = CountingLocalFileSystem()
+    file_system = CachedFileSystem(lambda path: backend)
+
+    assert file_system.exists(os.path.join(data_dir, "a.txt"))
+    assert file_system.exists(os.path.join(data_dir, "b.txt"))
+    assert not file_system.exists(os.path.join(data_dir, "missing.txt"))
+    assert file_system.stat(os.path.join(data_dir, "c.txt"))["size_bytes"] == 5
+
+    assert backend.calls == [("ls", data_dir)]
+
+
+def test_cached_file_system_falls_back_to_stat_for_missing_directory(data_dir):
+    backend = CountingLocalFileSystem()
+    file_system = CachedFileSystem(lambda path: backend)
+
+    missing_path = os.path.join(data_dir, "missing", "a.txt")
+    assert not file_system.exists(missing_path)
+    assert backend.calls == [("ls", os.path.join(data_dir, "missing")), ("stat", missing_path)]
+
+
+def test_cached_file_system_invalidates_written_paths(data_dir):
+    backend = CountingLocalFileSystem()
+    file_system = CachedFileSystem(lambda path: backend)
+
+    new_path = os.path.join(data_dir, "d.txt")
+    assert not file_system.exists(new_path)
+
+    with file_system.open(new_path, "w") as f:
+        f.write("d")
+
+    assert file_system.exists(new_path)
+    assert file_system.read_text(new_path) == "d"
+    assert backend.calls == [("ls", data_dir), ("ls", data_dir)]
+
+
+def test_cached_file_system_memoizes_fingerprints(data_dir):
+    file_system = CachedFileSystem(lambda path: LocalFileSystem())
+
+    path = os.path.join(data_dir, "a.txt")
+    fingerprint = file_system.fingerprint(path)
+
+    with open(path, "w") as f:
+        f.write("changed")
+
+    assert file_system.fingerprint(path) == fingerprint
+
+    file_system.invalidate(path)
+    assert file_system.fingerprint(path) != fingerprint
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from data_pipeline.config import PipelineConfig
+from data_pipeline.pipeline import Pipeline, manifest_path, read_manifest
+
+from conftest import WritableFile
+
+
+@pytest.fixture
+def input_tmp():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with open(os.path.join(temp_dir, "sample.txt"), "w") as f:
+            f.write("dataset")
+        yield temp_dir
+
+
+def process_data(input_file_path, suffix="processed"):
+    with open(input_file_path, "r") as f:
+        return WritableFile(f"{f.read()} {suffix}")
+
+
+def create_pipeline(input_tmp, output_tmp, params=None):
+    config = PipelineConfig(name="test", input_root=input_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+    task = pipeline.add_task("process_data", process_data, "output.txt", {"input_file_path": "sample.txt"}, params)
+    return pipeline, task
+
+
+def test_task_writes_manifest(input_tmp, output_tmp):
+    pipeline, task = create_pipeline(input_tmp, output_tmp)
+    pipeline.run()
+
+    manifest = read_manifest(task.get_output_path())
+    assert manifest is not None
+    assert set(manifest["inputs"].keys()) == {"input_file_path"}
+    assert os.path.exists(manifest_path(task.get_output_path()))
+
+
+def test_task_skipped_when_input_touched_but_unchanged(input_tmp, output_tmp):
+    pipeline, task = create_pipeline(input_tmp, output_tmp)
+    pipeline.run()
+
+    later = time.time() + 60
+    os.utime(os.path.join(input_tmp, "sample.txt"), (later, later))
+
+    assert task.should_run() == (False, None)
+
+
+def test_task_runs_when_input_content_changes(input_tmp, output_tmp):
+    pipeline, task = create_pipeline(input_tmp, output_tmp)
+    pipeline.run()
+
+    with open(os.path.join(input_tmp, "sample.txt"), "w") as f:
+        f.write("updated dataset")
+
+    assert task.should_run() == (True, "Inputs changed: input_file_path")
+
+    pipeline.run()
+    with open(task.get_output_path()) as f:
+        assert f.read() == "updated dataset processed"
+
+
+def test_task_runs_when_params_change(input_tmp, output_tmp):
+    pipeline, _ = create_pipeline(input_tmp, output_tmp)
+    pipeline.run()
+
+    _, task = create_pipeline(input_tmp, output_tmp, params={"suffix": "annotated"})
+    assert task.should_run() == (True, "Parameters changed")
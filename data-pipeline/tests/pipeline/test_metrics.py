@@ -0,0 +1,46 @@
+import os
+
+
+from data_pipeline.config import PipelineConfig
+from data_pipeline.pipeline import METRICS_DIRECTORY, Pipeline, TaskMetricsWriter, read_task_metrics
+from data_pipeline.pipelines.pipeline_metrics import compare_task_metrics
+
+from conftest import WritableFile
+
+
+def test_pipeline_records_task_metrics(output_tmp):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+    pipeline.add_task("a", lambda: WritableFile("hello"), "a.txt")
+
+    metrics_root = os.path.join(output_tmp, METRICS_DIRECTORY)
+    pipeline.run(metrics_writer=TaskMetricsWriter(os.path.join(metrics_root, "run_1.jsonl"), pipeline="test"))
+    pipeline.run(metrics_writer=TaskMetricsWriter(os.path.join(metrics_root, "run_2.jsonl"), pipeline="test"))
+
+    # The task is skipped on the second run, so only one record is written.
+    records = read_task_metrics(metrics_root)
+    assert len(records) == 1
+    assert records[0]["pipeline"] == "test"
+    assert records[0]["task"] == "a"
+    assert records[0]["reason"] == "Output does not exist"
+    assert records[0]["output_size_bytes"] == 5
+
+
+def test_compare_task_metrics_flags_regressions():
+    records = [
+        {"task": "a", "started_at": "2024-01-01T00:00:00", "elapsed": 100, "rows": 10},
+        {"task": "b", "started_at": "2024-01-01T00:00:00", "elapsed": 100},
+        {"task": "a", "started_at": "2024-01-02T00:00:00", "elapsed": 250, "rows": 12},
+        {"task": "b", "started_at": "2024-01-02T00:00:00", "elapsed": 110},
+        {"task": "c", "started_at": "2024-01-02T00:00:00", "elapsed": 10},
+    ]
+
+    comparisons = {comparison["task"]: comparison for comparison in compare_task_metrics(records, threshold=1.5)}
+
+    assert comparisons["a"]["regression"]
+    assert comparisons["a"]["elapsed_ratio"] == 2.5
+    assert comparisons["a"]["previous"]["rows"] == 10
+    assert comparisons["a"]["latest"]["rows"] == 12
+    assert not comparisons["b"]["regression"]
+    assert comparisons["c"]["previous"] is None
+    assert not comparisons["c"]["regression"]
@@ -0,0 +1,148 @@
+import attr
+import pytest
+
+from data_pipeline.config import PipelineConfig
+from data_pipeline.pipeline import OutputPolicy, Pipeline, estimated_output_size, known_n_partitions
+
+from conftest import WritableFile
+
+MB = 1024 * 1024
+
+
+@attr.define
+class FakeTable:
+    partitions: int
+    method: str = "unchanged"
+    # Whether the partition count is known without computing the table.
+    known_partitions: bool = True
+
+    def n_partitions(self):
+        return self.partitions
+
+    def naive_coalesce(self, max_partitions):
+        return FakeTable(min(self.partitions, max_partitions), "naive_coalesce", self.known_partitions)
+
+    def repartition(self, n, shuffle=True):
+        return FakeTable(n, "repartition" if shuffle else "coalesce")
+
+
+@pytest.fixture
+def fake_tables(monkeypatch):
+    monkeypatch.setattr(
+        "data_pipeline.pipeline.known_n_partitions",
+        lambda table: table.n_partitions() if table.known_partitions else None,
+    )
+
+
+def test_output_policy_target_partitions():
+    policy = OutputPolicy(target_partition_bytes=100 * MB, max_partitions=50)
+
+    assert policy.target_partitions(0) == 1
+    assert policy.target_partitions(10 * MB) == 1
+    assert policy.target_partitions(250 * MB) == 3
+    assert policy.target_partitions(100_000 * MB) == 50
+
+
+def test_output_policy_coalesces_small_outputs(fake_tables):
+    table, policy = OutputPolicy(target_partition_bytes=100 * MB).apply(FakeTable(2000), 450 * MB)
+
+    assert table == FakeTable(5, "naive_coalesce")
+    assert policy == {
+        "target_partition_bytes": 100 * MB,
+        "estimated_size_bytes": 450 * MB,
+        "input_partitions": 2000,
+        "partitions": 5,
+        "method": "naive_coalesce",
+    }
+
+
+def test_output_policy_repartitions_large_outputs(fake_tables):
+    table, policy = OutputPolicy(target_partition_bytes=100 * MB).apply(FakeTable(32), 10_000 * MB)
+
+    assert table == FakeTable(100, "repartition")
+    assert policy["method"] == "repartition"
+
+
+def test_output_policy_keeps_partitioning_near_target(fake_tables):
+    policy = OutputPolicy(target_partition_bytes=100 * MB, tolerance=2.0)
+
+    for partitions in [50, 100, 200]:
+        table, applied_policy = policy.apply(FakeTable(partitions), 10_000 * MB)
+        assert table == FakeTable(partitions)
+        assert applied_policy["method"] == "unchanged"
+
+    # Without a size estimate, the task's partitioning is kept.
+    table, applied_policy = policy.apply(FakeTable(2000), None)
+    assert table == FakeTable(2000)
+    assert applied_policy == {"target_partition_bytes": 100 * MB, "estimated_size_bytes": None, "method": "unchanged"}
+
+
+def test_output_policy_uses_default_partitions_without_estimate(fake_tables):
+    policy = OutputPolicy(target_partition_bytes=100 * MB, default_partitions=32)
+
+    table, applied_policy = policy.apply(FakeTable(2000), None)
+    assert table == FakeTable(32, "repartition")
+    assert applied_policy["method"] == "default"
+    assert applied_policy["partitions"] == 32
+
+    # Once there is an estimate, the default is not used.
+    table, applied_policy = policy.apply(FakeTable(2000), 450 * MB)
+    assert table == FakeTable(5, "naive_coalesce")
+
+
+def test_output_policy_does_not_count_partitions_of_unknown_partitioning(fake_tables):
+    policy = OutputPolicy(target_partition_bytes=100 * MB)
+
+    table, applied_policy = policy.apply(FakeTable(2000, known_partitions=False), 450 * MB)
+    assert table == FakeTable(5, "naive_coalesce", known_partitions=False)
+    assert applied_policy["input_partitions"] is None
+    assert applied_policy["method"] == "naive_coalesce"
+
+    # Tables are not shuffled to increase a partition count that is not known.
+    table, _ = policy.apply(FakeTable(2, known_partitions=False), 10_000 * MB)
+    assert table == FakeTable(2, "naive_coalesce", known_partitions=False)
+
+
+def test_known_n_partitions(hail, tmp_path):
+    hl = hail
+
+    table = hl.utils.range_table(100, n_partitions=8)
+    table.write(str(tmp_path / "table.ht"))
+    table = hl.read_table(str(tmp_path / "table.ht"))
+
+    assert known_n_partitions(table) == 8
+    filtered = table.filter(table.idx % 2 == 0)
+    assert known_n_partitions(filtered.annotate(x=filtered.idx * 2)) == 8
+    assert known_n_partitions(table.key_by(x=table.idx % 10)) is None
+    assert known_n_partitions(table.group_by(x=table.idx % 10).aggregate(n=hl.agg.count())) is None
+
+
+def test_manifest_records_output_size(tmp_path):
+    config = PipelineConfig(name="test", input_root=str(tmp_path), output_root=str(tmp_path))
+    task = Pipeline(config=config).add_task("a", lambda: WritableFile("hello"), "a.txt")
+
+    assert estimated_output_size(task.get_output_path()) is None
+    task.run()
+    assert estimated_output_size(task.get_output_path()) == 5
+
+
+def test_task_applies_output_policy(hail, tmp_path):
+    hl = hail
+
+    config = PipelineConfig(name="test", input_root=str(tmp_path), output_root=str(tmp_path))
+    task = Pipeline(config=config).add_task(
+        "a",
+        lambda: hl.utils.range_table(1000, n_partitions=20),
+        "a.ht",
+        output_policy=OutputPolicy(target_partition_bytes=1024 * MB, default_partitions=4),
+    )
+
+    # The first run has no size estimate, so the table is written with the default partition count.
+    metrics = task.run()
+    assert metrics["output_policy"]["method"] == "default"
+    assert metrics["partitions"] == 4
+
+    metrics = task.run(force=True)
+    assert metrics["output_policy"]["method"] == "naive_coalesce"
+    assert metrics["partitions"] == 1
+    assert hl.read_table(task.get_output_path()).count() == 1000
@@ -0,0 +1,97 @@
+import json
+
+import hail as hl
+import pytest
+
+from data_pipeline.helpers.parquet_export import arrow_type_name, export_table_to_parquet
+from data_pipeline.helpers.parquet_reader import PARQUET_METADATA_FILE, open_parquet_table, read_parquet_table
+
+
+def test_arrow_type_name():
+    assert arrow_type_name(hl.tint32) == "int32"
+    assert arrow_type_name(hl.tfloat64) == "double"
+    assert arrow_type_name(hl.tarray(hl.tstr)) == "list<element: string>"
+    assert (
+        arrow_type_name(hl.tstruct(ac=hl.tint32, populations=hl.tarray(hl.tstruct(id=hl.tstr, af=hl.tfloat64))))
+        == "struct<ac: int32, populations: list<element: struct<id: string, af: double>>>"
+    )
+
+    with pytest.raises(ValueError):
+        arrow_type_name(hl.tset(hl.tstr))
+
+
+def test_read_parquet_table(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pc = pytest.importorskip("pyarrow.compute")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    # Lay out files the way Spark writes a table partitioned by chromosome.
+    for chrom, positions in [("1", [100, 200]), ("X", [300])]:
+        (tmp_path / f"chrom={chrom}").mkdir()
+        pq.write_table(
+            pa.table(
+                {
+                    "locus": [{"contig": chrom, "position": position} for position in positions],
+                    "mean": [float(position) / 100 for position in positions],
+                }
+            ),
+            tmp_path / f"chrom={chrom}" / "part-00000.parquet",
+        )
+    (tmp_path / PARQUET_METADATA_FILE).write_text(json.dumps({"partition_by": ["chrom"]}))
+
+    assert open_parquet_table(str(tmp_path)).schema.field("chrom").type == pa.string()
+
+    table = read_parquet_table(str(tmp_path), columns=["locus.position", "mean"], chroms=["1"])
+    assert table.column_names == ["locus.position", "mean"]
+    assert table.to_pylist() == [{"locus.position": 100, "mean": 1.0}, {"locus.position": 200, "mean": 2.0}]
+
+    table = read_parquet_table(str(tmp_path), columns=["chrom"], row_filter=pc.field("mean") > 1.5)
+    assert sorted(table.column("chrom").to_pylist()) == ["1", "X"]
+
+
+def test_export_table_to_parquet(hail, tmp_path):
+    pytest.importorskip("pyarrow")
+    hl = hail
+
+    table = hl.Table.parallelize(
+        [
+            {"locus": hl.Locus("1", 100), "filters": {"AC0"}, "freq": {"afr": 0.5}},
+            {"locus": hl.Locus("X", 200), "filters": set(), "freq": {}},
+        ],
+        hl.tstruct(locus=hl.tlocus(), filters=hl.tset(hl.tstr), freq=hl.tdict(hl.tstr, hl.tfloat64)),
+        key="locus",
+    )
+    table = table.annotate_globals(version="1.0")
+
+    metadata = export_table_to_parquet(table, str(tmp_path / "variants"), dataset="variants")
+    assert metadata["rows"] == 2
+    assert metadata["partition_by"] == ["chrom"]
+    assert metadata["globals"] == {"version": "1.0"}
+    assert metadata["arrow_schema"]["locus"] == "struct<contig: string, position: int32>"
+
+    dataset = open_parquet_table(str(tmp_path / "variants"))
+    for field, type_name in metadata["arrow_schema"].items():
+        assert str(dataset.schema.field(field).type) == type_name
+
+    rows = read_parquet_table(str(tmp_path / "variants"), columns=["locus.position", "filters"], chroms=["X"])
+    assert rows.to_pylist() == [{"locus.position": 200, "filters": []}]
+
+
+def test_export_empty_table_to_parquet(hail, tmp_path):
+    pytest.importorskip("pyarrow")
+    hl = hail
+
+    table = hl.Table.parallelize(
+        [{"locus": hl.Locus("1", 100), "ac": 1}], hl.tstruct(locus=hl.tlocus(), ac=hl.tint32), key="locus"
+    )
+    table = table.filter(False)
+
+    metadata = export_table_to_parquet(table, str(tmp_path / "variants"))
+    assert metadata["rows"] == 0
+
+    dataset = open_parquet_table(str(tmp_path / "variants"))
+    assert str(dataset.schema.field("ac").type) == metadata["arrow_schema"]["ac"]
+    assert dataset.schema.field("chrom").type == "string"
+
+    rows = read_parquet_table(str(tmp_path / "variants"), columns=["locus.position", "ac"], chroms=["1"])
+    assert rows.num_rows == 0
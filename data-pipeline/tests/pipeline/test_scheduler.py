@@ -0,0 +1,97 @@
+import os
+import threading
+
+import pytest
+
+from data_pipeline.config import PipelineConfig
+from data_pipeline.pipeline import Pipeline
+
+from conftest import WritableFile
+
+
+def test_pipeline_task_dependencies(output_tmp):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+
+    task_a = pipeline.add_task("a", lambda: WritableFile("a"), "a.txt")
+    task_b = pipeline.add_task("b", lambda: WritableFile("b"), "b.txt")
+    pipeline.add_task("c", lambda a, b: WritableFile("c"), "c.txt", {"a": task_a, "b": task_b})
+
+    assert pipeline.get_task_dependencies() == {"a": [], "b": [], "c": ["a", "b"]}
+
+
+def test_pipeline_runs_independent_tasks_concurrently(output_tmp):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+
+    # Each of the independent tasks waits for the other to start, so this only completes if they run concurrently.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def independent_task(text):
+        barrier.wait()
+        return WritableFile(text)
+
+    def dependent_task(a, b):
+        with open(a) as file_a, open(b) as file_b:
+            return WritableFile(file_a.read() + file_b.read())
+
+    task_a = pipeline.add_task("a", independent_task, "a.txt", params={"text": "a"})
+    task_b = pipeline.add_task("b", independent_task, "b.txt", params={"text": "b"})
+    pipeline.add_task("c", dependent_task, "c.txt", {"a": task_a, "b": task_b})
+
+    pipeline.run(workers=2)
+
+    with open(os.path.join(output_tmp, "c.txt")) as f:
+        assert f.read() == "ab"
+
+
+def test_pipeline_does_not_run_dependents_of_failed_task(output_tmp):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+
+    def failing_task():
+        raise RuntimeError("task failed")
+
+    task_a = pipeline.add_task("a", failing_task, "a.txt")
+    pipeline.add_task("b", lambda a: WritableFile("b"), "b.txt", {"a": task_a})
+
+    with pytest.raises(RuntimeError, match="task failed"):
+        pipeline.run(workers=2)
+
+    assert not os.path.exists(os.path.join(output_tmp, "b.txt"))
+
+
+def test_pipeline_plan(output_tmp):
+    config = PipelineConfig(name="test", input_root=output_tmp, output_root=output_tmp)
+    pipeline = Pipeline(config=config)
+
+    with open(os.path.join(output_tmp, "input.txt"), "w") as f:
+        f.write("input")
+
+    def copy_task(path):
+        with open(path) as f:
+            return WritableFile(f.read())
+
+    task_a = pipeline.add_task("a", copy_task, "a.txt", {"path": "input.txt"})
+    task_b = pipeline.add_task("b", copy_task, "b.txt", {"path": task_a})
+    pipeline.add_task("c", lambda: WritableFile("c"), "c.txt")
+    pipeline.add_task("d", copy_task, "d.txt", {"path": task_b})
+
+    plans = pipeline.plan()
+    assert [(plan.name, plan.will_run, plan.reason) for plan in plans] == [
+        ("a", True, "Output does not exist"),
+        ("b", True, "Upstream tasks will run: a"),
+        ("c", True, "Output does not exist"),
+        ("d", True, "Upstream tasks will run: b"),
+    ]
+    assert all(plan.estimated_duration is None for plan in plans)
+
+    pipeline.run()
+
+    plans = pipeline.plan()
+    assert not any(plan.will_run for plan in plans)
+    assert all(plan.estimated_duration is not None for plan in plans)
+
+    plans = pipeline.plan(force_tasks=["b"])
+    assert [plan.name for plan in plans if plan.will_run] == ["b", "d"]
+    assert [plan.name for plan in plans if plan.on_critical_path] == ["b", "d"]
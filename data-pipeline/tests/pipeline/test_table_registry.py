@@ -0,0 +1,77 @@
+from data_pipeline import pipeline
+from data_pipeline.pipeline import TableRegistry, read_table, table_registry
+
+
+class FakeTable:
+    def __init__(self, path, persisted=False):
+        self.path = path
+        self.persisted = persisted
+        self.unpersisted = False
+
+    def persist(self):
+        return FakeTable(self.path, persisted=True)
+
+    def unpersist(self):
+        self.unpersisted = True
+
+
+class CountingReader:
+    def __init__(self):
+        self.reads = []
+
+    def __call__(self, path):
+        self.reads.append(path)
+        return FakeTable(path)
+
+
+def test_table_registry_reads_each_path_once():
+    reader = CountingReader()
+    registry = TableRegistry(reader)
+
+    table = registry.read_table("/data/a.ht")
+    assert registry.read_table("/data/a.ht/") is table
+    assert registry.read_table("/data/b.ht") is not table
+
+    assert reader.reads == ["/data/a.ht", "/data/b.ht"]
+
+
+def test_table_registry_persists_tables():
+    reader = CountingReader()
+    registry = TableRegistry(reader)
+
+    table = registry.read_table("/data/a.ht")
+    persisted_table = registry.read_table("/data/a.ht", persist=True)
+    assert persisted_table.persisted
+
+    # Later reads of the path return the persisted table.
+    assert registry.read_table("/data/a.ht") is persisted_table
+    assert registry.read_table("/data/a.ht", persist=True) is persisted_table
+    assert not table.persisted
+
+    registry.close()
+    assert persisted_table.unpersisted
+
+
+def test_table_registry_invalidates_rewritten_tables():
+    reader = CountingReader()
+    registry = TableRegistry(reader)
+
+    table = registry.read_table("/data/a.ht", persist=True)
+    registry.read_table("/data/b.ht")
+
+    registry.invalidate("/data/a.ht")
+    assert table.unpersisted
+    assert registry.read_table("/data/a.ht") is not table
+    registry.read_table("/data/b.ht")
+
+    assert reader.reads == ["/data/a.ht", "/data/b.ht", "/data/a.ht"]
+
+
+def test_read_table_uses_run_registry(monkeypatch):
+    reader = CountingReader()
+    monkeypatch.setattr(pipeline, "TableRegistry", lambda: TableRegistry(reader))
+
+    with table_registry():
+        assert read_table("/data/a.ht") is read_table("/data/a.ht")
+
+    assert reader.reads == ["/data/a.ht"]
@@ -0,0 +1,107 @@
+from typing import Any, List, Optional, Union
+
+import attr
+import hail as hl
+
+from data_pipeline.datasets.gnomad_v4.gnomad_v4_validation import plan_type_checks, validate_rows
+
+
+@attr.define
+class Exome:
+    ac: int
+    non_ukb: str
+
+
+@attr.define
+class Genome:
+    ac: int
+    hgdp: str
+
+
+@attr.define
+class Frequency:
+    ac: int
+    af: Optional[float]
+
+
+@attr.define
+class Variant:
+    variant_id: str
+    freq: List[Frequency]
+    gnomad: Optional[Union[Exome, Genome]]
+    flags: set[str]
+    anything: Any
+    optional_anything: Optional[Any]
+    optional_field: Optional[str] = None
+
+
+def test_plan_type_checks():
+    dtype = hl.tstruct(
+        variant_id=hl.tstr,
+        freq=hl.tarray(hl.tstruct(ac=hl.tint32, af=hl.tfloat64)),
+        gnomad=hl.tstruct(ac=hl.tint32, hgdp=hl.tstr),
+        flags=hl.tset(hl.tstr),
+        anything=hl.tarray(hl.tint32),
+        optional_anything=hl.tstruct(a=hl.tint32),
+    )
+    scope, schema_errors = plan_type_checks(Variant, dtype)
+
+    assert schema_errors == {}
+    assert sorted(field for field in scope.required_values if "." not in field) == ["flags", "freq", "variant_id"]
+    assert sorted(scope.element_scopes) == ["flags", "freq"]
+    assert sorted(scope.element_scopes["freq"][1].required_values) == ["freq[]", "freq[].ac"]
+    # Fields of the union member matching the struct.
+    assert "gnomad.ac" in scope.required_values
+    assert "gnomad.hgdp" in scope.required_values
+
+    _, schema_errors = plan_type_checks(
+        Variant,
+        hl.tstruct(
+            variant_id=hl.tint32,
+            freq=hl.tarray(hl.tstruct(ac=hl.tint32, af=hl.tfloat64, extra=hl.tstr)),
+            gnomad=hl.tstruct(ac=hl.tint32),
+            anything=hl.tstr,
+            optional_anything=hl.tstr,
+        ),
+    )
+    assert schema_errors == {
+        "variant_id": "expected str, found int32",
+        "freq[].extra": "unexpected field",
+        "gnomad": "struct{ac: int32} does not match any of Exome, Genome",
+        "flags": "missing field",
+    }
+
+
+def test_validate_rows(hail):
+    hl = hail
+
+    dtype = hl.tstruct(
+        variant_id=hl.tstr,
+        freq=hl.tarray(hl.tstruct(ac=hl.tint32, af=hl.tfloat64)),
+        gnomad=hl.tstruct(ac=hl.tint32, non_ukb=hl.tstr),
+        flags=hl.tarray(hl.tstr),
+        anything=hl.tint32,
+        optional_anything=hl.tint32,
+        extra=hl.tstr,
+    )
+    rows = [
+        {"variant_id": "1", "freq": [{"ac": 1, "af": None}], "gnomad": None, "flags": []},
+        {"variant_id": None, "freq": [{"ac": None, "af": 0.5}, None], "gnomad": {"ac": None, "non_ukb": "a"}},
+        {"variant_id": "3", "freq": None, "gnomad": {"ac": 1, "non_ukb": None}, "flags": ["a", None]},
+    ]
+    rows = [{"flags": None, "anything": None, "optional_anything": None, "extra": "x", **row} for row in rows]
+    ht = hl.Table.parallelize(rows, dtype)
+    # Table.parallelize drops missing values from Python sets, so sets are converted from arrays.
+    ht = ht.annotate(flags=hl.set(ht.flags))
+
+    assert validate_rows(ht, Variant) == {
+        "extra": {"unexpected field": 3},
+        "variant_id": {"missing value": 1},
+        "freq": {"missing value": 1},
+        "freq[]": {"missing value": 1},
+        "freq[].ac": {"missing value": 1},
+        "gnomad.ac": {"missing value": 1},
+        "gnomad.non_ukb": {"missing value": 1},
+        "flags": {"missing value": 1},
+        "flags[]": {"missing value": 1},
+    }
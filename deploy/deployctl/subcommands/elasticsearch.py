@@ -21,7 +21,19 @@ def get_elasticsearch_password(cluster_name: str, namespace: str) -> None:
     )
 
 
-def load_datasets(cluster_name: str, namespace: str, dataproc_cluster: str, secret: str, datasets: str):
+def load_datasets(
+    cluster_name: str,
+    namespace: str,
+    dataproc_cluster: str,
+    secret: str,
+    datasets: str,
+    bulk_load: bool = False,
+    parallelism: int = 1,
+    num_replicas: typing.Optional[int] = None,
+    update_aliases: bool = False,
+    delete_previous_indices: bool = False,
+    upsert_changes: bool = False,
+):
     # Matches service name in deploy/manifests/elasticsearch.load-balancer.yaml.jinja2
     elasticsearch_load_balancer_ip = kubectl(
         [
@@ -33,6 +45,24 @@ def load_datasets(cluster_name: str, namespace: str, dataproc_cluster: str, secr
         ]
     )
 
+    pipeline_args = [
+        f"--host={elasticsearch_load_balancer_ip}",
+        f"--secret={secret}",
+        f"--datasets={datasets}",
+    ]
+    if bulk_load:
+        pipeline_args.append("--bulk-load")
+    if parallelism > 1:
+        pipeline_args.append(f"--parallelism={parallelism}")
+    if num_replicas is not None:
+        pipeline_args.append(f"--num-replicas={num_replicas}")
+    if update_aliases:
+        pipeline_args.append("--update-aliases")
+    if delete_previous_indices:
+        pipeline_args.append("--delete-previous-indices")
+    if upsert_changes:
+        pipeline_args.append("--upsert-changes")
+
     subprocess.check_call(
         [
             sys.argv[0],
@@ -41,9 +71,7 @@ def load_datasets(cluster_name: str, namespace: str, dataproc_cluster: str, secr
             "export_to_elasticsearch",
             f"--cluster={dataproc_cluster}",
             "--",
-            f"--host={elasticsearch_load_balancer_ip}",
-            f"--secret={secret}",
-            f"--datasets={datasets}",
+            *pipeline_args,
         ]
     )
 
@@ -63,6 +91,12 @@ def main(argv: typing.List[str]) -> None:
     load_parser.add_argument("--namespace", default="default")
     load_parser.add_argument("--dataproc-cluster", required=True)
     load_parser.add_argument("--secret", default="gnomad-elasticsearch-password")
+    load_parser.add_argument("--bulk-load", action="store_true")
+    load_parser.add_argument("--parallelism", type=int, default=1)
+    load_parser.add_argument("--num-replicas", type=int)
+    load_parser.add_argument("--update-aliases", action="store_true")
+    load_parser.add_argument("--delete-previous-indices", action="store_true")
+    load_parser.add_argument("--upsert-changes", action="store_true")
     load_parser.add_argument("datasets")
 
     args = parser.parse_args(argv)